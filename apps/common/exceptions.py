@@ -1,4 +1,4 @@
-from rest_framework.exceptions import NotAuthenticated, ValidationError
+from rest_framework.exceptions import NotAuthenticated, Throttled, ValidationError
 from rest_framework.response import Response
 from rest_framework.views import exception_handler as drf_exception_handler
 
@@ -16,6 +16,9 @@ def custom_exception_handler(exc, context):
         elif isinstance(exc, NotAuthenticated):
             message = "Authentication required"
             code = "AUTH_REQUIRED"
+        elif isinstance(exc, Throttled):
+            message = "Too many requests"
+            code = "THROTTLED"
 
         custom_payload = {
             "status": "error",
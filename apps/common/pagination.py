@@ -1,3 +1,10 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
 
 
@@ -5,3 +12,66 @@ class CustomPagination(PageNumberPagination):
     page_size = 10  # Default page size
     page_size_query_param = "page_size"
     max_page_size = 100
+
+
+class KeysetPagination:
+    """
+    Keyset (cursor) pagination on ``(created_at, id)``, newest first.
+
+    Each page is a range scan that starts after the last row of the previous
+    page, so the cost stays flat no matter how deep the client pages, unlike
+    offset pagination which has to skip every earlier row.
+    """
+
+    page_size = 10
+    page_size_query_param = "page_size"
+    max_page_size = 100
+    cursor_query_param = "cursor"
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate_queryset(self, queryset, request):
+        page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request.query_params.get(self.cursor_query_param))
+
+        queryset = queryset.order_by("-created_at", "-id")
+        if cursor is not None:
+            created_at, pk = cursor
+            queryset = queryset.filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+            )
+
+        rows = list(queryset[: page_size + 1])
+        self.has_next = len(rows) > page_size
+        self.page = rows[:page_size]
+        return self.page
+
+    def get_next_cursor(self):
+        if not self.has_next or not self.page:
+            return None
+        last = self.page[-1]
+        return self.encode_cursor(last.created_at, last.id)
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params.get(self.page_size_query_param, 0))
+        except (TypeError, ValueError):
+            page_size = 0
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def encode_cursor(self, created_at, pk):
+        payload = json.dumps([created_at.isoformat(), pk]).encode("utf-8")
+        return base64.urlsafe_b64encode(payload).decode("ascii")
+
+    def decode_cursor(self, encoded):
+        if not encoded:
+            return None
+        try:
+            created_at, pk = json.loads(
+                base64.urlsafe_b64decode(encoded.encode("ascii"))
+            )
+            created_at = datetime.fromisoformat(created_at)
+            return created_at, int(pk)
+        except (TypeError, ValueError, binascii.Error, UnicodeEncodeError):
+            raise NotFound(self.invalid_cursor_message)
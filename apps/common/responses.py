@@ -1,3 +1,4 @@
+from django.http import JsonResponse
 from rest_framework import status as drf_status
 from rest_framework.response import Response
 
@@ -24,3 +25,31 @@ def error_response(message="Error", error=None, status=drf_status.HTTP_400_BAD_R
         },
         status=status,
     )
+
+
+def success_json_response(data=None, message="Success", status=drf_status.HTTP_200_OK):
+    """``success_response`` for plain (e.g. async) Django views outside DRF."""
+    return JsonResponse(
+        {
+            "status": "success",
+            "message": message,
+            "data": data,
+            "error": None,
+        },
+        status=status,
+    )
+
+
+def error_json_response(
+    message="Error", error=None, status=drf_status.HTTP_400_BAD_REQUEST
+):
+    """``error_response`` for plain (e.g. async) Django views outside DRF."""
+    return JsonResponse(
+        {
+            "status": "error",
+            "message": message,
+            "data": None,
+            "error": error or {},
+        },
+        status=status,
+    )
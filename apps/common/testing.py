@@ -0,0 +1,8 @@
+import os
+import unittest
+
+# Benchmarks print timings and are too slow for every run; opt in with
+# RUN_BENCHMARKS=1.
+benchmark = unittest.skipUnless(
+    os.getenv("RUN_BENCHMARKS"), "set RUN_BENCHMARKS=1 to run benchmarks"
+)
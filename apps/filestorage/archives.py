@@ -0,0 +1,183 @@
+import logging
+import os
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Formats that are already compressed; deflating them again only costs CPU.
+STORED_EXTENSIONS = frozenset(
+    {
+        ".7z",
+        ".avi",
+        ".bz2",
+        ".docx",
+        ".gif",
+        ".gz",
+        ".heic",
+        ".jpeg",
+        ".jpg",
+        ".m4a",
+        ".mkv",
+        ".mov",
+        ".mp3",
+        ".mp4",
+        ".odt",
+        ".pdf",
+        ".png",
+        ".pptx",
+        ".rar",
+        ".tgz",
+        ".webm",
+        ".webp",
+        ".xlsx",
+        ".xz",
+        ".zip",
+    }
+)
+
+
+class _ZipOutput:
+    """
+    Write-only sink for ZipFile that buffers bytes until they are drained.
+
+    It can tell() but not seek(), so ZipFile writes data descriptors after
+    each entry instead of rewinding to patch local headers.
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, "FILESTORAGE_ZIP_WORKERS", 4),
+                    thread_name_prefix="zip-read-ahead",
+                )
+    return _executor
+
+
+def _entry_name(file_upload, used_names):
+    name = os.path.basename(file_upload.original_name or file_upload.file) or "file"
+    stem, extension = os.path.splitext(name)
+    counter = 1
+    while name in used_names:
+        counter += 1
+        name = f"{stem} ({counter}){extension}"
+    used_names.add(name)
+    return name
+
+
+def _zip_info(name, size, created_at):
+    date_time = timezone.localtime(created_at).timetuple()[:6]
+    info = zipfile.ZipInfo(name, date_time=max(date_time, (1980, 1, 1, 0, 0, 0)))
+    if os.path.splitext(name)[1].lower() in STORED_EXTENSIONS:
+        info.compress_type = zipfile.ZIP_STORED
+    else:
+        info.compress_type = zipfile.ZIP_DEFLATED
+    # A known size lets ZipFile decide on ZIP64 headers per entry.
+    info.file_size = size
+    return info
+
+
+def _close_when_opened(future):
+    def close(done):
+        if not done.cancelled() and done.exception() is None:
+            done.result()[0].close()
+
+    future.add_done_callback(close)
+
+
+def stream_zip(storage_service, files, chunk_size=None):
+    """
+    Yield a ZIP archive of ``files`` piece by piece.
+
+    Objects are read from ``storage_service`` in ``chunk_size`` blocks. While
+    one chunk is being compressed and sent, the next one is already being
+    read on a small shared thread pool, and the next object is opened, so
+    S3 latency overlaps with output. Memory use is a few chunks regardless
+    of archive size. Objects that cannot be opened are logged and skipped.
+
+    Args:
+        storage_service (StorageService): Backend implementing ``open()``.
+        files (list[Files]): Rows to include.
+        chunk_size (int, optional): Read size, ``FILESTORAGE_ZIP_CHUNK_SIZE``
+            by default.
+    """
+    chunk_size = chunk_size or getattr(
+        settings, "FILESTORAGE_ZIP_CHUNK_SIZE", 1024 * 1024
+    )
+    executor = _get_executor()
+    output = _ZipOutput()
+    used_names = set()
+
+    def submit_open(file_upload):
+        return executor.submit(
+            storage_service.open, storage_service.get_document_id(file_upload.file)
+        )
+
+    next_open = submit_open(files[0]) if files else None
+    try:
+        with zipfile.ZipFile(output, "w", allowZip64=True) as archive:
+            for index, file_upload in enumerate(files):
+                opening = next_open
+                next_open = (
+                    submit_open(files[index + 1]) if index + 1 < len(files) else None
+                )
+                try:
+                    stream, size = opening.result()
+                except Exception as e:
+                    logger.warning(f"Skipping {file_upload.file} in archive: {e}")
+                    continue
+
+                info = _zip_info(
+                    _entry_name(file_upload, used_names), size, file_upload.created_at
+                )
+                pending = executor.submit(stream.read, chunk_size)
+                try:
+                    with archive.open(info, "w") as entry:
+                        while True:
+                            chunk = pending.result()
+                            if not chunk:
+                                break
+                            pending = executor.submit(stream.read, chunk_size)
+                            entry.write(chunk)
+                            data = output.drain()
+                            if data:
+                                yield data
+                finally:
+                    wait([pending])
+                    stream.close()
+        yield output.drain()
+    finally:
+        if next_open is not None:
+            _close_when_opened(next_open)
@@ -0,0 +1,230 @@
+"""
+Async views for the presign, save-metadata (verify) and delete flows.
+
+DRF views are synchronous, so under ASGI every request would hop to a thread
+and hold it while S3 answers. These plain Django views run on the event loop
+instead: presigning is CPU-only, upload verification uses the non-blocking S3
+client and lookups use the async ORM. Responses use the same envelope as the
+DRF endpoints in ``views.py``.
+"""
+
+import functools
+import json
+import logging
+
+from asgiref.sync import sync_to_async
+from django.contrib.contenttypes.models import ContentType
+from django.http import HttpResponseNotAllowed
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+
+from apps.common.responses import error_json_response, success_json_response
+from apps.user.authentication import CachedJWTAuthentication
+
+from .serializers import FileSerializer
+from .services import (
+    adelete_file,
+    agenerate_presigned_url,
+    asave_batch_file_metadata,
+    asave_file_metadata,
+)
+
+logger = logging.getLogger(__name__)
+
+
+async def _authenticate(request):
+    """Resolve the JWT bearer user the way the DRF views do, or return None."""
+    authentication = CachedJWTAuthentication()
+    header = authentication.get_header(request)
+    raw_token = authentication.get_raw_token(header) if header else None
+    if raw_token is None:
+        return None
+
+    try:
+        token = authentication.get_validated_token(raw_token)
+        # Usually a cache hit; the database is only read on a miss.
+        return await sync_to_async(authentication.get_user)(token)
+    except (InvalidToken, AuthenticationFailed):
+        return None
+
+
+def _authenticated_json_view(view):
+    """
+    Require a POST with a JWT user and a JSON object body.
+
+    The view is called as ``view(request, user, data)``. Django 4.2's
+    ``csrf_exempt`` and ``require_POST`` return sync wrappers, which would
+    push the view back onto a thread, so both are done here.
+    """
+
+    @functools.wraps(view)
+    async def wrapper(request):
+        if request.method != "POST":
+            return HttpResponseNotAllowed(["POST"])
+        user = await _authenticate(request)
+        if user is None:
+            return error_json_response(
+                message="Authentication required",
+                error={
+                    "code": "AUTH_REQUIRED",
+                    "details": "Authentication credentials were not provided or are invalid.",
+                },
+                status=status.HTTP_401_UNAUTHORIZED,
+            )
+        try:
+            data = json.loads(request.body or b"{}")
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            return error_json_response(
+                message="Validation failed",
+                error={
+                    "code": "INVALID_REQUEST",
+                    "details": "Request body must be a JSON object",
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return await view(request, user, data)
+
+    # Token authentication, not cookies, so CSRF checks do not apply.
+    wrapper.csrf_exempt = True
+    return wrapper
+
+
+@_authenticated_json_view
+async def generate_presigned_url_view(request, user, data):
+    try:
+        presigned = await agenerate_presigned_url(
+            file_name=data.get("file_name"),
+            content_type=data.get("content_type", "application/octet-stream"),
+            folder_prefix=data.get("folder_prefix", "uploads"),
+            sha256=data.get("sha256"),
+            user=user,
+        )
+    except (ValueError, ValidationError) as e:
+        return error_json_response(
+            message="Validation failed",
+            error={"code": "PRESIGNED_URL_GENERATION_FAILED", "details": str(e)},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    except Exception as e:
+        logger.exception(f"Failed to generate presigned URL: {e}")
+        return error_json_response(
+            message="Failed to generate presigned URL",
+            error={"code": "PRESIGNED_URL_GENERATION_FAILED", "details": str(e)},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+        )
+    return success_json_response(
+        data=presigned,
+        message="Presigned URL generated successfully",
+        status=status.HTTP_201_CREATED,
+    )
+
+
+@_authenticated_json_view
+async def save_file_metadata_view(request, user, data):
+    try:
+        uploaded_file = await asave_file_metadata(
+            user=user,
+            file_url=data["file_url"],
+            original_name=data["original_name"],
+            content_type_str=data["content_type"],
+            object_id=data["object_id"],
+            document_type=data.get("document_type", ""),
+            sha256=data.get("sha256", ""),
+            file_size=data.get("file_size"),
+            mime_type=data.get("mime_type"),
+        )
+    except (KeyError, ValueError, ValidationError, ContentType.DoesNotExist) as e:
+        return error_json_response(
+            message="Validation failed",
+            error={"code": "FAILED_TO_SAVE_METADATA", "details": str(e)},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    except Exception as e:
+        logger.exception(f"Failed to save file metadata: {e}")
+        return error_json_response(
+            message="Failed to save file metadata",
+            error={"code": "FAILED_TO_SAVE_METADATA", "details": str(e)},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+        )
+    return success_json_response(
+        data=FileSerializer(uploaded_file).data,
+        message="File Meta stored successfully",
+        status=status.HTTP_201_CREATED,
+    )
+
+
+@_authenticated_json_view
+async def save_batch_file_metadata_view(request, user, data):
+    records = data.get("files", [])
+    if not records or not isinstance(records, list):
+        return error_json_response(
+            message="File data not found in the request",
+            error={
+                "code": "DATA_NOT_AVAILABLE",
+                "details": "File details are not available in the request",
+            },
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    try:
+        results = await asave_batch_file_metadata(user, records)
+    except ValidationError as e:
+        return error_json_response(
+            message="Validation failed",
+            error={"code": "FAILED_TO_SAVE_METADATA", "details": str(e)},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    except Exception as e:
+        logger.exception(f"Failed to save batch file metadata: {e}")
+        return error_json_response(
+            message="Failed to save file metadata",
+            error={"code": "FAILED_TO_SAVE_METADATA", "details": str(e)},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+        )
+
+    for result in results:
+        if "file" in result:
+            result["file"] = FileSerializer(result["file"]).data
+
+    return success_json_response(
+        data={
+            "created": sum(1 for result in results if "file" in result),
+            "failed": sum(1 for result in results if "errors" in result),
+            "results": results,
+        },
+        message="File Meta stored successfully",
+        status=status.HTTP_201_CREATED,
+    )
+
+
+@_authenticated_json_view
+async def delete_file_view(request, user, data):
+    key = data.get("key")
+    if not key:
+        return error_json_response(
+            message="File key is required",
+            error={
+                "code": "INVALID_REQUEST",
+                "details": "The 'key' field is missing in the request data",
+            },
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    try:
+        await adelete_file(key, user=user)
+    except ValidationError as e:
+        return error_json_response(
+            message="Validation failed",
+            error={"code": "DELETE_FILE_FAILED", "details": str(e)},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    except Exception as e:
+        logger.exception(f"Failed to delete file: {e}")
+        return error_json_response(
+            message="Failed to delete file",
+            error={"code": "DELETE_FILE_FAILED", "details": str(e)},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+        )
+    return success_json_response(data={}, message="File deleted successfully")
@@ -0,0 +1,170 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+class InMemoryPresignCache:
+    """Per-process LRU cache whose entries also expire after a TTL."""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout):
+        with self._lock:
+            self._entries[key] = (value, time.time() + timeout)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class DjangoPresignCache:
+    """Shares presigned URLs across workers through a Django cache alias."""
+
+    def __init__(self, alias="default", key_prefix="presigned-get"):
+        self.alias = alias
+        self.key_prefix = key_prefix
+
+    def get(self, key):
+        return caches[self.alias].get(self._make_key(key))
+
+    def set(self, key, value, timeout):
+        caches[self.alias].set(self._make_key(key), value, timeout)
+
+    def delete(self, key):
+        caches[self.alias].delete(self._make_key(key))
+
+    def clear(self):
+        # Entries age out on their own; never clear a shared cache alias.
+        pass
+
+    def _make_key(self, key):
+        # Hashed so any storage key fits memcached's key rules.
+        return f"{self.key_prefix}:{hashlib.sha256(key.encode()).hexdigest()}"
+
+
+class PresignedUrlCache:
+    """
+    Caches presigned GET URLs keyed on (document_id, content_type, expiry).
+
+    A cached URL is returned only while at least ``min_remaining`` seconds of
+    its lifetime are left, so callers always get a URL that stays usable for
+    a while after it is handed out. The URLs of one document share a backend
+    entry, so ``invalidate`` drops them all at once.
+    """
+
+    def __init__(self, backend, min_remaining=300):
+        self.backend = backend
+        self.min_remaining = min_remaining
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+
+    def get_or_sign(self, document_id, content_type, expires_in, sign):
+        variant = (content_type, expires_in)
+        # Reuse window: the part of the URL's lifetime before min_remaining.
+        reuse_for = expires_in - min(self.min_remaining, expires_in // 2)
+
+        now = time.time()
+        entries = self.backend.get(document_id) or {}
+        cached = entries.get(variant)
+        if cached is not None and cached[1] > now:
+            with self._stats_lock:
+                self.hits += 1
+            return cached[0]
+
+        with self._stats_lock:
+            self.misses += 1
+        result = sign()
+        if reuse_for > 0:
+            entries = {key: entry for key, entry in entries.items() if entry[1] > now}
+            entries[variant] = (result, now + reuse_for)
+            timeout = max(expires_at for _, expires_at in entries.values()) - now
+            self.backend.set(document_id, entries, timeout)
+        return result
+
+    def invalidate(self, document_ids):
+        """
+        Drop the cached URLs of deleted objects.
+
+        With the in-memory backend only this process's entries are dropped;
+        other workers keep theirs until their reuse window ends.
+        """
+        for document_id in document_ids:
+            self.backend.delete(document_id)
+
+    def stats(self):
+        with self._stats_lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+    def clear(self):
+        self.backend.clear()
+        with self._stats_lock:
+            self.hits = 0
+            self.misses = 0
+
+
+def _build_presign_cache():
+    config = getattr(settings, "FILESTORAGE_PRESIGN_CACHE", {})
+    if config.get("BACKEND", "memory") == "django":
+        backend = DjangoPresignCache(alias=config.get("ALIAS", "default"))
+    else:
+        backend = InMemoryPresignCache(max_entries=config.get("MAX_ENTRIES", 1024))
+    return PresignedUrlCache(backend, min_remaining=config.get("MIN_REMAINING", 300))
+
+
+_presign_cache = None
+_presign_cache_lock = threading.Lock()
+
+
+def get_presign_cache():
+    global _presign_cache
+    if _presign_cache is None:
+        with _presign_cache_lock:
+            if _presign_cache is None:
+                _presign_cache = _build_presign_cache()
+    return _presign_cache
+
+
+_missing_object_cache = None
+
+
+def get_missing_object_cache():
+    """
+    Per-process negative cache of storage keys recently found missing.
+
+    Entries live for ``FILESTORAGE_VERIFY_MISSING_TTL`` seconds, so clients
+    retrying metadata for an object that is not there yet do not trigger a
+    storage request each time.
+    """
+    global _missing_object_cache
+    if _missing_object_cache is None:
+        with _presign_cache_lock:
+            if _missing_object_cache is None:
+                _missing_object_cache = InMemoryPresignCache(max_entries=10000)
+    return _missing_object_cache
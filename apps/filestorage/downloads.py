@@ -0,0 +1,144 @@
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags, quote_etag
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class _BoundedFile:
+    """
+    Read-only view of ``length`` bytes of an open file, from its current offset.
+
+    ``fileno()`` is kept so gunicorn's ``wsgi.file_wrapper`` can still use
+    ``os.sendfile``; it sends at most Content-Length bytes from the current
+    offset, which is exactly the requested range.
+    """
+
+    def __init__(self, file_obj, length):
+        self._file = file_obj
+        self._remaining = length
+
+    def read(self, size=-1):
+        if self._remaining <= 0:
+            return b""
+        if size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._file.read(size)
+        self._remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self._file.fileno()
+
+    def close(self):
+        self._file.close()
+
+
+def _etag_for(stat):
+    return quote_etag(f"{stat.st_size:x}-{stat.st_mtime_ns:x}")
+
+
+class _RangeNotSatisfiable(Exception):
+    pass
+
+
+def _parse_range(header, size):
+    """
+    Return (start, end) for a single byte range, or None to ignore the header.
+
+    Malformed headers and multiple ranges (not supported) are ignored, so the
+    whole file is sent. A valid range with no bytes in the file raises
+    _RangeNotSatisfiable.
+    """
+    match = _RANGE_RE.match(header.strip())
+    if not match or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if first == "":
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        if last and int(last) < start:
+            return None
+        end = min(int(last), size - 1) if last else size - 1
+    if start > end:
+        raise _RangeNotSatisfiable
+    return start, end
+
+
+def _content_disposition(filename):
+    return f"inline; filename*=UTF-8''{quote(filename)}"
+
+
+def build_file_response(request, path, internal_path, filename, content_type=None):
+    """
+    Respond with a local file without copying its bytes through Python.
+
+    With ``FILESTORAGE_SENDFILE_BACKEND`` set to "nginx" or "apache" the
+    transfer is delegated to the proxy via X-Accel-Redirect / X-Sendfile
+    (``internal_path`` is the key below ``FILESTORAGE_SENDFILE_URL_PREFIX``).
+    Otherwise a FileResponse is returned, which gunicorn serves with
+    ``os.sendfile``, with support for ETag/If-None-Match and single byte
+    ranges.
+    """
+    content_type = (
+        content_type or mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    )
+    backend = getattr(settings, "FILESTORAGE_SENDFILE_BACKEND", "")
+
+    if backend == "nginx":
+        prefix = getattr(
+            settings, "FILESTORAGE_SENDFILE_URL_PREFIX", "/protected/uploads/"
+        )
+        response = HttpResponse(content_type=content_type)
+        response["X-Accel-Redirect"] = f"{prefix}{quote(internal_path)}"
+        response["Content-Disposition"] = _content_disposition(filename)
+        return response
+    if backend == "apache":
+        response = HttpResponse(content_type=content_type)
+        response["X-Sendfile"] = path
+        response["Content-Disposition"] = _content_disposition(filename)
+        return response
+
+    stat = os.stat(path)
+    etag = _etag_for(stat)
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match and (etag in parse_etags(if_none_match) or if_none_match == "*"):
+        response = HttpResponseNotModified()
+        response["ETag"] = etag
+        return response
+
+    byte_range = None
+    range_header = request.headers.get("Range")
+    if_range = request.headers.get("If-Range")
+    if range_header and (not if_range or if_range == etag):
+        try:
+            byte_range = _parse_range(range_header, stat.st_size)
+        except _RangeNotSatisfiable:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{stat.st_size}"
+            return response
+
+    file_obj = open(path, "rb")
+    if byte_range is None:
+        response = FileResponse(file_obj, content_type=content_type)
+        response["Content-Length"] = stat.st_size
+    else:
+        start, end = byte_range
+        file_obj.seek(start)
+        response = FileResponse(
+            _BoundedFile(file_obj, end - start + 1), content_type=content_type
+        )
+        response.status_code = 206
+        response["Content-Length"] = end - start + 1
+        response["Content-Range"] = f"bytes {start}-{end}/{stat.st_size}"
+
+    response["Accept-Ranges"] = "bytes"
+    response["ETag"] = etag
+    response["Content-Disposition"] = _content_disposition(filename)
+    return response
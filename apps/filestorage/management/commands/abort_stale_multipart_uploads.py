@@ -0,0 +1,25 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from apps.filestorage.services import abort_stale_multipart_uploads
+
+
+class Command(BaseCommand):
+    help = "Abort multipart uploads that were started but never completed."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--older-than-hours",
+            type=float,
+            default=24,
+            help="Abort uploads initiated more than this many hours ago.",
+        )
+
+    def handle(self, *args, **options):
+        older_than = timezone.now() - timedelta(hours=options["older_than_hours"])
+        aborted = abort_stale_multipart_uploads(older_than)
+        self.stdout.write(
+            self.style.SUCCESS(f"Aborted {aborted} stale multipart uploads")
+        )
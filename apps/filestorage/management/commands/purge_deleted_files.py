@@ -0,0 +1,66 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from apps.filestorage.services import purge_deleted_files
+
+
+class Command(BaseCommand):
+    help = "Hard-delete soft-deleted files and their storage objects in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--grace-seconds",
+            type=int,
+            default=0,
+            help="Only purge files deleted at least this many seconds ago.",
+        )
+        parser.add_argument("--max-retries", type=int, default=3)
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep running as a worker, polling for new deletions.",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=30,
+            help="Seconds to wait between polls when the queue is empty (--loop).",
+        )
+
+    def handle(self, *args, **options):
+        totals = {"selected": 0, "purged": 0, "failed": 0, "seconds": 0.0}
+
+        while True:
+            older_than = timezone.now() - timedelta(seconds=options["grace_seconds"])
+            stats = purge_deleted_files(
+                batch_size=options["batch_size"],
+                older_than=older_than,
+                max_retries=options["max_retries"],
+            )
+            for key in totals:
+                totals[key] += stats[key]
+
+            if stats["selected"]:
+                rate = stats["purged"] / stats["seconds"] if stats["seconds"] else 0
+                self.stdout.write(
+                    f"Purged {stats['purged']}/{stats['selected']} files "
+                    f"in {stats['seconds']:.2f}s ({rate:.0f} files/s)"
+                )
+
+            # A partly failed batch is retried on the next poll, not immediately.
+            if stats["selected"] == options["batch_size"] and not stats["failed"]:
+                continue
+            if not options["loop"]:
+                break
+            time.sleep(options["sleep"])
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Done: purged {totals['purged']} files, {totals['failed']} failed, "
+                f"{totals['seconds']:.2f}s"
+            )
+        )
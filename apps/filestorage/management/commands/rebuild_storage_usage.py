@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from apps.filestorage.services import rebuild_storage_usage
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute per-user and per-object storage usage from live Files rows, "
+        "e.g. after a bulk import or to repair drift."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help="Ledger rows recomputed per transaction.",
+        )
+
+    def handle(self, *args, **options):
+        stats = rebuild_storage_usage(chunk_size=options["chunk_size"])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Done: {stats['users']} user rows, {stats['objects']} object rows "
+                f"in {stats['seconds']:.2f}s"
+            )
+        )
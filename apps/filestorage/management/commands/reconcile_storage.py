@@ -0,0 +1,107 @@
+import json
+import os
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from apps.filestorage.services import (
+    delete_orphaned_objects,
+    reconcile_storage,
+    soft_delete_dangling_files,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Report storage objects without a Files row (orphans) and live Files "
+        "rows without an object (dangling), optionally fixing them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--prefix", default="", help="Only check keys under this prefix."
+        )
+        parser.add_argument(
+            "--grace-hours",
+            type=float,
+            default=24,
+            help="Ignore objects and rows newer than this, e.g. uploads in progress.",
+        )
+        parser.add_argument(
+            "--fix-orphans",
+            action="store_true",
+            help="Delete orphaned objects.",
+        )
+        parser.add_argument(
+            "--fix-dangling",
+            action="store_true",
+            help="Soft-delete dangling rows.",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--checkpoint",
+            help="JSON file to resume from and to record progress in.",
+        )
+        parser.add_argument("--chunk-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        state = {"start_after": "", "orphans": 0, "dangling": 0, "fixed": 0}
+        checkpoint = options["checkpoint"]
+        if checkpoint and os.path.exists(checkpoint):
+            with open(checkpoint) as fh:
+                state.update(json.load(fh))
+            self.stdout.write(f"Resuming after {state['start_after']!r}")
+
+        orphans = []
+        dangling = []
+
+        def flush():
+            if orphans and options["fix_orphans"]:
+                state["fixed"] += delete_orphaned_objects(orphans)
+            if dangling and options["fix_dangling"]:
+                state["fixed"] += soft_delete_dangling_files(dangling)
+            orphans.clear()
+            dangling.clear()
+
+        events = reconcile_storage(
+            prefix=options["prefix"],
+            start_after=state["start_after"],
+            grace=timedelta(hours=options["grace_hours"]),
+            chunk_size=options["chunk_size"],
+        )
+        for event in events:
+            if event[0] == "orphan":
+                state["orphans"] += 1
+                self.stdout.write(f"orphan\t{event[1]}")
+                orphans.append(event[1])
+            elif event[0] == "dangling":
+                state["dangling"] += 1
+                self.stdout.write(f"dangling\t{event[1]}\t{event[2]}")
+                dangling.append(event[2])
+            elif checkpoint:
+                flush()
+                state["start_after"] = event[1]
+                self._save_checkpoint(checkpoint, state)
+
+            if (
+                len(orphans) >= options["batch_size"]
+                or len(dangling) >= options["batch_size"]
+            ):
+                flush()
+
+        flush()
+        if checkpoint and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Done: {state['orphans']} orphaned objects, {state['dangling']} "
+                f"dangling rows, {state['fixed']} fixed"
+            )
+        )
+
+    @staticmethod
+    def _save_checkpoint(path, state):
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w") as fh:
+            json.dump(state, fh)
+        os.replace(temp_path, path)
@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.exceptions import ValidationError
+
+from apps.filestorage.services import relocate_storage_keys
+
+
+class Command(BaseCommand):
+    help = "Move flat-keyed files into the layout of a key strategy, in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--strategy",
+            default=None,
+            help="Key strategy name or dotted path (default: FILESTORAGE_KEY_STRATEGY).",
+        )
+        parser.add_argument(
+            "--after-id",
+            type=int,
+            default=0,
+            help="Resume after this file id (printed as the checkpoint of each batch).",
+        )
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        totals = {"selected": 0, "relocated": 0, "failed": 0, "seconds": 0.0}
+        after_id = options["after_id"]
+
+        while True:
+            try:
+                stats = relocate_storage_keys(
+                    batch_size=options["batch_size"],
+                    after_id=after_id,
+                    strategy=options["strategy"],
+                    dry_run=options["dry_run"],
+                )
+            except ValidationError as e:
+                raise CommandError(e.detail[0])
+            for key in totals:
+                totals[key] += stats[key]
+            after_id = stats["last_id"]
+
+            if stats["selected"]:
+                self.stdout.write(
+                    f"Relocated {stats['relocated']}/{stats['selected']} files "
+                    f"in {stats['seconds']:.2f}s, checkpoint --after-id {after_id}"
+                )
+            if stats["selected"] < options["batch_size"]:
+                break
+
+        verb = "Would relocate" if options["dry_run"] else "Relocated"
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{verb} {totals['relocated']} of {totals['selected']} files, "
+                f"{totals['failed']} failed, {totals['seconds']:.2f}s"
+            )
+        )
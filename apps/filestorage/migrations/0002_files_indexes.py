@@ -0,0 +1,41 @@
+# Generated by Django 4.2.23 on 2026-10-18 10:00
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction.
+    atomic = False
+
+    dependencies = [
+        ("filestorage", "0001_initial"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="files",
+            index=models.Index(
+                condition=models.Q(("deleted_at__isnull", True)),
+                fields=["file"],
+                name="files_file_live_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="files",
+            index=models.Index(
+                condition=models.Q(("deleted_at__isnull", True)),
+                fields=["content_type", "object_id"],
+                name="files_object_live_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="files",
+            index=models.Index(
+                condition=models.Q(("deleted_at__isnull", True)),
+                fields=["uploaded_by", "-created_at"],
+                name="files_uploader_created_idx",
+            ),
+        ),
+    ]
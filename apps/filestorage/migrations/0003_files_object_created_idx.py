@@ -0,0 +1,32 @@
+# Generated by Django 4.2.23 on 2026-10-18 11:00
+
+from django.contrib.postgres.operations import (
+    AddIndexConcurrently,
+    RemoveIndexConcurrently,
+)
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # CREATE/DROP INDEX CONCURRENTLY cannot run inside a transaction.
+    atomic = False
+
+    dependencies = [
+        ("filestorage", "0002_files_indexes"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="files",
+            index=models.Index(
+                condition=models.Q(("deleted_at__isnull", True)),
+                fields=["content_type", "object_id", "-created_at", "-id"],
+                name="files_object_created_idx",
+            ),
+        ),
+        RemoveIndexConcurrently(
+            model_name="files",
+            name="files_object_live_idx",
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.23 on 2026-10-18 12:00
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction.
+    atomic = False
+
+    dependencies = [
+        ("filestorage", "0003_files_object_created_idx"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="files",
+            index=models.Index(
+                condition=models.Q(("deleted_at__isnull", False)),
+                fields=["deleted_at", "id"],
+                name="files_deleted_idx",
+            ),
+        ),
+    ]
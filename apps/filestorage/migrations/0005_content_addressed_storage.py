@@ -0,0 +1,46 @@
+# Generated by Django 4.2.23 on 2026-10-18 15:19
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("filestorage", "0004_files_deleted_idx"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StoredObject",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now, editable=False
+                    ),
+                ),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("sha256", models.CharField(max_length=64, unique=True)),
+                ("document_id", models.CharField(max_length=1024)),
+                ("ref_count", models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                "db_table": "stored_objects",
+            },
+        ),
+        migrations.AddField(
+            model_name="files",
+            name="sha256",
+            field=models.CharField(blank=True, default="", max_length=64),
+        ),
+    ]
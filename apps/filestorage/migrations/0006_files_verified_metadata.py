@@ -0,0 +1,28 @@
+# Generated by Django 4.2.23 on 2026-10-18 15:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("filestorage", "0005_content_addressed_storage"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="files",
+            name="etag",
+            field=models.CharField(blank=True, default="", max_length=100),
+        ),
+        migrations.AddField(
+            model_name="files",
+            name="mime_type",
+            field=models.CharField(blank=True, default="", max_length=255),
+        ),
+        migrations.AddField(
+            model_name="files",
+            name="size",
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+    ]
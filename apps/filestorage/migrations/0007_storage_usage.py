@@ -0,0 +1,116 @@
+# Generated by Django 4.2.23 on 2026-10-18 16:15
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_storage_usage(apps, schema_editor):
+    Files = apps.get_model("filestorage", "Files")
+    UserStorageUsage = apps.get_model("filestorage", "UserStorageUsage")
+    ObjectStorageUsage = apps.get_model("filestorage", "ObjectStorageUsage")
+    live = Files.objects.filter(deleted_at__isnull=True)
+    totals = {"file_count": Count("id"), "total_bytes": Coalesce(Sum("size"), 0)}
+
+    UserStorageUsage.objects.bulk_create(
+        (
+            UserStorageUsage(user_id=row.pop("uploaded_by_id"), **row)
+            for row in live.filter(uploaded_by__isnull=False)
+            .values("uploaded_by_id")
+            .annotate(**totals)
+            .order_by()
+        ),
+        batch_size=1000,
+    )
+    ObjectStorageUsage.objects.bulk_create(
+        (
+            ObjectStorageUsage(**row)
+            for row in live.values("content_type_id", "object_id")
+            .annotate(**totals)
+            .order_by()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("contenttypes", "0002_remove_content_type_name"),
+        ("user", "0002_create_auth_groups"),
+        ("filestorage", "0006_files_verified_metadata"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="UserStorageUsage",
+            fields=[
+                (
+                    "created_at",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now, editable=False
+                    ),
+                ),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("file_count", models.BigIntegerField(default=0)),
+                ("total_bytes", models.BigIntegerField(default=0)),
+                (
+                    "user",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="storage_usage",
+                        serialize=False,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "storage_usage_users",
+            },
+        ),
+        migrations.CreateModel(
+            name="ObjectStorageUsage",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now, editable=False
+                    ),
+                ),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("file_count", models.BigIntegerField(default=0)),
+                ("total_bytes", models.BigIntegerField(default=0)),
+                ("object_id", models.PositiveIntegerField()),
+                (
+                    "content_type",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="contenttypes.contenttype",
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "storage_usage_objects",
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="objectstorageusage",
+            constraint=models.UniqueConstraint(
+                fields=("content_type", "object_id"), name="storage_usage_object_uniq"
+            ),
+        ),
+        migrations.RunPython(backfill_storage_usage, migrations.RunPython.noop),
+    ]
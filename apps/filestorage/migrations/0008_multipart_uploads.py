@@ -0,0 +1,51 @@
+# Generated by Django 4.2.23 on 2026-10-18 16:43
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("filestorage", "0007_storage_usage"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MultipartUpload",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now, editable=False
+                    ),
+                ),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("upload_id", models.CharField(max_length=1024, unique=True)),
+                ("document_id", models.CharField(max_length=1024)),
+                (
+                    "initiated_by",
+                    models.ForeignKey(
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "multipart_uploads",
+            },
+        ),
+    ]
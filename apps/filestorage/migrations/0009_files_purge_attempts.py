@@ -0,0 +1,37 @@
+# Generated by Django 4.2.23 on 2026-10-18 18:20
+
+from django.contrib.postgres.operations import (
+    AddIndexConcurrently,
+    RemoveIndexConcurrently,
+)
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction.
+    atomic = False
+
+    dependencies = [
+        ("filestorage", "0008_multipart_uploads"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="files",
+            name="purge_attempts",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        AddIndexConcurrently(
+            model_name="files",
+            index=models.Index(
+                condition=models.Q(("deleted_at__isnull", False)),
+                fields=["purge_attempts", "deleted_at", "id"],
+                name="files_purge_queue_idx",
+            ),
+        ),
+        RemoveIndexConcurrently(
+            model_name="files",
+            name="files_deleted_idx",
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.23 on 2026-10-18 17:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("filestorage", "0009_files_purge_attempts"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="multipartupload",
+            name="max_size",
+            field=models.BigIntegerField(null=True),
+        ),
+    ]
@@ -1,9 +1,38 @@
+from typing import ClassVar
+
 from django.conf import settings
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 from django.db import models
 
-from apps.common.models import SoftDeleteMixin, TimestampMixin
+from apps.common.models import SoftDeleteManager, SoftDeleteMixin, TimestampMixin
+
+
+class FilesQuerySet(models.QuerySet):
+    def for_objects(self, objects):
+        """
+        Files attached to any of ``objects``, which may mix several models.
+
+        Builds one query with an (content_type, object_id IN ...) branch per
+        content type instead of a query per parent object.
+        """
+        ids_by_model = {}
+        for obj in objects:
+            ids_by_model.setdefault(type(obj), set()).add(obj.pk)
+        if not ids_by_model:
+            return self.none()
+
+        content_types = ContentType.objects.get_for_models(
+            *ids_by_model, for_concrete_models=False
+        )
+        condition = models.Q()
+        for model, ids in ids_by_model.items():
+            condition |= models.Q(content_type=content_types[model], object_id__in=ids)
+        return self.filter(condition)
+
+
+class FilesManager(SoftDeleteManager.from_queryset(FilesQuerySet)):  # type: ignore[misc]
+    pass
 
 
 class Files(TimestampMixin, SoftDeleteMixin, models.Model):
@@ -16,6 +45,117 @@ class Files(TimestampMixin, SoftDeleteMixin, models.Model):
     uploaded_by = models.ForeignKey(
         settings.AUTH_USER_MODEL, null=True, on_delete=models.SET_NULL
     )
+    # Set for content-addressed uploads; the object is shared via StoredObject.
+    sha256 = models.CharField(max_length=64, blank=True, default="")
+    # Object metadata confirmed with the storage backend when the row is saved.
+    size = models.PositiveBigIntegerField(null=True, blank=True)
+    etag = models.CharField(max_length=100, blank=True, default="")
+    mime_type = models.CharField(max_length=255, blank=True, default="")
+    # Failed purges of a soft-deleted row; rows that keep failing go last.
+    purge_attempts = models.PositiveIntegerField(default=0)
+
+    objects: ClassVar[FilesManager] = FilesManager()
 
     class Meta:
         db_table = "files"
+        # Partial indexes match the SoftDeleteManager default filter.
+        indexes = [
+            models.Index(
+                fields=["file"],
+                name="files_file_live_idx",
+                condition=models.Q(deleted_at__isnull=True),
+            ),
+            models.Index(
+                fields=["content_type", "object_id", "-created_at", "-id"],
+                name="files_object_created_idx",
+                condition=models.Q(deleted_at__isnull=True),
+            ),
+            models.Index(
+                fields=["uploaded_by", "-created_at"],
+                name="files_uploader_created_idx",
+                condition=models.Q(deleted_at__isnull=True),
+            ),
+            # Purge queue for purge_deleted_files.
+            models.Index(
+                fields=["purge_attempts", "deleted_at", "id"],
+                name="files_purge_queue_idx",
+                condition=models.Q(deleted_at__isnull=False),
+            ),
+        ]
+
+
+class StoredObject(TimestampMixin, models.Model):
+    """
+    A content-addressed storage object shared by every Files row with its hash.
+
+    ``ref_count`` is the number of Files rows (live or awaiting purge) that
+    point at the object; the object is deleted from storage only once the
+    last of them is purged.
+    """
+
+    sha256 = models.CharField(max_length=64, unique=True)
+    document_id = models.CharField(max_length=1024)
+    ref_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        db_table = "stored_objects"
+
+
+class StorageUsage(TimestampMixin, models.Model):
+    """
+    Running totals of live files and their bytes, kept by the services layer.
+
+    Rows are adjusted in the same transaction as the Files rows they count;
+    ``rebuild_storage_usage`` recomputes them from the files table.
+    """
+
+    file_count = models.BigIntegerField(default=0)
+    total_bytes = models.BigIntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+
+class UserStorageUsage(StorageUsage):
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        primary_key=True,
+        on_delete=models.CASCADE,
+        related_name="storage_usage",
+    )
+
+    class Meta:
+        db_table = "storage_usage_users"
+
+
+class ObjectStorageUsage(StorageUsage):
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveIntegerField()
+
+    class Meta:
+        db_table = "storage_usage_objects"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["content_type", "object_id"], name="storage_usage_object_uniq"
+            )
+        ]
+
+
+class MultipartUpload(TimestampMixin, models.Model):
+    """
+    A multipart upload in progress and the user who started it.
+
+    Only that user may presign parts for, complete or abort the upload; the
+    row is removed once the upload is completed or aborted. ``max_size`` is
+    the size cap the upload was started under.
+    """
+
+    upload_id = models.CharField(max_length=1024, unique=True)
+    document_id = models.CharField(max_length=1024)
+    initiated_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, null=True, on_delete=models.CASCADE
+    )
+    max_size = models.BigIntegerField(null=True)
+
+    class Meta:
+        db_table = "multipart_uploads"
@@ -7,3 +7,24 @@ class FileSerializer(serializers.ModelSerializer):
     class Meta:
         model = Files
         fields = "__all__"
+
+
+class FileListSerializer(serializers.ModelSerializer):
+    uploaded_by_name = serializers.CharField(
+        source="uploaded_by.full_name", default=None, read_only=True
+    )
+
+    class Meta:
+        model = Files
+        fields = (
+            "id",
+            "file",
+            "original_name",
+            "document_type",
+            "object_id",
+            "size",
+            "mime_type",
+            "uploaded_by",
+            "uploaded_by_name",
+            "created_at",
+        )
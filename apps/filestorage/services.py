@@ -1,123 +1,1340 @@
+import asyncio
 import logging
+import os
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 
+from asgiref.sync import sync_to_async
 from botocore.exceptions import ClientError
+from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
-from django.db import transaction
+from django.db import connection, transaction
+from django.db.models import F
+from django.db.models.functions import Collate
+from django.utils import timezone
 from rest_framework.exceptions import ValidationError
 
-from apps.filestorage.utils import generate_storage_key
+from apps.filestorage.utils import (
+    generate_content_key,
+    generate_storage_key,
+    generate_storage_keys,
+    get_key_strategy,
+    is_sha256,
+    relocated_key,
+    split_storage_key,
+)
 
-from .models import Files
-from .storage.factory import get_storage_service
+from .archives import stream_zip
+from .cache import get_missing_object_cache, get_presign_cache
+from .models import Files, MultipartUpload, StoredObject
+from .storage.factory import get_async_storage_service, get_storage_service
+from .storage.multipart import MAX_PARTS, MIN_PART_SIZE
+from .storage.s3 import DEFAULT_MAX_UPLOAD_SIZE
+from .usage import (
+    aget_remaining_quota,
+    get_object_usage,
+    get_remaining_quota,
+    get_user_usage,
+    lock_remaining_quota,
+    rebuild_usage,
+    record_usage,
+    soft_delete_files,
+)
 
 logger = logging.getLogger(__name__)
 
+CONTENT_KEY_MISMATCH = {"file_url": "The file is not stored under its 'sha256' key."}
 
-def generate_presigned_url(file_name, content_type, folder_prefix="uploads"):
+
+def get_max_upload_size(folder_prefix):
+    """Upload size cap in bytes for a folder prefix (FILESTORAGE_MAX_UPLOAD_SIZES)."""
+    sizes = getattr(settings, "FILESTORAGE_MAX_UPLOAD_SIZES", {})
+    return sizes.get(folder_prefix, sizes.get("default", DEFAULT_MAX_UPLOAD_SIZE))
+
+
+def _max_upload_size_for_key(document_id):
+    """
+    Upload size cap for a stored key, from the folder prefix in the key.
+
+    Only for uploads that did not record their cap when presigned: objects
+    stored before caps were recorded, and local uploads.
+    """
+    parts = split_storage_key(document_id)
+    return get_max_upload_size(parts[1] if parts else "default")
+
+
+def _upload_size_limit(folder_prefix, remaining_quota):
+    """Per-upload size cap: the folder's limit, lowered to the remaining quota."""
+    max_size = get_max_upload_size(folder_prefix)
+    if remaining_quota is None:
+        return max_size
+    if remaining_quota <= 0:
+        raise ValidationError("Storage quota exceeded.")
+    return min(max_size, remaining_quota)
+
+
+def _content_addressing_enabled():
+    return getattr(settings, "FILESTORAGE_CONTENT_ADDRESSED", False)
+
+
+def _content_key(sha256):
+    return generate_content_key(
+        sha256, getattr(settings, "FILESTORAGE_CONTENT_PREFIX", "content")
+    )
+
+
+def _validate_sha256(sha256):
+    if not _content_addressing_enabled():
+        return None
+    if sha256 and not is_sha256(sha256):
+        raise ValidationError("'sha256' must be a lowercase hex SHA-256 digest.")
+    return sha256 or None
+
+
+def _stored_document_ids(hashes):
+    """Map each hash that is already stored (and referenced) to its key."""
+    return dict(
+        StoredObject.objects.filter(sha256__in=hashes, ref_count__gt=0).values_list(
+            "sha256", "document_id"
+        )
+    )
+
+
+def _already_stored_response(storage_service, document_id, sha256):
+    return {
+        "upload_url": None,
+        "fields": None,
+        "document_id": document_id,
+        "file_url": storage_service.get_url(document_id),
+        "sha256": sha256,
+        "already_stored": True,
+    }
+
+
+def generate_presigned_url(
+    file_name, content_type, folder_prefix="uploads", sha256=None, user=None
+):
+    """
+    Presign a POST upload for one file.
+
+    With ``FILESTORAGE_CONTENT_ADDRESSED`` on and a ``sha256`` supplied, the
+    key is derived from the hash; if that content is already stored the
+    response has ``already_stored: True`` and the existing key instead of an
+    upload URL. With ``FILESTORAGE_USER_QUOTA`` set, the upload policy's
+    size limit is lowered to what ``user`` has left.
+    """
     if not file_name:
         raise ValueError("File name is required field")
 
+    max_size = _upload_size_limit(folder_prefix, get_remaining_quota(user))
     storage_service = get_storage_service()
-    document_id = generate_storage_key(file_name, folder_prefix)
+    sha256 = _validate_sha256(sha256)
+    if sha256:
+        document_id = _stored_document_ids([sha256]).get(sha256)
+        if document_id:
+            return _already_stored_response(storage_service, document_id, sha256)
+        document_id = _content_key(sha256)
+    else:
+        document_id = generate_storage_key(file_name, folder_prefix)
 
     if hasattr(storage_service, "generate_presigned_post_url"):
-        return storage_service.generate_presigned_post_url(document_id, content_type)
+        presigned = storage_service.generate_presigned_post_url(
+            document_id, content_type, max_size=max_size
+        )
+        if sha256:
+            presigned.update(sha256=sha256, already_stored=False)
+        return presigned
 
     return {"upload_url": None, "fields": None, "backend": "local"}
 
 
-def generate_batch_presigned_urls(files):
-    storage_service = get_storage_service()
+async def agenerate_presigned_url(
+    file_name, content_type, folder_prefix="uploads", sha256=None, user=None
+):
+    """
+    Async variant of ``generate_presigned_url`` for ASGI views.
+
+    Signing is CPU-only and runs inline; the content-addressed lookup uses
+    the async ORM.
+    """
+    if not file_name:
+        raise ValueError("File name is required field")
+
+    max_size = _upload_size_limit(folder_prefix, await aget_remaining_quota(user))
+    storage_service = get_async_storage_service()
+    sha256 = _validate_sha256(sha256)
+    if sha256:
+        document_id = (
+            await StoredObject.objects.filter(sha256=sha256, ref_count__gt=0)
+            .values_list("document_id", flat=True)
+            .afirst()
+        )
+        if document_id:
+            return _already_stored_response(storage_service, document_id, sha256)
+        document_id = _content_key(sha256)
+    else:
+        document_id = generate_storage_key(file_name, folder_prefix)
 
     if hasattr(storage_service, "generate_presigned_post_url"):
-        presigned_list = []
+        presigned = await storage_service.generate_presigned_post_url(
+            document_id, content_type, max_size=max_size
+        )
+        if sha256:
+            presigned.update(sha256=sha256, already_stored=False)
+        return presigned
 
-        for index, file_data in enumerate(files):
-            file_name = file_data.get("file_name")
-            if not file_name:
-                raise ValueError(f"Missing 'file_name' in file entry at index {index}")
+    return {"upload_url": None, "fields": None, "backend": "local"}
 
-            content_type = file_data.get("content_type", "application/octet-stream")
-            folder_prefix = file_data.get("folder_prefix", "uploads")
-            file_id = file_data.get("id") or file_name
 
-            document_id = generate_storage_key(file_name, prefix=folder_prefix)
+def _validate_batch(files):
+    max_batch_size = getattr(settings, "FILESTORAGE_MAX_BATCH_SIZE", 1000)
+    if len(files) > max_batch_size:
+        raise ValidationError(
+            f"A batch can contain at most {max_batch_size} files, got {len(files)}."
+        )
+
+    entries = []
+    for index, file_data in enumerate(files):
+        if not isinstance(file_data, dict) or not file_data.get("file_name"):
+            raise ValidationError(f"Missing 'file_name' in file entry at index {index}")
+        file_name = file_data["file_name"]
+        file_size = file_data.get("file_size")
+        if file_size is not None:
+            try:
+                file_size = int(file_size)
+            except (TypeError, ValueError):
+                file_size = -1
+            if file_size < 1:
+                raise ValidationError(
+                    f"'file_size' must be a positive number of bytes at index {index}"
+                )
+        entries.append(
+            {
+                "file_name": file_name,
+                "content_type": file_data.get(
+                    "content_type", "application/octet-stream"
+                ),
+                "folder_prefix": file_data.get("folder_prefix", "uploads"),
+                "input_file_id": file_data.get("id") or file_name,
+                "sha256": _validate_sha256(file_data.get("sha256")),
+                "file_size": file_size,
+            }
+        )
+    return entries
 
+
+def _allocate_quota(entries, remaining_quota):
+    """
+    Set each upload's share of the remaining quota as ``entry["quota"]``.
+
+    Entries declaring a ``file_size`` get exactly that much; the others
+    split what is left evenly, so the batch as a whole can never upload
+    more than the quota allows.
+    """
+    uploads = [entry for entry in entries if not entry.get("already_stored")]
+    declared = sum(entry["file_size"] or 0 for entry in uploads)
+    undeclared = sum(1 for entry in uploads if entry["file_size"] is None)
+    share = (remaining_quota - declared) // undeclared if undeclared else 0
+    if declared > remaining_quota or (undeclared and share < 1):
+        raise ValidationError("Storage quota exceeded.")
+    for entry in uploads:
+        entry["quota"] = share if entry["file_size"] is None else entry["file_size"]
+
+
+def _presign_chunk(storage_service, chunk):
+    presigned_chunk = []
+    for entry in chunk:
+        if entry.get("already_stored"):
+            presigned = _already_stored_response(
+                storage_service, entry["document_id"], entry["sha256"]
+            )
+        else:
             presigned = storage_service.generate_presigned_post_url(
-                document_id, content_type
+                entry["document_id"],
+                entry["content_type"],
+                max_size=_upload_size_limit(entry["folder_prefix"], entry["quota"]),
             )
-            presigned["input_file_id"] = file_id
-            presigned_list.append(presigned)
+            if entry["sha256"]:
+                presigned.update(sha256=entry["sha256"], already_stored=False)
+        presigned["input_file_id"] = entry["input_file_id"]
+        presigned_chunk.append(presigned)
+    return presigned_chunk
 
-        return {"backend": "s3", "presigned": presigned_list}
 
-    return {"backend": "local", "presigned": []}
+def generate_batch_presigned_urls(files, user=None):
+    """
+    Presign uploads for a batch of files.
 
+    The whole batch is validated before anything is signed, storage keys are
+    generated in one pass, and signing runs in chunks on a bounded thread
+    pool. Results keep the input order and carry each entry's
+    ``input_file_id``. With a quota, the uploads of the batch together are
+    capped at ``user``'s remaining quota: entries with a ``file_size`` are
+    capped at that size and the rest share what is left.
+    """
+    # Validated on every backend, so a bad batch fails the same way locally.
+    entries = _validate_batch(files)
+    storage_service = get_storage_service()
+    if not hasattr(storage_service, "generate_presigned_post_url"):
+        return {"backend": "local", "presigned": []}
 
-def save_file_metadata(
-    user, file_url, original_name, content_type_str, object_id, document_type
+    remaining_quota = get_remaining_quota(user)
+    if remaining_quota == 0:
+        raise ValidationError("Storage quota exceeded.")
+    document_ids = generate_storage_keys(
+        [(entry["file_name"], entry["folder_prefix"]) for entry in entries]
+    )
+    stored = _stored_document_ids(
+        [entry["sha256"] for entry in entries if entry["sha256"]]
+    )
+    for entry, document_id in zip(entries, document_ids):
+        if entry["sha256"] in stored:
+            entry["document_id"] = stored[entry["sha256"]]
+            entry["already_stored"] = True
+        elif entry["sha256"]:
+            entry["document_id"] = _content_key(entry["sha256"])
+        else:
+            entry["document_id"] = document_id
+        entry["quota"] = remaining_quota
+    if remaining_quota is not None:
+        _allocate_quota(entries, remaining_quota)
+
+    chunk_size = getattr(settings, "FILESTORAGE_PRESIGN_CHUNK_SIZE", 100)
+    chunks = [
+        entries[start:end]
+        for start, end in zip(
+            range(0, len(entries), chunk_size),
+            range(chunk_size, len(entries) + chunk_size, chunk_size),
+        )
+    ]
+    max_workers = min(getattr(settings, "FILESTORAGE_PRESIGN_WORKERS", 4), len(chunks))
+
+    if max_workers <= 1:
+        results = [_presign_chunk(storage_service, chunk) for chunk in chunks]
+    else:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(
+                executor.map(
+                    lambda chunk: _presign_chunk(storage_service, chunk), chunks
+                )
+            )
+
+    presigned_list = [presigned for chunk in results for presigned in chunk]
+    return {"backend": "s3", "presigned": presigned_list}
+
+
+def _get_multipart_storage_service():
+    storage_service = get_storage_service()
+    if not hasattr(storage_service, "create_multipart_upload"):
+        raise ValidationError("The storage backend does not support multipart uploads.")
+    return storage_service
+
+
+def _get_part_size(file_size):
+    part_size = getattr(settings, "AWS_S3_MULTIPART_PART_SIZE", MIN_PART_SIZE)
+    part_size = max(part_size, MIN_PART_SIZE)
+    # Grow the part size for very large files to stay within S3's part limit.
+    return max(part_size, -(-file_size // MAX_PARTS))
+
+
+def initiate_multipart_upload(
+    file_name, content_type, file_size, folder_prefix="uploads", user=None
+):
+    """
+    Start a presigned multipart upload for a file of ``file_size`` bytes.
+
+    Returns the ``upload_id``, storage key, part size and part count the
+    client should use; part URLs are requested separately with
+    ``presign_multipart_parts``.
+    """
+    if not file_name:
+        raise ValidationError("File name is required field")
+    try:
+        file_size = int(file_size)
+    except (TypeError, ValueError):
+        raise ValidationError("'file_size' must be an integer number of bytes.")
+    max_size = get_max_upload_size(folder_prefix)
+    if not 0 < file_size <= max_size:
+        raise ValidationError(
+            f"File size must be between 1 and {max_size} bytes for '{folder_prefix}'."
+        )
+    if file_size > _upload_size_limit(folder_prefix, get_remaining_quota(user)):
+        raise ValidationError("Storage quota exceeded.")
+
+    storage_service = _get_multipart_storage_service()
+    document_id = generate_storage_key(file_name, folder_prefix)
+    upload_id = storage_service.create_multipart_upload(
+        document_id, content_type, max_size=max_size
+    )
+    MultipartUpload.objects.create(
+        upload_id=upload_id,
+        document_id=document_id,
+        initiated_by=user if user and user.is_authenticated else None,
+        max_size=max_size,
+    )
+    part_size = _get_part_size(file_size)
+    return {
+        "upload_id": upload_id,
+        "document_id": document_id,
+        "file_url": storage_service.get_url(document_id),
+        "part_size": part_size,
+        "part_count": -(-file_size // part_size),
+    }
+
+
+def _check_multipart_upload(document_id, upload_id, user):
+    """The upload's record, after checking that ``user`` is who started it."""
+    if not document_id or not upload_id:
+        raise ValidationError("'document_id' and 'upload_id' are required.")
+    upload = MultipartUpload.objects.filter(
+        upload_id=upload_id, document_id=document_id
+    ).first()
+    if not upload:
+        raise ValidationError("Multipart upload not found.")
+    if user and upload.initiated_by_id != user.pk:
+        logger.error(f"Multipart upload {upload_id} denied, permission denied")
+        raise ValidationError("You do not have permission to modify this upload.")
+    return upload
+
+
+def presign_multipart_parts(
+    document_id, upload_id, part_numbers, expires_in=3600, user=None
 ):
+    _check_multipart_upload(document_id, upload_id, user)
+    try:
+        part_numbers = sorted({int(number) for number in part_numbers})
+    except (TypeError, ValueError):
+        raise ValidationError("'part_numbers' must be a list of integers.")
+    if not part_numbers or part_numbers[0] < 1 or part_numbers[-1] > MAX_PARTS:
+        raise ValidationError(f"Part numbers must be between 1 and {MAX_PARTS}.")
+    max_batch_size = getattr(settings, "FILESTORAGE_MAX_BATCH_SIZE", 1000)
+    if len(part_numbers) > max_batch_size:
+        raise ValidationError(
+            f"At most {max_batch_size} parts can be presigned at once."
+        )
+
+    storage_service = _get_multipart_storage_service()
+    return {
+        "upload_id": upload_id,
+        "document_id": document_id,
+        "parts": storage_service.generate_presigned_part_urls(
+            document_id, upload_id, part_numbers, expires_in=expires_in
+        ),
+    }
+
+
+def complete_multipart_upload(document_id, upload_id, parts, user=None):
+    """
+    Complete a multipart upload from the client's ``[{part_number, etag}]`` list.
+
+    Only the user who initiated the upload may complete it. The stored parts
+    are checked against the size cap the upload was started under first; an
+    oversized upload is aborted instead of completed.
+    """
+    if not document_id or not upload_id or not parts:
+        raise ValidationError("'document_id', 'upload_id' and 'parts' are required.")
+    upload = _check_multipart_upload(document_id, upload_id, user)
+    try:
+        completed = sorted(
+            (
+                {"PartNumber": int(part["part_number"]), "ETag": part["etag"]}
+                for part in parts
+            ),
+            key=lambda part: part["PartNumber"],
+        )
+    except (TypeError, KeyError, ValueError):
+        raise ValidationError("Each part needs a 'part_number' and an 'etag'.")
+
+    storage_service = _get_multipart_storage_service()
+    max_size = upload.max_size or _max_upload_size_for_key(document_id)
+    stored_parts = storage_service.list_multipart_parts(document_id, upload_id)
+    if sum(part["Size"] for part in stored_parts.values()) > max_size:
+        storage_service.abort_multipart_upload(document_id, upload_id)
+        upload.delete()
+        raise ValidationError(f"Upload exceeds the {max_size} byte limit.")
+
+    storage_service.complete_multipart_upload(document_id, upload_id, completed)
+    upload.delete()
+    return {
+        "document_id": document_id,
+        "file_url": storage_service.get_url(document_id),
+    }
+
+
+def abort_multipart_upload(document_id, upload_id, user=None):
+    upload = _check_multipart_upload(document_id, upload_id, user)
+    _get_multipart_storage_service().abort_multipart_upload(document_id, upload_id)
+    upload.delete()
+
+
+def abort_stale_multipart_uploads(older_than):
+    """Abort multipart uploads initiated before ``older_than``; returns the count."""
+    storage_service = get_storage_service()
+    if not hasattr(storage_service, "iter_multipart_uploads"):
+        return 0
+
+    aborted = 0
+    for upload in storage_service.iter_multipart_uploads():
+        if upload["Initiated"] >= older_than:
+            continue
+        try:
+            storage_service.abort_multipart_upload(upload["Key"], upload["UploadId"])
+            MultipartUpload.objects.filter(upload_id=upload["UploadId"]).delete()
+            aborted += 1
+        except ClientError as e:
+            logger.warning(f"Failed to abort multipart upload {upload['Key']}: {e}")
+    return aborted
+
+
+def get_content_type(content_type_str):
+    """Resolve an 'app_label.model' string through ContentType's in-process cache."""
     app_label, model = content_type_str.split(".")
-    content_type = ContentType.objects.get(app_label=app_label, model=model)
+    return ContentType.objects.get_by_natural_key(app_label, model)
+
+
+def _add_references(files):
+    """Count new Files rows against the StoredObject for their content hash."""
+    storage_service = get_storage_service()
+    counts = Counter(file.sha256 for file in files if file.sha256)
+    if not counts:
+        return
+
+    document_ids = {
+        file.sha256: storage_service.get_document_id(file.file)
+        for file in files
+        if file.sha256
+    }
+    StoredObject.objects.bulk_create(
+        [
+            StoredObject(sha256=sha256, document_id=document_ids[sha256])
+            for sha256 in counts
+        ],
+        ignore_conflicts=True,
+    )
+    for sha256, count in counts.items():
+        StoredObject.objects.filter(sha256=sha256).update(
+            ref_count=F("ref_count") + count, updated_at=timezone.now()
+        )
+
+
+def _document_id_for_url(storage_service, file_url):
+    """Storage key behind a URL this backend produced, or None for any other URL."""
+    document_id = storage_service.get_document_id(file_url)
+    if storage_service.get_url(document_id) != file_url:
+        return None
+    if ".." in document_id.split("/"):
+        return None
+    return document_id
+
+
+def _split_verifiable(storage_service, file_urls):
+    """Resolve URLs to keys; foreign URLs and recently missing keys map to None."""
+    missing_cache = get_missing_object_cache()
+    results = {}
+    pending = {}
+    for file_url in set(file_urls):
+        document_id = _document_id_for_url(storage_service, file_url)
+        if document_id is None or missing_cache.get(document_id):
+            results[file_url] = None
+        else:
+            pending[file_url] = document_id
+    return results, pending
+
+
+def _collect_stats(results, pending, stats):
+    missing_cache = get_missing_object_cache()
+    missing_ttl = getattr(settings, "FILESTORAGE_VERIFY_MISSING_TTL", 10)
+    for (file_url, document_id), stat in zip(pending.items(), stats):
+        if stat is None and missing_ttl > 0:
+            missing_cache.set(document_id, True, missing_ttl)
+        results[file_url] = stat
+    return results
+
+
+def verify_uploads(file_urls):
+    """
+    Look up the stored objects behind a batch of file URLs.
+
+    Objects are checked concurrently with HeadObject on a bounded pool
+    (``FILESTORAGE_VERIFY_WORKERS``), or with ``os.stat`` for the local
+    backend. Keys found missing are remembered for
+    ``FILESTORAGE_VERIFY_MISSING_TTL`` seconds and not checked again
+    meanwhile.
+
+    Returns:
+        dict: file_url -> ``{"size", "etag", "content_type"}``, or None when
+        the URL does not belong to this backend or the object does not exist.
+    """
+    storage_service = get_storage_service()
+    results, pending = _split_verifiable(storage_service, file_urls)
+
+    max_workers = min(getattr(settings, "FILESTORAGE_VERIFY_WORKERS", 8), len(pending))
+    if max_workers <= 1 or hasattr(storage_service, "get_path"):
+        stats = [storage_service.stat(document_id) for document_id in pending.values()]
+    else:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            stats = list(executor.map(storage_service.stat, pending.values()))
+    return _collect_stats(results, pending, stats)
+
+
+async def averify_uploads(file_urls):
+    """
+    Async variant of ``verify_uploads`` for ASGI views.
+
+    HEAD requests run as coroutines on the async storage backend, at most
+    ``FILESTORAGE_VERIFY_WORKERS`` at a time, without using threads.
+    """
+    storage_service = get_async_storage_service()
+    results, pending = _split_verifiable(storage_service, file_urls)
+    semaphore = asyncio.Semaphore(getattr(settings, "FILESTORAGE_VERIFY_WORKERS", 8))
 
-    uploaded_file = Files.objects.create(
+    async def stat(document_id):
+        async with semaphore:
+            return await storage_service.stat(document_id)
+
+    stats = await asyncio.gather(*(stat(key) for key in pending.values()))
+    return _collect_stats(results, pending, stats)
+
+
+def _verification_enabled():
+    return getattr(settings, "FILESTORAGE_VERIFY_UPLOADS", True)
+
+
+def _verified_fields(file_url, stat, file_size=None, mime_type=None):
+    """Check a verified object against the client's claims; returns Files fields."""
+    if stat is None:
+        raise ValidationError({"file_url": "Uploaded file not found."})
+
+    max_size = stat.get("max_size") or _max_upload_size_for_key(
+        get_storage_service().get_document_id(file_url)
+    )
+    if stat["size"] > max_size:
+        raise ValidationError(
+            {"file_url": f"File size exceeds the limit of {max_size} bytes."}
+        )
+    if file_size not in (None, ""):
+        try:
+            file_size = int(file_size)
+        except (TypeError, ValueError):
+            raise ValidationError({"file_size": "Must be an integer."})
+        if file_size != stat["size"]:
+            raise ValidationError(
+                {"file_size": f"Expected {file_size} bytes, stored {stat['size']}."}
+            )
+    if mime_type and stat["content_type"] and mime_type != stat["content_type"]:
+        raise ValidationError(
+            {"mime_type": f"Expected {mime_type}, stored {stat['content_type']}."}
+        )
+    return {
+        "size": stat["size"],
+        "etag": stat["etag"],
+        "mime_type": stat["content_type"],
+    }
+
+
+def save_file_metadata(
+    user,
+    file_url,
+    original_name,
+    content_type_str,
+    object_id,
+    document_type,
+    sha256="",
+    file_size=None,
+    mime_type=None,
+):
+    """
+    Record an uploaded file.
+
+    Unless ``FILESTORAGE_VERIFY_UPLOADS`` is off, the object must exist in
+    storage, fit the size cap and match ``file_size``/``mime_type`` when
+    given; its size, ETag and content type are stored on the row.
+    """
+    content_type = get_content_type(content_type_str)
+    sha256 = _validate_sha256(sha256) or ""
+    verified = {}
+    if _verification_enabled():
+        stat = verify_uploads([file_url])[file_url]
+        verified = _verified_fields(file_url, stat, file_size, mime_type)
+
+    return _create_file(
+        file=file_url,
+        original_name=original_name,
+        uploaded_by=user,
+        content_type=content_type,
+        object_id=object_id,
+        document_type=document_type,
+        sha256=sha256,
+        **verified,
+    )
+
+
+async def asave_file_metadata(
+    user,
+    file_url,
+    original_name,
+    content_type_str,
+    object_id,
+    document_type,
+    sha256="",
+    file_size=None,
+    mime_type=None,
+):
+    """
+    Async variant of ``save_file_metadata`` for ASGI views.
+
+    The upload is verified without blocking; the insert itself needs a
+    transaction (for content-addressed references) and runs in a thread.
+    """
+    content_type = await sync_to_async(get_content_type)(content_type_str)
+    sha256 = _validate_sha256(sha256) or ""
+    verified = {}
+    if _verification_enabled():
+        stat = (await averify_uploads([file_url]))[file_url]
+        verified = _verified_fields(file_url, stat, file_size, mime_type)
+
+    return await sync_to_async(_create_file)(
         file=file_url,
         original_name=original_name,
         uploaded_by=user,
         content_type=content_type,
         object_id=object_id,
         document_type=document_type,
+        sha256=sha256,
+        **verified,
+    )
+
+
+def _mismatched_content_keys(files):
+    """
+    Positions in ``files`` of content-addressed rows stored under a wrong key.
+
+    A row claiming a ``sha256`` must point at that hash's content key, or at
+    the key its StoredObject already has; otherwise it could take a
+    reference on someone else's object by naming its hash.
+    """
+    hashes = {file.sha256 for file in files if file.sha256}
+    if not hashes:
+        return set()
+    storage_service = get_storage_service()
+    stored = dict(
+        StoredObject.objects.filter(sha256__in=hashes).values_list(
+            "sha256", "document_id"
+        )
     )
+    mismatched = set()
+    for position, file in enumerate(files):
+        if not file.sha256:
+            continue
+        document_id = _document_id_for_url(storage_service, file.file)
+        allowed = {_content_key(file.sha256), stored.get(file.sha256)}
+        if document_id is None or document_id not in allowed:
+            mismatched.add(position)
+    return mismatched
+
+
+def _create_file(**fields):
+    uploaded_file = Files(**fields)
+    if _mismatched_content_keys([uploaded_file]):
+        raise ValidationError(CONTENT_KEY_MISMATCH)
+    with transaction.atomic():
+        remaining_quota = lock_remaining_quota(uploaded_file.uploaded_by)
+        if remaining_quota is not None and (uploaded_file.size or 0) > remaining_quota:
+            raise ValidationError("Storage quota exceeded.")
+        uploaded_file.save(force_insert=True)
+        _add_references([uploaded_file])
+        record_usage([uploaded_file])
     return uploaded_file
 
 
+def _build_file_record(user, record):
+    missing = [
+        field
+        for field in ("file_url", "original_name", "content_type", "object_id")
+        if record.get(field) in (None, "")
+    ]
+    if missing:
+        raise ValidationError({field: "This field is required." for field in missing})
+
+    try:
+        content_type = get_content_type(record["content_type"])
+    except (ValueError, ContentType.DoesNotExist):
+        raise ValidationError(
+            {"content_type": f"Unknown content type '{record['content_type']}'."}
+        )
+
+    try:
+        object_id = int(record["object_id"])
+    except (TypeError, ValueError):
+        object_id = -1
+    if object_id < 0:
+        raise ValidationError({"object_id": "Must be a positive integer."})
+
+    return Files(
+        file=record["file_url"],
+        original_name=record["original_name"],
+        uploaded_by=user,
+        content_type=content_type,
+        object_id=object_id,
+        document_type=record.get("document_type", ""),
+        sha256=_validate_sha256(record.get("sha256")) or "",
+    )
+
+
+def save_batch_file_metadata(user, records):
+    """
+    Validate a batch of metadata records and insert the valid ones at once.
+
+    Every record is validated before anything is written, and the uploads
+    of all valid records are verified in one ``verify_uploads`` call; valid
+    rows are then stored with a single ``bulk_create`` inside a transaction.
+    Returns one result per input record, in input order: ``{"index", "file"}``
+    for created rows or ``{"index", "errors"}`` for rejected ones.
+    """
+    results, to_create = _prepare_file_batch(user, records)
+    if _verification_enabled() and to_create:
+        stats = verify_uploads([file.file for _, file in to_create])
+        to_create = _apply_batch_verification(records, to_create, stats, results)
+    return _insert_file_batch(to_create, results)
+
+
+async def asave_batch_file_metadata(user, records):
+    """
+    Async variant of ``save_batch_file_metadata`` for ASGI views.
+
+    Validation and the insert run in a thread as in the sync version; the
+    uploads are verified with ``averify_uploads`` in between, so the HEAD
+    requests do not need a worker pool.
+    """
+    results, to_create = await sync_to_async(_prepare_file_batch)(user, records)
+    if _verification_enabled() and to_create:
+        stats = await averify_uploads([file.file for _, file in to_create])
+        to_create = _apply_batch_verification(records, to_create, stats, results)
+    return await sync_to_async(_insert_file_batch)(to_create, results)
+
+
+def _prepare_file_batch(user, records):
+    max_batch_size = getattr(settings, "FILESTORAGE_MAX_BATCH_SIZE", 1000)
+    if len(records) > max_batch_size:
+        raise ValidationError(
+            f"A batch can contain at most {max_batch_size} records, got {len(records)}."
+        )
+
+    results = []
+    to_create = []
+    for index, record in enumerate(records):
+        if not isinstance(record, dict):
+            results.append({"index": index, "errors": "Record must be an object."})
+            continue
+        try:
+            to_create.append((index, _build_file_record(user, record)))
+        except ValidationError as e:
+            results.append({"index": index, "errors": e.detail})
+
+    mismatched = _mismatched_content_keys([file for _, file in to_create])
+    for position in sorted(mismatched):
+        results.append(
+            {"index": to_create[position][0], "errors": CONTENT_KEY_MISMATCH}
+        )
+    to_create = [
+        entry for position, entry in enumerate(to_create) if position not in mismatched
+    ]
+    return results, to_create
+
+
+def _apply_batch_verification(records, to_create, stats, results):
+    verified = []
+    for index, file in to_create:
+        record = records[index]
+        try:
+            fields = _verified_fields(
+                file.file,
+                stats[file.file],
+                record.get("file_size"),
+                record.get("mime_type"),
+            )
+        except ValidationError as e:
+            results.append({"index": index, "errors": e.detail})
+            continue
+        for field, value in fields.items():
+            setattr(file, field, value)
+        verified.append((index, file))
+    return verified
+
+
+def _within_quota(to_create, results):
+    """The records that fit the uploader's remaining quota, taken in order."""
+    if not to_create:
+        return to_create
+    remaining_quota = lock_remaining_quota(to_create[0][1].uploaded_by)
+    if remaining_quota is None:
+        return to_create
+    kept = []
+    for index, file in to_create:
+        if (file.size or 0) > remaining_quota:
+            results.append({"index": index, "errors": "Storage quota exceeded."})
+            continue
+        remaining_quota -= file.size or 0
+        kept.append((index, file))
+    return kept
+
+
+def _insert_file_batch(to_create, results):
+    with transaction.atomic():
+        to_create = _within_quota(to_create, results)
+        created = Files.objects.bulk_create([file for _, file in to_create])
+        _add_references(created)
+        record_usage(created)
+
+    results.extend(
+        {"index": index, "file": file} for (index, _), file in zip(to_create, created)
+    )
+    results.sort(key=lambda result: result["index"])
+    return results
+
+
+def get_storage_usage(user, content_type_str=None, object_id=None):
+    """
+    Live file count and bytes from the usage ledger, without scanning files.
+
+    Returns the totals for one object when ``content_type_str`` and
+    ``object_id`` are given, otherwise for the files ``user`` uploaded along
+    with their quota (None when unlimited).
+    """
+    if content_type_str:
+        return get_object_usage(get_content_type(content_type_str), object_id)
+    usage = get_user_usage(user)
+    usage["quota"] = getattr(settings, "FILESTORAGE_USER_QUOTA", 0) or None
+    return usage
+
+
+def rebuild_storage_usage(chunk_size=1000):
+    """Recompute the usage ledger from the files table; see ``usage.rebuild_usage``."""
+    started = time.monotonic()
+    written = rebuild_usage(chunk_size=chunk_size)
+    written["seconds"] = time.monotonic() - started
+    return written
+
+
+def get_object_files(content_type_str, object_ids, user=None):
+    """
+    Queryset of live files attached to the given objects of one content type.
+
+    As for downloads, a ``user`` who is not an admin only sees the files
+    they uploaded.
+    """
+    content_type = get_content_type(content_type_str)
+    queryset = Files.objects.filter(content_type=content_type, object_id__in=object_ids)
+    if user and not user.is_admin():
+        queryset = queryset.filter(uploaded_by=user)
+    return queryset.select_related("uploaded_by")
+
+
+def export_object_files_zip(content_type_str, object_id, user=None):
+    """
+    Stream a ZIP archive of every live file attached to one object.
+
+    As for downloads, a ``user`` who is not an admin only gets the files
+    they uploaded. Files whose URL this backend did not produce are left out.
+
+    Args:
+        content_type_str (str): "app_label.model" of the parent object.
+        object_id (int): Primary key of the parent object.
+        user (User, optional): The user requesting the archive.
+
+    Returns:
+        tuple: ``(archive_name, chunks)`` where ``chunks`` yields the archive
+        bytes, see ``apps.filestorage.archives.stream_zip``.
+    """
+    storage_service = get_storage_service()
+    files = [
+        file
+        for file in get_object_files(content_type_str, [object_id], user=user)
+        .select_related(None)
+        .order_by("created_at", "id")
+        if _document_id_for_url(storage_service, file.file) is not None
+    ]
+    archive_name = f"{get_content_type(content_type_str).model}-{object_id}.zip"
+    return archive_name, stream_zip(storage_service, files)
+
+
+def prefetch_files(objects, to_attr="prefetched_files"):
+    """
+    Load the live files for every object in ``objects`` with a single query.
+
+    Each object gets a list of its files (newest first) set as ``to_attr``;
+    objects without files get an empty list. Returns the objects as a list.
+    """
+    objects = list(objects)
+    files_by_parent = {}
+    queryset = (
+        Files.objects.for_objects(objects)
+        .select_related("uploaded_by")
+        .order_by("-created_at", "-id")
+    )
+    for file in queryset:
+        files_by_parent.setdefault((file.content_type_id, file.object_id), []).append(
+            file
+        )
+
+    content_types = ContentType.objects.get_for_models(
+        *{type(obj) for obj in objects}, for_concrete_models=False
+    )
+    for obj in objects:
+        key = (content_types[type(obj)].id, obj.pk)
+        setattr(obj, to_attr, files_by_parent.get(key, []))
+    return objects
+
+
 def delete_file_from_s3(key: str, user=None) -> None:
     """
-    Delete a file from the S3 bucket and its metadata from the Files table.
+    Mark a file as deleted; the stored object is removed later in the background.
+
+    Only the metadata row is touched in the request path. The storage object
+    and the row are purged in batches by the ``purge_deleted_files``
+    management command, see ``purge_deleted_files()``.
 
     Args:
         key (str): The S3 object key of the file to delete (e.g., 'uploads/example.jpg').
         user (User, optional): The user requesting the deletion, used for permission checks.
 
     Raises:
-        ValidationError: If the key is empty or the user lacks permission.
-        Exception: If the deletion from S3 or database fails.
+        ValidationError: If the key is empty, unknown, or the user lacks permission.
     """
     if not key:
         raise ValidationError("File key is required for deletion.")
 
-    try:
-        with transaction.atomic():
-            file_upload = Files.objects.filter(file=key).first()
-            if not file_upload:
-                logger.warning(f"No metadata found for key: {key}")
-            elif user and file_upload.uploaded_by != user:
-                raise ValidationError("You do not have permission to delete this file.")
-
-            # Delete from S3
-            storage_service = get_storage_service()
-            if hasattr(storage_service, "delete_object"):
-                storage_service.delete(document_id=key)
-                logger.info(f"Successfully deleted file from S3: {key}")
-            else:
-                logger.warning(f"Storage service does not support deletion: {key}")
-
-            # Delete metadata from Files table
-            deleted_count, _ = Files.objects.filter(id=key).delete()
-            if deleted_count > 0:
-                logger.info(f"Successfully deleted metadata for key: {key}")
-            else:
-                logger.warning(f"No metadata found for key: {key}")
-
-    except ClientError as e:
-        logger.error(f"Failed to delete file from S3: {key}, Error: {str(e)}")
-        raise Exception(f"Failed to delete file from S3: {str(e)}")
-    except ValidationError as e:
-        logger.error(f"Validation error during deletion: {key}, Error: {str(e)}")
-        raise
-    except Exception as e:
-        logger.error(f"Failed to delete file metadata: {key}, Error: {str(e)}")
-        raise Exception(f"Failed to delete file metadata: {str(e)}")
+    storage_service = get_storage_service()
+    # Content-addressed keys are shared, so pick the caller's own row.
+    files = Files.objects.filter(file__in={key, storage_service.get_url(key)})
+    file_upload = (files.filter(uploaded_by=user) if user else files).first()
+    if not file_upload and user and files.exists():
+        logger.error(f"Validation error during deletion: {key}, permission denied")
+        raise ValidationError("You do not have permission to delete this file.")
+    if not file_upload:
+        logger.warning(f"No metadata found for key: {key}")
+        raise ValidationError("File not found.")
+
+    soft_delete_files(Files.objects.filter(pk=file_upload.pk))
+    logger.info(f"Marked file for deletion: {key}")
+
+
+async def adelete_file(key: str, user=None) -> None:
+    """Async variant of ``delete_file_from_s3`` using the async ORM."""
+    if not key:
+        raise ValidationError("File key is required for deletion.")
+
+    storage_service = get_async_storage_service()
+    files = Files.objects.filter(file__in={key, storage_service.get_url(key)})
+    file_upload = await (files.filter(uploaded_by=user) if user else files).afirst()
+    if not file_upload and user and await files.aexists():
+        logger.error(f"Validation error during deletion: {key}, permission denied")
+        raise ValidationError("You do not have permission to delete this file.")
+    if not file_upload:
+        logger.warning(f"No metadata found for key: {key}")
+        raise ValidationError("File not found.")
+
+    await sync_to_async(soft_delete_files)(Files.objects.filter(pk=file_upload.pk))
+    logger.info(f"Marked file for deletion: {key}")
+
+
+def _plan_releases(storage_service, rows):
+    """
+    Sort rows about to be purged by what their storage object needs.
+
+    Returns ``(ids_by_key, released, decrements)``: rows that are the only
+    reference to their key (``None`` for URLs this backend did not produce),
+    the locked StoredObjects losing their last reference with the rows
+    holding them, and the StoredObjects that keep other references with
+    their new count and the rows to drop. Nothing is written yet.
+    """
+    rows_by_hash = {}
+    ids_by_key = {}
+    for pk, file_url, sha256 in rows:
+        if sha256:
+            rows_by_hash.setdefault(sha256, []).append((pk, file_url))
+        else:
+            document_id = _document_id_for_url(storage_service, file_url)
+            ids_by_key.setdefault(document_id, []).append(pk)
+
+    released = {}
+    decrements = []
+    stored_objects = StoredObject.objects.select_for_update().filter(
+        sha256__in=rows_by_hash
+    )
+    for stored in stored_objects:
+        pks = [pk for pk, _ in rows_by_hash.pop(stored.sha256)]
+        remaining = max(stored.ref_count - len(pks), 0)
+        if remaining:
+            decrements.append((stored, remaining, pks))
+        else:
+            released.setdefault(stored.document_id, []).append((stored, pks))
+
+    # Rows whose hash has no StoredObject are the only reference to their key.
+    for hash_rows in rows_by_hash.values():
+        for pk, file_url in hash_rows:
+            document_id = _document_id_for_url(storage_service, file_url)
+            ids_by_key.setdefault(document_id, []).append(pk)
+    return ids_by_key, released, decrements
+
+
+def _referenced_keys(storage_service, document_ids, releasing=()):
+    """
+    The keys among ``document_ids`` still used by a live row or a StoredObject.
+
+    StoredObjects whose hash is in ``releasing`` are about to go and do not
+    count.
+    """
+    document_ids = set(document_ids)
+    if not document_ids:
+        return set()
+    file_values = document_ids | {storage_service.get_url(key) for key in document_ids}
+    referenced = {
+        storage_service.get_document_id(file_url)
+        for file_url in Files.objects.filter(file__in=file_values).values_list(
+            "file", flat=True
+        )
+    }
+    referenced.update(
+        StoredObject.objects.filter(document_id__in=document_ids)
+        .exclude(sha256__in=releasing)
+        .values_list("document_id", flat=True)
+    )
+    return referenced & document_ids
+
+
+def _delete_objects(storage_service, document_ids, max_retries):
+    """Bulk delete with retries; returns the keys that could not be deleted."""
+    for attempt in range(max_retries + 1):
+        try:
+            return set(storage_service.delete_many(document_ids))
+        except ClientError as e:
+            if attempt == max_retries:
+                raise
+            delay = 2**attempt
+            logger.warning(f"Bulk delete failed ({e}), retrying in {delay}s")
+            time.sleep(delay)
+
+
+def purge_deleted_files(batch_size=1000, older_than=None, max_retries=3):
+    """
+    Hard-delete one batch of soft-deleted files and their storage objects.
+
+    Storage objects are removed first with one bulk call (S3 DeleteObjects,
+    or unlinks for the local backend); then, in the same transaction, every
+    row whose object is gone is removed with a single DELETE. If the storage
+    call keeps failing the transaction rolls back and every row and
+    reference is kept, so the purge is safe to repeat. Rows whose object
+    could not be deleted stay soft-deleted with ``purge_attempts`` raised,
+    which queues them behind rows that have not failed yet.
+
+    Content-addressed rows release their StoredObject reference instead; the
+    shared object is only deleted with its last reference. An object that a
+    live row or a StoredObject still points at is never deleted, nor is one
+    behind a URL this backend did not produce; such rows are purged and the
+    object is left alone. Cached presigned URLs of deleted objects are dropped.
+
+    Returns:
+        dict: ``{"selected", "purged", "failed", "seconds"}`` for the batch.
+    """
+    started = time.perf_counter()
+    queryset = Files.all_objects.filter(deleted_at__isnull=False)
+    if older_than is not None:
+        queryset = queryset.filter(deleted_at__lte=older_than)
+    storage_service = get_storage_service()
+
+    # StoredObjects stay locked until their rows are gone or the batch fails.
+    with transaction.atomic():
+        rows = list(
+            queryset.order_by("purge_attempts", "deleted_at", "id").values_list(
+                "id", "file", "sha256"
+            )[:batch_size]
+        )
+        if not rows:
+            return {"selected": 0, "purged": 0, "failed": 0, "seconds": 0.0}
+
+        ids_by_key, released, decrements = _plan_releases(storage_service, rows)
+        candidates = [key for key in ids_by_key if key is not None]
+        candidates += [key for key in released if key not in ids_by_key]
+        kept = _referenced_keys(
+            storage_service,
+            candidates,
+            releasing={
+                stored.sha256 for holders in released.values() for stored, _ in holders
+            },
+        )
+        to_delete = [key for key in candidates if key not in kept]
+        if kept:
+            logger.info(f"Keeping {len(kept)} objects still referenced by other rows")
+
+        failed_keys = _delete_objects(storage_service, to_delete, max_retries)
+        get_presign_cache().invalidate(
+            key for key in to_delete if key not in failed_keys
+        )
+
+        purge_ids = []
+        failed_ids = []
+        for document_id, pks in ids_by_key.items():
+            (failed_ids if document_id in failed_keys else purge_ids).extend(pks)
+        for document_id, holders in released.items():
+            for stored, pks in holders:
+                if document_id in failed_keys:
+                    failed_ids.extend(pks)
+                else:
+                    stored.delete()
+                    purge_ids.extend(pks)
+        for stored, remaining, pks in decrements:
+            stored.ref_count = remaining
+            stored.save(update_fields=["ref_count", "updated_at"])
+            purge_ids.extend(pks)
+
+        _, deleted = Files.all_objects.filter(
+            id__in=purge_ids, deleted_at__isnull=False
+        ).delete()
+        purged = deleted.get(Files._meta.label, 0)
+        Files.all_objects.filter(id__in=failed_ids).update(
+            purge_attempts=F("purge_attempts") + 1
+        )
+
+    if failed_keys:
+        logger.warning(f"Could not delete {len(failed_keys)} storage objects")
+    return {
+        "selected": len(rows),
+        "purged": purged,
+        "failed": len(failed_ids),
+        "seconds": time.perf_counter() - started,
+    }
+
+
+def _iter_recorded_keys(storage_service, prefix, start_after, chunk_size):
+    """Files rows under ``prefix`` as (key, id, live, created_at), in key order."""
+    base_url = storage_service.get_url("")
+    # Byte-wise ordering, so the database agrees with the storage listing.
+    collation = "C" if connection.vendor == "postgresql" else "BINARY"
+    queryset = Files.all_objects.alias(file_key=Collate("file", collation)).filter(
+        file__startswith=base_url + prefix
+    )
+    if start_after:
+        queryset = queryset.filter(file_key__gt=base_url + start_after)
+    rows = (
+        queryset.order_by("file_key", "id")
+        .values_list("file", "id", "deleted_at", "created_at")
+        .iterator(chunk_size=chunk_size)
+    )
+    for file_url, pk, deleted_at, created_at in rows:
+        yield file_url.removeprefix(base_url), pk, deleted_at is None, created_at
+
+
+def reconcile_storage(
+    prefix="", start_after="", grace=None, chunk_size=2000, checkpoint_every=10000
+):
+    """
+    Merge-join the storage listing against ``Files`` and yield mismatches.
+
+    Both sides are streamed in key order (S3 ``list_objects_v2`` pages or a
+    sorted walk of MEDIA_ROOT, and a server-side cursor over ``Files``), so
+    memory does not grow with the number of keys, except for the directory
+    listings of the local walk (see ``LocalStorageService.iter_objects``).
+
+    Yields:
+        tuple: ``("orphan", key)`` for objects without any row,
+        ``("dangling", key, file_id)`` for live rows without an object, and
+        ``("checkpoint", key)`` every ``checkpoint_every`` keys; everything up
+        to ``key`` has been reported, so pass it back as ``start_after`` to
+        resume.
+
+    Objects and rows younger than ``grace`` (a timedelta) are never reported,
+    so uploads that are still in progress are left alone.
+    """
+    storage_service = get_storage_service()
+    cutoff = timezone.now() - grace if grace else None
+    objects = storage_service.iter_objects(prefix=prefix, start_after=start_after)
+    records = _iter_recorded_keys(storage_service, prefix, start_after, chunk_size)
+    obj = next(objects, None)
+    record = next(records, None)
+    seen = 0
+
+    while obj is not None or record is not None:
+        if record is None or (obj is not None and obj[0] < record[0]):
+            key, last_modified = obj
+            if cutoff is None or last_modified <= cutoff:
+                yield ("orphan", key)
+            obj = next(objects, None)
+        elif obj is None or record[0] < obj[0]:
+            key, pk, live, created_at = record
+            if live and (cutoff is None or created_at <= cutoff):
+                yield ("dangling", key, pk)
+            record = next(records, None)
+        else:
+            key = obj[0]
+            while record is not None and record[0] == key:
+                record = next(records, None)
+            obj = next(objects, None)
+
+        seen += 1
+        # Rows sharing a key must all be behind the checkpoint.
+        if seen >= checkpoint_every and (record is None or record[0] != key):
+            yield ("checkpoint", key)
+            seen = 0
+
+
+def delete_orphaned_objects(keys):
+    """
+    Delete objects reported as orphans, re-checking them against the database.
+
+    A row may have been saved since the listing passed the key, so any key
+    whose URL a row (live, or soft-deleted and still restorable) or a
+    StoredObject points at is kept. Returns the number of objects deleted.
+    """
+    if not keys:
+        return 0
+    storage_service = get_storage_service()
+    keys_by_url = {storage_service.get_url(key): key for key in set(keys)}
+    # Live and soft-deleted rows are looked up separately so that each lookup
+    # is covered by a partial index on its side of deleted_at.
+    referenced = (
+        Files.objects.filter(file__in=keys_by_url)
+        .values_list("file", flat=True)
+        .union(
+            Files.all_objects.filter(
+                deleted_at__isnull=False, file__in=keys_by_url
+            ).values_list("file", flat=True)
+        )
+    )
+    kept = {keys_by_url[file_url] for file_url in referenced}
+    kept.update(
+        StoredObject.objects.filter(document_id__in=keys_by_url.values()).values_list(
+            "document_id", flat=True
+        )
+    )
+    to_delete = [key for key in keys_by_url.values() if key not in kept]
+    failed = set(storage_service.delete_many(to_delete))
+    get_presign_cache().invalidate(key for key in to_delete if key not in failed)
+    if failed:
+        logger.warning(f"Could not delete {len(failed)} orphaned objects")
+    return len(to_delete) - len(failed)
+
+
+def soft_delete_dangling_files(file_ids):
+    """Mark rows whose object is gone as deleted; returns the number marked."""
+    return soft_delete_files(Files.objects.filter(id__in=file_ids))
+
+
+def upload_file_content_addressed(file_obj):
+    """
+    Store a file under its SHA-256 through the local streaming path.
+
+    Returns the storage result (``document_id``, ``url``, ``sha256``,
+    ``size``, ``already_stored``); pass ``sha256`` on to
+    ``save_file_metadata`` to record the reference.
+    """
+    storage_service = get_storage_service()
+    if not hasattr(storage_service, "upload_content_addressed"):
+        raise ValidationError(
+            "The storage backend does not support content-addressed uploads."
+        )
+    return storage_service.upload_content_addressed(file_obj, _content_key)
 
 
 def generate_presigned_get_url(
@@ -126,6 +1343,9 @@ def generate_presigned_get_url(
     """
     Generate a presigned GET URL for accessing the S3 object.
 
+    URLs are served from the presign cache while enough of their lifetime
+    remains (see ``FILESTORAGE_PRESIGN_CACHE``).
+
     Args:
         file_url (str): The full S3 URL or S3 key (e.g., 'uploads/example.jpg').
         content_type (str): (Optional) The content type to return.
@@ -138,16 +1358,126 @@ def generate_presigned_get_url(
         raise ValueError("file_url is required.")
 
     storage_service = get_storage_service()
-
-    s3_key = file_url
-    if "amazonaws.com/" in file_url or ".com/" in file_url:
-        s3_key = file_url.split(".com/")[-1]
+    s3_key = storage_service.get_document_id(file_url)
 
     if hasattr(storage_service, "generate_presigned_get_url"):
-        return storage_service.generate_presigned_get_url(
-            document_id=s3_key, content_type=content_type, expires_in=expires_in
+        return get_presign_cache().get_or_sign(
+            s3_key,
+            content_type,
+            expires_in,
+            lambda: storage_service.generate_presigned_get_url(
+                document_id=s3_key, content_type=content_type, expires_in=expires_in
+            ),
         )
     else:
         raise NotImplementedError(
             "The storage backend does not support presigned GET URLs."
         )
+
+
+def get_local_download(file_id, user=None):
+    """
+    Resolve a file on the local backend for download after a permission check.
+
+    Only the uploader or an admin may download a file. The bytes themselves
+    are sent by the front proxy or ``os.sendfile``, see
+    ``apps.filestorage.downloads.build_file_response``.
+
+    Args:
+        file_id (int): Primary key of the ``Files`` row.
+        user (User, optional): The user requesting the download.
+
+    Returns:
+        dict: {'path': absolute_path, 'document_id': key, 'file_name': original_name}
+
+    Raises:
+        ValidationError: If the file is unknown, missing on disk, or the user
+            lacks permission.
+    """
+    storage_service = get_storage_service()
+    if not hasattr(storage_service, "get_path"):
+        raise ValidationError("The storage backend does not serve local downloads.")
+
+    file_upload = Files.objects.filter(pk=file_id).first()
+    if not file_upload:
+        raise ValidationError("File not found.")
+    if user and file_upload.uploaded_by_id != user.pk and not user.is_admin():
+        logger.error(f"Download denied for file {file_id}, permission denied")
+        raise ValidationError("You do not have permission to download this file.")
+
+    document_id = storage_service.get_document_id(file_upload.file)
+    path = os.path.realpath(storage_service.get_path(document_id))
+    # The URL is client-supplied at save time; never resolve outside uploads.
+    root = os.path.realpath(storage_service.get_path(""))
+    if os.path.commonpath([root, path]) != root or not os.path.isfile(path):
+        logger.warning(f"File {file_id} has no stored object at {path}")
+        raise ValidationError("File not found.")
+
+    return {
+        "path": path,
+        "document_id": document_id,
+        "file_name": file_upload.original_name or os.path.basename(document_id),
+    }
+
+
+def relocate_storage_keys(batch_size=1000, after_id=0, strategy=None, dry_run=False):
+    """
+    Move one batch of flat-keyed files to the layout of a key strategy.
+
+    Rows are walked in primary key order after ``after_id``, including
+    soft-deleted ones so the purge still finds their objects. Each object is
+    moved first and its rows are updated afterwards; moves are idempotent,
+    so a crash in between is repaired by running the batch again.
+
+    Args:
+        batch_size (int): Rows to examine.
+        after_id (int): Resume after this ``Files`` primary key.
+        strategy (str, optional): Key strategy name or dotted path, defaults
+            to ``FILESTORAGE_KEY_STRATEGY``.
+        dry_run (bool): Count what would move without touching anything.
+
+    Returns:
+        dict: {"selected", "relocated", "failed", "last_id", "seconds"}
+    """
+    started = time.perf_counter()
+    storage_service = get_storage_service()
+    if not hasattr(storage_service, "move"):
+        raise ValidationError("The storage backend does not support relocating keys.")
+    key_strategy = get_key_strategy(strategy)
+
+    rows = list(
+        Files.all_objects.filter(id__gt=after_id)
+        .order_by("id")
+        .only("id", "file", "created_at")[:batch_size]
+    )
+    new_urls = {}
+    updated = []
+    failed = 0
+    for row in rows:
+        if row.file not in new_urls:
+            document_id = storage_service.get_document_id(row.file)
+            new_id = None
+            if "://" not in document_id:
+                new_id = relocated_key(document_id, key_strategy, row.created_at)
+            if new_id is not None and not dry_run:
+                try:
+                    storage_service.move(document_id, new_id)
+                except (OSError, ValueError) as e:
+                    logger.error(f"Failed to relocate {document_id}: {e}")
+                    failed += 1
+                    new_id = None
+            new_urls[row.file] = new_id and storage_service.get_url(new_id)
+        if new_urls[row.file]:
+            row.file = new_urls[row.file]
+            updated.append(row)
+
+    if updated and not dry_run:
+        Files.all_objects.bulk_update(updated, ["file"], batch_size=500)
+
+    return {
+        "selected": len(rows),
+        "relocated": len(updated),
+        "failed": failed,
+        "last_id": rows[-1].id if rows else after_id,
+        "seconds": time.perf_counter() - started,
+    }
@@ -0,0 +1,235 @@
+import asyncio
+import logging
+import random
+import ssl
+from abc import ABC, abstractmethod
+from http.client import responses
+from urllib.parse import urlsplit
+
+from botocore.exceptions import ClientError
+from django.conf import settings
+
+from .s3 import MAX_SIZE_METADATA, recorded_max_size
+
+logger = logging.getLogger(__name__)
+
+HTTP_TIMEOUT = 10
+# Cap of the retry delay in seconds, as in botocore's standard retry mode.
+MAX_BACKOFF = 20
+_NO_BODY_STATUSES = {204, 304}
+
+
+def _backoff(attempt):
+    """Delay before retry ``attempt`` (1-based): exponential with full jitter."""
+    return min(random.random() * 2 ** (attempt - 1), MAX_BACKOFF)
+
+
+def _client_error(operation, status, headers):
+    """A ClientError like botocore's for an error response without a body."""
+    return ClientError(
+        {
+            "Error": {"Code": str(status), "Message": responses.get(status, "")},
+            "ResponseMetadata": {"HTTPStatusCode": status, "HTTPHeaders": headers},
+        },
+        operation,
+    )
+
+
+class AsyncHTTPConnectionPool:
+    """
+    Keep-alive HTTP/1.1 connections to a single origin, on asyncio streams.
+
+    Only what presigned S3 requests need: no request bodies, and response
+    bodies are read and discarded. A pool belongs to one event loop.
+    """
+
+    def __init__(self, scheme, host, port, max_idle=32, timeout=HTTP_TIMEOUT):
+        self.host = host
+        self.port = port or (443 if scheme == "https" else 80)
+        self.ssl = ssl.create_default_context() if scheme == "https" else None
+        self.max_idle = max_idle
+        self.timeout = timeout
+        self._idle = []
+
+    async def request(self, method, target, host_header):
+        """Send a request and return ``(status, headers)`` with lowercase names."""
+        while self._idle:
+            # Idle connections may have been closed by the server meanwhile.
+            reader, writer = self._idle.pop()
+            try:
+                return await self._send(reader, writer, method, target, host_header)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                writer.close()
+
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port, ssl=self.ssl),
+            self.timeout,
+        )
+        return await self._send(reader, writer, method, target, host_header)
+
+    async def close(self):
+        while self._idle:
+            _, writer = self._idle.pop()
+            writer.close()
+
+    async def _send(self, reader, writer, method, target, host_header):
+        try:
+            writer.write(
+                f"{method} {target} HTTP/1.1\r\nHost: {host_header}\r\n"
+                f"Content-Length: 0\r\n\r\n".encode("latin-1")
+            )
+            status, headers, reusable = await asyncio.wait_for(
+                self._read_response(reader, method), self.timeout
+            )
+        except BaseException:
+            writer.close()
+            raise
+
+        if reusable and len(self._idle) < self.max_idle:
+            self._idle.append((reader, writer))
+        else:
+            writer.close()
+        return status, headers
+
+    async def _read_response(self, reader, method):
+        # Interim 1xx responses (e.g. 100 Continue) come before the final one.
+        status = 100
+        while status < 200:
+            version, status, headers = await self._read_head(reader)
+            if status == 101:
+                raise ConnectionError("Unexpected 101 Switching Protocols")
+
+        reusable = (
+            version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+        )
+        if method == "HEAD" or status in _NO_BODY_STATUSES:
+            return status, headers, reusable
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            while True:
+                size = int((await reader.readuntil(b"\r\n")).split(b";")[0], 16)
+                await reader.readexactly(size + 2)
+                if size == 0:
+                    break
+        elif "content-length" in headers:
+            await reader.readexactly(int(headers["content-length"]))
+        else:
+            await reader.read()
+            reusable = False
+        return status, headers, reusable
+
+    async def _read_head(self, reader):
+        """Read a status line and headers: ``(version, status, headers)``."""
+        status_line = await reader.readuntil(b"\r\n")
+        version, status = status_line.decode("latin-1").split(" ", 2)[:2]
+
+        headers = {}
+        while True:
+            line = await reader.readuntil(b"\r\n")
+            if line == b"\r\n":
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        return version, int(status), headers
+
+
+class AsyncStorageService(ABC):
+    """
+    Async counterpart of ``StorageService`` for ASGI views.
+
+    Wraps the process's synchronous backend for the parts that never block
+    (URLs, key parsing, presigning) and implements network and disk access
+    without tying up a thread.
+    """
+
+    def __init__(self, sync_service):
+        self.sync_service = sync_service
+
+    def get_url(self, document_id):
+        return self.sync_service.get_url(document_id)
+
+    def get_document_id(self, file_url):
+        return self.sync_service.get_document_id(file_url)
+
+    @abstractmethod
+    async def stat(self, document_id):
+        """Like ``StorageService.stat``: metadata dict, or None if missing."""
+
+    async def close(self):
+        pass
+
+
+class AsyncLocalStorageService(AsyncStorageService):
+    async def stat(self, document_id):
+        # A single stat on local disk; not worth a thread hop.
+        return self.sync_service.stat(document_id)
+
+
+class AsyncS3StorageService(AsyncStorageService):
+    """
+    Non-blocking S3 access using the backend's SigV4 signer.
+
+    Requests are presigned locally (no I/O) and sent over a keep-alive
+    connection pool on the running event loop, so a slow S3 response only
+    holds a coroutine, not a worker thread. Connection errors, timeouts and
+    5xx responses are retried with backoff, up to ``AWS_S3_MAX_ATTEMPTS``
+    attempts in all like the boto3 client. Error responses that are not
+    retried, or still fail on the last attempt, raise botocore's ClientError
+    as the boto3 client would.
+    """
+
+    def __init__(self, sync_service):
+        super().__init__(sync_service)
+        self._pools = {}
+
+    async def generate_presigned_post_url(self, document_id, content_type, **kwargs):
+        # Signing is CPU-only and takes microseconds.
+        return self.sync_service.generate_presigned_post_url(
+            document_id, content_type, **kwargs
+        )
+
+    async def stat(self, document_id):
+        status, headers = await self._request("HEAD", document_id)
+        if status == 404:
+            return None
+        if status != 200:
+            raise _client_error("HeadObject", status, headers)
+        return {
+            "size": int(headers.get("content-length", 0)),
+            "etag": headers.get("etag", "").strip('"'),
+            "content_type": headers.get("content-type", ""),
+            "max_size": recorded_max_size(
+                headers.get(f"x-amz-meta-{MAX_SIZE_METADATA}")
+            ),
+        }
+
+    async def close(self):
+        for pool in self._pools.values():
+            await pool.close()
+        self._pools.clear()
+
+    async def _request(self, method, document_id):
+        max_attempts = max(getattr(settings, "AWS_S3_MAX_ATTEMPTS", 3), 1)
+        for attempt in range(1, max_attempts + 1):
+            # Signed per attempt so a late retry does not reuse an old timestamp.
+            url = urlsplit(self.sync_service.signer.presign_url(method, document_id))
+            origin = (url.scheme, url.hostname, url.port)
+            pool = self._pools.get(origin)
+            if pool is None:
+                pool = self._pools[origin] = AsyncHTTPConnectionPool(*origin)
+            try:
+                status, headers = await pool.request(
+                    method, f"{url.path}?{url.query}", url.netloc
+                )
+            except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError) as e:
+                if attempt == max_attempts:
+                    raise
+                error = repr(e)
+            else:
+                if status < 500 or attempt == max_attempts:
+                    return status, headers
+                error = f"status {status}"
+            delay = _backoff(attempt)
+            logger.warning(
+                f"{method} {document_id} failed ({error}), retrying in {delay:.2f}s"
+            )
+            await asyncio.sleep(delay)
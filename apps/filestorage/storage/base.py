@@ -9,3 +9,55 @@ class StorageService(ABC):
     @abstractmethod
     def delete(self, document_id) -> None:
         pass
+
+    @abstractmethod
+    def get_url(self, document_id) -> str:
+        pass
+
+    def get_document_id(self, file_url) -> str:
+        """Map a stored file URL back to its storage key."""
+        return file_url.removeprefix(self.get_url(""))
+
+    def delete_many(self, document_ids) -> list:
+        """
+        Delete several objects, returning the keys that could not be deleted.
+
+        Deleting a key that no longer exists counts as a success so that a
+        batch can be retried safely.
+        """
+        failed = []
+        for document_id in document_ids:
+            try:
+                self.delete(document_id)
+            except Exception:
+                failed.append(document_id)
+        return failed
+
+    def open(self, document_id):
+        """
+        Open a stored object for streaming reads.
+
+        Returns:
+            tuple: ``(stream, size)`` where ``stream`` has ``read(n)`` and
+            ``close()``.
+        """
+        raise NotImplementedError("The storage backend does not support reads.")
+
+    def iter_objects(self, prefix="", start_after=""):
+        """
+        Yield ``(document_id, last_modified)`` for stored objects in key order.
+
+        Keys are ordered by code point (the same as UTF-8 byte order, which is
+        what S3 uses), start with ``prefix`` and sort after ``start_after``.
+        """
+        raise NotImplementedError("The storage backend does not support listing.")
+
+    def stat(self, document_id):
+        """
+        Metadata of a stored object, or None if it does not exist.
+
+        Returns:
+            dict: ``{"size", "etag", "content_type"}``, plus ``"max_size"``
+            on backends that record the size cap an upload was presigned with.
+        """
+        raise NotImplementedError("The storage backend does not support stat.")
@@ -1,11 +1,125 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+import weakref
+
 from django.conf import settings
 
+from apps.filestorage.storage.aio import (
+    AsyncLocalStorageService,
+    AsyncS3StorageService,
+    AsyncStorageService,
+)
 from apps.filestorage.storage.local import LocalStorageService
 from apps.filestorage.storage.s3 import S3StorageService
 
+logger = logging.getLogger(__name__)
+
+STORAGE_BACKENDS = {
+    "local": LocalStorageService,
+    "s3": S3StorageService,
+}
+
+ASYNC_STORAGE_BACKENDS = {
+    "local": AsyncLocalStorageService,
+    "s3": AsyncS3StorageService,
+}
+
+
+class StorageRegistry:
+    """
+    Per-process registry that builds each storage backend once and reuses it.
+
+    boto3 clients are thread-safe, so a single S3StorageService (and its
+    connection pool) can be shared by every request thread in a worker.
+    Clients must not cross a fork though, so the registry is dropped in the
+    child process and rebuilt lazily on first use.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._services = {}
+        self._stats = {}
+        self._pid = os.getpid()
+
+    def get(self, backend):
+        self._check_pid()
+        # Held for the reuse count too; an unlocked += loses concurrent updates.
+        with self._lock:
+            service = self._services.get(backend)
+            if service is None:
+                service_class = STORAGE_BACKENDS.get(backend, LocalStorageService)
+                started = time.perf_counter()
+                service = service_class()
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                self._services[backend] = service
+                self._stats[backend] = {
+                    "construction_ms": round(elapsed_ms, 3),
+                    "reuse_count": 0,
+                    "pid": self._pid,
+                }
+                logger.info(
+                    f"Built '{backend}' storage backend in {elapsed_ms:.1f}ms "
+                    f"(pid {self._pid})"
+                )
+            else:
+                self._stats[backend]["reuse_count"] += 1
+        return service
+
+    def reset(self):
+        with self._lock:
+            self._services.clear()
+            self._stats.clear()
+            self._pid = os.getpid()
+
+    def stats(self):
+        with self._lock:
+            return {backend: dict(values) for backend, values in self._stats.items()}
+
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            self.reset()
+
+
+_registry = StorageRegistry()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_registry.reset)
+
 
 def get_storage_service():
     storage_backend = getattr(settings, "STORAGE_BACKEND", "local")
-    if storage_backend == "s3":
-        return S3StorageService()
-    return LocalStorageService()
+    return _registry.get(storage_backend)
+
+
+# Async backends hold connections bound to one event loop, so one per loop.
+_async_services: weakref.WeakKeyDictionary[
+    asyncio.AbstractEventLoop, AsyncStorageService
+] = weakref.WeakKeyDictionary()
+
+
+def get_async_storage_service():
+    """Async wrapper of the configured backend for the running event loop."""
+    loop = asyncio.get_running_loop()
+    service = _async_services.get(loop)
+    if service is None:
+        storage_backend = getattr(settings, "STORAGE_BACKEND", "local")
+        service_class = ASYNC_STORAGE_BACKENDS.get(
+            storage_backend, AsyncLocalStorageService
+        )
+        service = service_class(get_storage_service())
+        _async_services[loop] = service
+    return service
+
+
+def get_storage_stats():
+    """Construction time and reuse counts for each backend built in this process."""
+    return _registry.stats()
+
+
+def reset_storage_services():
+    """Drop cached backends, e.g. after changing storage settings in tests."""
+    _registry.reset()
+    _async_services.clear()
@@ -1,38 +1,224 @@
+import contextlib
+import hashlib
+import mimetypes
 import os
+import tempfile
+from datetime import datetime, timezone
 
 from django.conf import settings
-from django.core.files.storage import default_storage
 
 from .base import StorageService
 
 
 class LocalStorageService(StorageService):
-    def upload(self, file_obj, document_id):
-        # Prefix document_id with 'uploads/' to store in media/uploads/
-        prefixed_key = os.path.join("uploads", document_id)
-        path = os.path.join(settings.MEDIA_ROOT, prefixed_key)
+    def upload(self, file_obj, document_id, hash_algorithm=None):
+        """
+        Stream ``file_obj`` to MEDIA_ROOT/uploads/<document_id>.
 
-        # Ensure the directory exists
-        os.makedirs(os.path.dirname(path), exist_ok=True)
+        Data is copied in ``FILESTORAGE_LOCAL_BUFFER_SIZE`` chunks into a
+        temporary file next to the destination, fsync'd, and renamed into
+        place, so memory stays bounded and a crash never leaves a partial
+        file under the final name. Pass ``hash_algorithm`` (e.g. "sha256")
+        to hash the stream while it is written.
+        """
+        path = self.get_path(document_id)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
 
-        with default_storage.open(prefixed_key, "wb+") as destination:
-            if hasattr(file_obj, "chunks"):
-                for chunk in file_obj.chunks():
+        digest = hashlib.new(hash_algorithm) if hash_algorithm else None
+        temp_path, size = self._write_temp_file(file_obj, directory, digest)
+        self._commit_temp_file(temp_path, path)
+
+        result = {
+            "url": self.get_url(document_id),
+            "document_id": document_id,
+            "size": size,
+        }
+        if digest is not None:
+            result[hash_algorithm] = digest.hexdigest()
+        return result
+
+    def upload_content_addressed(self, file_obj, key_for_digest):
+        """
+        Stream ``file_obj`` and store it under a key derived from its SHA-256.
+
+        ``key_for_digest`` maps the hex digest to a document_id. If an object
+        already exists under that key the new copy is discarded.
+        """
+        staging = os.path.join(settings.MEDIA_ROOT, "uploads")
+        os.makedirs(staging, exist_ok=True)
+        digest = hashlib.sha256()
+        temp_path, size = self._write_temp_file(file_obj, staging, digest)
+
+        document_id = key_for_digest(digest.hexdigest())
+        path = self.get_path(document_id)
+        already_stored = os.path.exists(path)
+        if already_stored:
+            os.unlink(temp_path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._commit_temp_file(temp_path, path)
+
+        return {
+            "url": self.get_url(document_id),
+            "document_id": document_id,
+            "size": size,
+            "sha256": digest.hexdigest(),
+            "already_stored": already_stored,
+        }
+
+    def _write_temp_file(self, file_obj, directory, digest=None):
+        buffer_size = getattr(settings, "FILESTORAGE_LOCAL_BUFFER_SIZE", 1024 * 1024)
+        size = 0
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".upload-")
+        try:
+            with os.fdopen(fd, "wb", buffering=0) as destination:
+                for chunk in self._iter_chunks(file_obj, buffer_size):
                     destination.write(chunk)
-            else:
-                destination.write(file_obj.read())
+                    size += len(chunk)
+                    if digest is not None:
+                        digest.update(chunk)
+                destination.flush()
+                os.fsync(destination.fileno())
+            os.chmod(temp_path, settings.FILE_UPLOAD_PERMISSIONS or 0o644)
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(temp_path)
+            raise
+        return temp_path, size
+
+    def _commit_temp_file(self, temp_path, path):
+        try:
+            os.replace(temp_path, path)
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(temp_path)
+            raise
+        self._fsync_directory(os.path.dirname(path))
 
+    def get_path(self, document_id):
+        return os.path.join(settings.MEDIA_ROOT, "uploads", document_id)
+
+    def _contained_path(self, document_id):
+        """Resolved path of a key, refusing any that lands outside uploads."""
+        root = os.path.realpath(self.get_path(""))
+        path = os.path.realpath(self.get_path(document_id))
+        if os.path.commonpath([root, path]) != root:
+            raise ValueError("Storage keys must stay inside the uploads directory.")
+        return path
+
+    @staticmethod
+    def _iter_chunks(file_obj, buffer_size):
+        if hasattr(file_obj, "chunks"):
+            yield from file_obj.chunks(chunk_size=buffer_size)
+            return
+        while True:
+            chunk = file_obj.read(buffer_size)
+            if not chunk:
+                return
+            yield chunk
+
+    @staticmethod
+    def _fsync_directory(directory):
+        # Persist the rename itself; not supported on every platform.
+        with contextlib.suppress(OSError):
+            dir_fd = os.open(directory, os.O_RDONLY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+
+    def get_url(self, document_id):
         scheme = "https" if getattr(settings, "USE_HTTPS", False) else "http"
         domain = getattr(settings, "DOMAIN", "localhost:8000")
-        url_path = f"{settings.MEDIA_URL}{prefixed_key}"
+        return f"{scheme}://{domain}{settings.MEDIA_URL}uploads/{document_id}"
+
+    def open(self, document_id):
+        stream = open(self._contained_path(document_id), "rb")
+        return stream, os.fstat(stream.fileno()).st_size
 
+    def stat(self, document_id):
+        try:
+            stat = os.stat(self.get_path(document_id))
+        except FileNotFoundError:
+            return None
         return {
-            "url": f"{scheme}://{domain}{url_path}",
-            "document_id": document_id,
+            "size": stat.st_size,
+            "etag": f"{stat.st_size:x}-{stat.st_mtime_ns:x}",
+            "content_type": mimetypes.guess_type(document_id)[0]
+            or "application/octet-stream",
         }
 
+    def iter_objects(self, prefix="", start_after=""):
+        """
+        Walk MEDIA_ROOT/uploads in key order, skipping in-progress temp files.
+
+        Each directory is listed and sorted in full before it is walked, and
+        the listings of its ancestors stay in memory meanwhile, so memory grows
+        with the largest directory: with the flat layout that is every object
+        under a folder prefix, with "hash" about 1/65,536 of them.
+        Subtrees that lie entirely before ``start_after`` or outside
+        ``prefix`` are skipped without being read.
+        """
+        yield from self._walk(self.get_path(""), "", prefix, start_after)
+
+    def _walk(self, directory, base, prefix, start_after):
+        try:
+            with os.scandir(directory) as iterator:
+                entries = list(iterator)
+        except FileNotFoundError:
+            return
+        # "a/x" sorts after "a-b", so compare directories by "name/".
+        entries.sort(
+            key=lambda entry: (
+                f"{entry.name}/" if entry.is_dir(follow_symlinks=False) else entry.name
+            )
+        )
+        for entry in entries:
+            key = base + entry.name
+            if entry.is_dir(follow_symlinks=False):
+                subtree = f"{key}/"
+                if subtree < start_after and not start_after.startswith(subtree):
+                    continue
+                if not (subtree.startswith(prefix) or prefix.startswith(subtree)):
+                    continue
+                yield from self._walk(entry.path, subtree, prefix, start_after)
+            elif (
+                key > start_after
+                and key.startswith(prefix)
+                and not entry.name.startswith(".upload-")
+            ):
+                modified = entry.stat(follow_symlinks=False).st_mtime
+                yield key, datetime.fromtimestamp(modified, tz=timezone.utc)
+
+    def move(self, source_id, target_id):
+        """
+        Rename an object to a new key inside MEDIA_ROOT/uploads.
+
+        Moving an object that is already at ``target_id`` is a no-op, so an
+        interrupted relocation can simply be run again.
+        """
+        source = self._contained_path(source_id)
+        target = self._contained_path(target_id)
+        if not os.path.exists(source) and os.path.exists(target):
+            return
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(source, target)
+        self._fsync_directory(os.path.dirname(target))
+
     def delete(self, document_id):
-        prefixed_key = os.path.join("uploads", document_id)
-        path = os.path.join(settings.MEDIA_ROOT, prefixed_key)
+        path = self._contained_path(document_id)
         if os.path.exists(path):
             os.remove(path)
+
+    def delete_many(self, document_ids):
+        """Unlink objects; keys resolving outside uploads are reported as failed."""
+        failed = []
+        for document_id in document_ids:
+            try:
+                os.unlink(self._contained_path(document_id))
+            except FileNotFoundError:
+                pass
+            except (OSError, ValueError):
+                failed.append(document_id)
+        return failed
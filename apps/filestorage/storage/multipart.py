@@ -0,0 +1,174 @@
+import hashlib
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+logger = logging.getLogger(__name__)
+
+MIN_PART_SIZE = 5 * 1024 * 1024
+MAX_PARTS = 10000
+
+
+def _same_content(part, chunk):
+    """Whether a listed part holds ``chunk``; a part's ETag is its MD5."""
+    if part["Size"] != len(chunk):
+        return False
+    md5 = hashlib.md5(chunk, usedforsecurity=False).hexdigest()
+    return part["ETag"].strip('"') == md5
+
+
+class MultipartUploadError(Exception):
+    """
+    Raised when a multipart upload fails part-way.
+
+    The upload is left open on S3 so it can be resumed by passing
+    ``upload_id`` back to ``MultipartUploader.upload``; parts that were
+    already stored with the same content are skipped.
+    """
+
+    def __init__(self, message, upload_id):
+        super().__init__(message)
+        self.upload_id = upload_id
+
+
+class MultipartUploader:
+    """
+    Uploads streams to S3 in parallel parts on a shared, bounded executor.
+
+    One uploader (and one executor) exists per S3StorageService, i.e. per
+    worker process, so concurrent uploads share ``max_concurrency`` threads
+    instead of each starting their own pool. Each upload also keeps at most
+    ``max_concurrency`` parts in memory at a time.
+    """
+
+    def __init__(self, client, bucket, part_size, max_concurrency):
+        self.client = client
+        self.bucket = bucket
+        self.part_size = max(part_size, MIN_PART_SIZE)
+        self.max_concurrency = max_concurrency
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_concurrency, thread_name_prefix="s3-multipart"
+        )
+
+    def upload(
+        self,
+        file_obj,
+        key,
+        upload_id=None,
+        progress_callback=None,
+        content_type=None,
+    ):
+        """
+        Upload ``file_obj`` to ``key`` and return transfer statistics.
+
+        Args:
+            file_obj: A readable binary stream.
+            key (str): Destination object key.
+            upload_id (str, optional): Resume this multipart upload.
+            progress_callback (callable, optional): Called with the number of
+                bytes stored after each part completes.
+            content_type (str, optional): ContentType of the new object. Only
+                used when starting an upload; a resumed one keeps its own.
+
+        Returns:
+            dict: ``{"upload_id", "size", "parts", "seconds", "mb_per_second"}``.
+        """
+        started = time.perf_counter()
+        if upload_id is None:
+            extra = {"ContentType": content_type} if content_type else {}
+            upload_id = self.client.create_multipart_upload(
+                Bucket=self.bucket, Key=key, **extra
+            )["UploadId"]
+            stored_parts = {}
+        else:
+            stored_parts = self.list_parts(key, upload_id)
+
+        completed = []
+        pending = set()
+        size = 0
+        part_number = 0
+        try:
+            while True:
+                chunk = file_obj.read(self.part_size)
+                if not chunk and part_number:
+                    break
+                part_number += 1
+                size += len(chunk)
+
+                stored = stored_parts.get(part_number)
+                if stored and _same_content(stored, chunk):
+                    completed.append(
+                        {"PartNumber": part_number, "ETag": stored["ETag"]}
+                    )
+                else:
+                    if len(pending) >= self.max_concurrency:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        completed.extend(f.result() for f in done)
+                    pending.add(
+                        self._executor.submit(
+                            self._upload_part,
+                            key,
+                            upload_id,
+                            part_number,
+                            chunk,
+                            progress_callback,
+                        )
+                    )
+                if not chunk:
+                    break
+
+            completed.extend(f.result() for f in wait(pending).done)
+            completed.sort(key=lambda part: part["PartNumber"])
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket,
+                Key=key,
+                UploadId=upload_id,
+                MultipartUpload={"Parts": completed},
+            )
+        except Exception as e:
+            # Let parts already in flight finish so a resume can skip them.
+            for future in pending:
+                future.cancel()
+            wait(pending)
+            logger.error(f"Multipart upload failed: {key}, upload id {upload_id}: {e}")
+            raise MultipartUploadError(str(e), upload_id) from e
+
+        seconds = time.perf_counter() - started
+        mb_per_second = size / (1024 * 1024) / seconds if seconds else 0.0
+        logger.info(
+            f"Uploaded {key}: {size} bytes in {len(completed)} parts, "
+            f"{seconds:.2f}s ({mb_per_second:.1f} MB/s)"
+        )
+        return {
+            "upload_id": upload_id,
+            "size": size,
+            "parts": len(completed),
+            "seconds": seconds,
+            "mb_per_second": mb_per_second,
+        }
+
+    def list_parts(self, key, upload_id):
+        """Parts already stored for an upload, keyed by part number."""
+        paginator = self.client.get_paginator("list_parts")
+        parts = {}
+        for page in paginator.paginate(Bucket=self.bucket, Key=key, UploadId=upload_id):
+            for part in page.get("Parts", []):
+                parts[part["PartNumber"]] = part
+        return parts
+
+    def abort(self, key, upload_id):
+        self.client.abort_multipart_upload(
+            Bucket=self.bucket, Key=key, UploadId=upload_id
+        )
+
+    def _upload_part(self, key, upload_id, part_number, body, progress_callback):
+        response = self.client.upload_part(
+            Bucket=self.bucket,
+            Key=key,
+            UploadId=upload_id,
+            PartNumber=part_number,
+            Body=body,
+        )
+        if progress_callback is not None:
+            progress_callback(len(body))
+        return {"PartNumber": part_number, "ETag": response["ETag"]}
@@ -1,48 +1,191 @@
+from functools import cached_property
+
 import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
 from django.conf import settings
 
 from .base import StorageService
+from .multipart import MultipartUploader
+from .signer import SigV4Signer
+
+DELETE_OBJECTS_MAX_KEYS = 1000
+DEFAULT_MAX_UPLOAD_SIZE = 10 * 1024 * 1024  # 10 mb
+# Object metadata holding the size cap an upload was presigned with.
+MAX_SIZE_METADATA = "max-upload-size"
+
+
+def recorded_max_size(value):
+    """Parse the ``MAX_SIZE_METADATA`` value of an object; None if unset."""
+    return int(value) if value and value.isdigit() else None
+
+
+def get_client_config():
+    """Connection pool and retry settings shared by every S3 client we build."""
+    return Config(
+        signature_version="s3v4",
+        max_pool_connections=getattr(settings, "AWS_S3_MAX_POOL_CONNECTIONS", 50),
+        tcp_keepalive=getattr(settings, "AWS_S3_TCP_KEEPALIVE", True),
+        retries={
+            "mode": getattr(settings, "AWS_S3_RETRY_MODE", "standard"),
+            "max_attempts": getattr(settings, "AWS_S3_MAX_ATTEMPTS", 3),
+        },
+    )
 
 
 class S3StorageService(StorageService):
     def __init__(self):
-        self.s3 = boto3.client(
-            "s3",
+        session = boto3.session.Session(
             aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
             aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
             region_name=settings.AWS_S3_REGION_NAME,
         )
+        self.s3 = session.client("s3", config=get_client_config())
         self.bucket = settings.AWS_STORAGE_BUCKET_NAME
         self.custom_domain = settings.AWS_S3_CUSTOM_DOMAIN
+        self.signer = SigV4Signer(self.s3, self.bucket, session.get_credentials())
 
-    def upload(self, file_obj, document_id):
-        self.s3.upload_fileobj(file_obj, self.bucket, document_id)
-        url = f"{self.custom_domain}/{document_id}"
-        return {
-            "url": url,
+    @cached_property
+    def multipart(self):
+        return MultipartUploader(
+            self.s3,
+            self.bucket,
+            part_size=getattr(settings, "AWS_S3_MULTIPART_PART_SIZE", 8 * 1024 * 1024),
+            max_concurrency=getattr(settings, "AWS_S3_MAX_CONCURRENCY", 4),
+        )
+
+    def upload(
+        self,
+        file_obj,
+        document_id,
+        upload_id=None,
+        progress_callback=None,
+        content_type=None,
+    ):
+        """
+        Upload a file, switching to a parallel multipart upload for large input.
+
+        Inputs of unknown size, at least ``AWS_S3_MULTIPART_THRESHOLD`` bytes,
+        or resuming an ``upload_id`` go through ``MultipartUploader``;
+        everything else is a single PutObject. ``content_type`` is stored as
+        the object's ContentType.
+        """
+        threshold = getattr(settings, "AWS_S3_MULTIPART_THRESHOLD", 8 * 1024 * 1024)
+        size = getattr(file_obj, "size", None)
+        result = {
+            "url": self.get_url(document_id),
             "document_id": document_id,
         }
 
+        if upload_id is None and size is not None and size < threshold:
+            extra = {"ContentType": content_type} if content_type else {}
+            self.s3.put_object(
+                Bucket=self.bucket, Key=document_id, Body=file_obj.read(), **extra
+            )
+            if progress_callback is not None:
+                progress_callback(size)
+            return result
+
+        result.update(
+            self.multipart.upload(
+                file_obj,
+                document_id,
+                upload_id=upload_id,
+                progress_callback=progress_callback,
+                content_type=content_type,
+            )
+        )
+        return result
+
+    def get_url(self, document_id):
+        return f"{self.custom_domain}/{document_id}"
+
+    def get_document_id(self, file_url):
+        document_id = super().get_document_id(file_url)
+        if "amazonaws.com/" in document_id or ".com/" in document_id:
+            document_id = document_id.split(".com/")[-1]
+        return document_id
+
+    def open(self, document_id):
+        response = self.s3.get_object(Bucket=self.bucket, Key=document_id)
+        return response["Body"], response["ContentLength"]
+
+    def stat(self, document_id):
+        try:
+            response = self.s3.head_object(Bucket=self.bucket, Key=document_id)
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+        return {
+            "size": response["ContentLength"],
+            "etag": response["ETag"].strip('"'),
+            "content_type": response.get("ContentType", ""),
+            "max_size": recorded_max_size(
+                response.get("Metadata", {}).get(MAX_SIZE_METADATA)
+            ),
+        }
+
+    def iter_objects(self, prefix="", start_after=""):
+        paginator = self.s3.get_paginator("list_objects_v2")
+        params = {"Bucket": self.bucket, "Prefix": prefix}
+        if start_after:
+            params["StartAfter"] = start_after
+        for page in paginator.paginate(**params):
+            for obj in page.get("Contents", []):
+                yield obj["Key"], obj["LastModified"]
+
     def delete(self, document_id):
         self.s3.delete_object(Bucket=self.bucket, Key=document_id)
 
-    def generate_presigned_post_url(self, document_id, content_type, expires_in=3600):
-        presigned_post = self.s3.generate_presigned_post(
-            Bucket=self.bucket,
-            Key=document_id,
-            Fields={"Content-Type": content_type},
-            Conditions=[
+    def delete_many(self, document_ids):
+        """Delete objects with DeleteObjects, up to 1000 keys per request."""
+        failed = []
+        document_ids = list(document_ids)
+        while document_ids:
+            batch = document_ids[:DELETE_OBJECTS_MAX_KEYS]
+            document_ids = document_ids[DELETE_OBJECTS_MAX_KEYS:]
+            response = self.s3.delete_objects(
+                Bucket=self.bucket,
+                Delete={
+                    "Objects": [{"Key": document_id} for document_id in batch],
+                    "Quiet": True,
+                },
+            )
+            failed.extend(error["Key"] for error in response.get("Errors", []))
+        return failed
+
+    def generate_presigned_post_url(
+        self,
+        document_id,
+        content_type,
+        expires_in=3600,
+        max_size=DEFAULT_MAX_UPLOAD_SIZE,
+    ):
+        """
+        Presign a POST upload of at most ``max_size`` bytes.
+
+        The cap is also stored with the object as metadata (fixed by the
+        policy), so it can be checked after the upload without knowing
+        which folder the key was presigned for.
+        """
+        max_size_field = f"x-amz-meta-{MAX_SIZE_METADATA}"
+        presigned_post = self.signer.presign_post(
+            document_id,
+            fields={"Content-Type": content_type, max_size_field: str(max_size)},
+            conditions=[
                 {"Content-Type": content_type},
-                ["content-length-range", 0, 10 * 1024 * 1024],  # 10 mb
+                {max_size_field: str(max_size)},
+                ["content-length-range", 0, max_size],
             ],
-            ExpiresIn=expires_in,
+            expires_in=expires_in,
         )
 
         return {
             "upload_url": presigned_post["url"],
             "fields": presigned_post["fields"],
             "document_id": document_id,
-            "file_url": f"{self.custom_domain}/{document_id}",
+            "file_url": self.get_url(document_id),
         }
 
     def generate_presigned_get_url(
@@ -59,16 +202,56 @@ class S3StorageService(StorageService):
         Returns:
             dict: Contains the presigned URL and document ID.
         """
-        presigned_url = self.s3.generate_presigned_url(
-            ClientMethod="get_object",
-            Params={
-                "Bucket": self.bucket,
-                "Key": document_id,
-                "ResponseContentType": content_type,
-            },
-            ExpiresIn=expires_in,
+        presigned_url = self.signer.presign_get(
+            document_id,
+            query_params={"response-content-type": content_type},
+            expires_in=expires_in,
         )
         return {
             "file_url": presigned_url,
             "document_id": document_id,
         }
+
+    def create_multipart_upload(self, document_id, content_type, max_size=None):
+        extra = {"Metadata": {MAX_SIZE_METADATA: str(max_size)}} if max_size else {}
+        response = self.s3.create_multipart_upload(
+            Bucket=self.bucket, Key=document_id, ContentType=content_type, **extra
+        )
+        return response["UploadId"]
+
+    def generate_presigned_part_urls(
+        self, document_id, upload_id, part_numbers, expires_in=3600
+    ):
+        """Presigned UploadPart (PUT) URLs, one per requested part number."""
+        return [
+            {
+                "part_number": part_number,
+                "upload_url": self.signer.presign_url(
+                    "PUT",
+                    document_id,
+                    query_params={"uploadId": upload_id, "partNumber": part_number},
+                    expires_in=expires_in,
+                ),
+            }
+            for part_number in part_numbers
+        ]
+
+    def list_multipart_parts(self, document_id, upload_id):
+        return self.multipart.list_parts(document_id, upload_id)
+
+    def complete_multipart_upload(self, document_id, upload_id, parts):
+        self.s3.complete_multipart_upload(
+            Bucket=self.bucket,
+            Key=document_id,
+            UploadId=upload_id,
+            MultipartUpload={"Parts": parts},
+        )
+
+    def abort_multipart_upload(self, document_id, upload_id):
+        self.multipart.abort(document_id, upload_id)
+
+    def iter_multipart_uploads(self):
+        """Yield every in-progress multipart upload in the bucket."""
+        paginator = self.s3.get_paginator("list_multipart_uploads")
+        for page in paginator.paginate(Bucket=self.bucket):
+            yield from page.get("Uploads", [])
@@ -0,0 +1,193 @@
+import base64
+import datetime
+import hashlib
+import hmac
+import json
+import threading
+from urllib.parse import quote, urlsplit
+
+ALGORITHM = "AWS4-HMAC-SHA256"
+ISO8601 = "%Y-%m-%dT%H:%M:%SZ"
+SIGV4_TIMESTAMP = "%Y%m%dT%H%M%SZ"
+UNSIGNED_PAYLOAD = "UNSIGNED-PAYLOAD"
+_PROBE_KEY = "presign-probe"
+
+
+def _hmac(key, msg):
+    return hmac.new(key, msg.encode("utf-8"), hashlib.sha256).digest()
+
+
+def _percent_encode(value, safe="-_.~"):
+    return quote(str(value), safe=safe)
+
+
+def _host_from_url(url):
+    parts = urlsplit(url)
+    host = parts.hostname
+    if ":" in host:
+        host = f"[{host}]"
+    default_ports = {"http": 80, "https": 443}
+    if parts.port is not None and parts.port != default_ports.get(parts.scheme):
+        host = f"{host}:{parts.port}"
+    return host
+
+
+class SigV4Signer:
+    """
+    Local SigV4 signer for S3 presigned POST policies and GET URLs.
+
+    Produces the same output as botocore's ``generate_presigned_post`` and
+    ``generate_presigned_url`` for a client configured with
+    ``signature_version="s3v4"``, without building a request object per call.
+    The derived signing key only changes once per day per secret, so it is
+    cached. Endpoint URLs are resolved once through the client itself, so
+    addressing style and custom endpoints follow the client configuration.
+    """
+
+    def __init__(self, client, bucket, credentials, service="s3"):
+        self.client = client
+        self.bucket = bucket
+        self.credentials = credentials
+        self.region = client.meta.region_name
+        self.service = service
+        self._lock = threading.Lock()
+        self._signing_keys = {}
+        self._post_url = None
+        self._object_base_url = None
+
+    def presign_post(
+        self, key, fields=None, conditions=None, expires_in=3600, now=None
+    ):
+        now = now or datetime.datetime.now(datetime.timezone.utc)
+        creds = self.credentials.get_frozen_credentials()
+        timestamp = now.strftime(SIGV4_TIMESTAMP)
+        scope = self._scope(creds.access_key, timestamp)
+
+        fields = dict(fields or {})
+        conditions = list(conditions or [])
+        conditions.append({"bucket": self.bucket})
+        if key.endswith("${filename}"):
+            conditions.append(["starts-with", "$key", key[: -len("${filename}")]])
+        else:
+            conditions.append({"key": key})
+        fields["key"] = key
+
+        fields["x-amz-algorithm"] = ALGORITHM
+        fields["x-amz-credential"] = scope
+        fields["x-amz-date"] = timestamp
+        conditions.append({"x-amz-algorithm": ALGORITHM})
+        conditions.append({"x-amz-credential": scope})
+        conditions.append({"x-amz-date": timestamp})
+        if creds.token is not None:
+            fields["x-amz-security-token"] = creds.token
+            conditions.append({"x-amz-security-token": creds.token})
+
+        policy = {
+            "expiration": (now + datetime.timedelta(seconds=expires_in)).strftime(
+                ISO8601
+            ),
+            "conditions": conditions,
+        }
+        fields["policy"] = base64.b64encode(json.dumps(policy).encode("utf-8")).decode(
+            "utf-8"
+        )
+        fields["x-amz-signature"] = self._signature(
+            creds.secret_key, timestamp, fields["policy"]
+        )
+        return {"url": self._get_post_url(), "fields": fields}
+
+    def presign_get(self, key, query_params=None, expires_in=3600, now=None):
+        return self.presign_url("GET", key, query_params, expires_in, now)
+
+    def presign_url(self, method, key, query_params=None, expires_in=3600, now=None):
+        now = now or datetime.datetime.now(datetime.timezone.utc)
+        creds = self.credentials.get_frozen_credentials()
+        timestamp = now.strftime(SIGV4_TIMESTAMP)
+
+        url = f"{self._get_object_base_url()}{_percent_encode(key, safe='/~')}"
+        auth_params = {
+            "X-Amz-Algorithm": ALGORITHM,
+            "X-Amz-Credential": self._scope(creds.access_key, timestamp),
+            "X-Amz-Date": timestamp,
+            "X-Amz-Expires": expires_in,
+            "X-Amz-SignedHeaders": "host",
+        }
+        if creds.token is not None:
+            auth_params["X-Amz-Security-Token"] = creds.token
+
+        pairs = [
+            (_percent_encode(name), _percent_encode(value))
+            for params in (query_params or {}, auth_params)
+            for name, value in params.items()
+        ]
+        query_string = "&".join(f"{name}={value}" for name, value in pairs)
+        canonical_query = "&".join(f"{name}={value}" for name, value in sorted(pairs))
+
+        canonical_request = "\n".join(
+            [
+                method,
+                urlsplit(url).path,
+                canonical_query,
+                f"host:{_host_from_url(url)}\n",
+                "host",
+                UNSIGNED_PAYLOAD,
+            ]
+        )
+        signature = self._signature(
+            creds.secret_key,
+            timestamp,
+            self._string_to_sign(timestamp, canonical_request),
+        )
+        return f"{url}?{query_string}&X-Amz-Signature={signature}"
+
+    def _scope(self, access_key, timestamp):
+        return f"{access_key}/{self._credential_scope(timestamp)}"
+
+    def _credential_scope(self, timestamp):
+        return f"{timestamp[:8]}/{self.region}/{self.service}/aws4_request"
+
+    def _string_to_sign(self, timestamp, canonical_request):
+        return "\n".join(
+            [
+                ALGORITHM,
+                timestamp,
+                self._credential_scope(timestamp),
+                hashlib.sha256(canonical_request.encode("utf-8")).hexdigest(),
+            ]
+        )
+
+    def _signature(self, secret_key, timestamp, string_to_sign):
+        signing_key = self._get_signing_key(secret_key, timestamp[:8])
+        return hmac.new(
+            signing_key, string_to_sign.encode("utf-8"), hashlib.sha256
+        ).hexdigest()
+
+    def _get_signing_key(self, secret_key, datestamp):
+        cache_key = (secret_key, datestamp)
+        signing_key = self._signing_keys.get(cache_key)
+        if signing_key is None:
+            k_date = _hmac(f"AWS4{secret_key}".encode("utf-8"), datestamp)
+            k_region = _hmac(k_date, self.region)
+            k_service = _hmac(k_region, self.service)
+            signing_key = _hmac(k_service, "aws4_request")
+            with self._lock:
+                # Keys for previous days or rotated secrets are never reused.
+                if len(self._signing_keys) >= 4:
+                    self._signing_keys.clear()
+                self._signing_keys[cache_key] = signing_key
+        return signing_key
+
+    def _get_post_url(self):
+        if self._post_url is None:
+            self._post_url = self.client.generate_presigned_post(
+                self.bucket, _PROBE_KEY
+            )["url"]
+        return self._post_url
+
+    def _get_object_base_url(self):
+        if self._object_base_url is None:
+            probe_url = self.client.generate_presigned_url(
+                "get_object", Params={"Bucket": self.bucket, "Key": _PROBE_KEY}
+            )
+            self._object_base_url = probe_url.split("?", 1)[0][: -len(_PROBE_KEY)]
+        return self._object_base_url
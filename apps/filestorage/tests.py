@@ -0,0 +1,1971 @@
+import asyncio
+import base64
+import datetime
+import hashlib
+import http.client
+import io
+import json
+import os
+import resource
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import tracemalloc
+import unittest
+import warnings
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import boto3
+import uvicorn
+from botocore.exceptions import ClientError
+from django.contrib.auth.models import Group
+from django.contrib.contenttypes.models import ContentType
+from django.core.asgi import get_asgi_application
+from django.core.cache import CacheKeyWarning, cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from moto import mock_aws
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIRequestFactory, force_authenticate
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from apps.common.testing import benchmark
+from apps.filestorage import services as filestorage
+from apps.filestorage.cache import (
+    DjangoPresignCache,
+    InMemoryPresignCache,
+    PresignedUrlCache,
+    get_presign_cache,
+)
+from apps.filestorage.downloads import build_file_response
+from apps.filestorage.models import (
+    Files,
+    MultipartUpload,
+    ObjectStorageUsage,
+    StoredObject,
+    UserStorageUsage,
+)
+from apps.filestorage.storage.aio import AsyncHTTPConnectionPool, AsyncS3StorageService
+from apps.filestorage.storage.factory import StorageRegistry, reset_storage_services
+from apps.filestorage.storage.multipart import (
+    MIN_PART_SIZE,
+    MultipartUploader,
+    MultipartUploadError,
+)
+from apps.filestorage.storage.s3 import get_client_config
+from apps.filestorage.storage.signer import SigV4Signer
+from apps.filestorage.utils import (
+    flat_key,
+    generate_storage_key,
+    generate_storage_keys,
+    hashed_key,
+    relocated_key,
+    split_storage_key,
+)
+from apps.filestorage.views import FileUploadViewSet
+from apps.user.models import CustomUser, UserRoles
+
+
+class StorageRegistryTest(TestCase):
+    def test_concurrent_reuse_is_counted_exactly(self):
+        registry = StorageRegistry()
+
+        def get_many(_):
+            for _ in range(1000):
+                registry.get("local")
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(get_many, range(8)))
+
+        self.assertEqual(registry.stats()["local"]["reuse_count"], 8 * 1000 - 1)
+
+
+FROZEN_NOW = datetime.datetime(2025, 3, 4, 5, 6, 7)
+
+
+class FrozenDatetime(datetime.datetime):
+    @classmethod
+    def utcnow(cls):
+        return FROZEN_NOW
+
+
+@mock.patch("botocore.signers.datetime.datetime", FrozenDatetime)
+class SigV4SignerParityTest(TestCase):
+    """The local signer must produce exactly what botocore produces."""
+
+    keys = ["uploads/report.pdf", "uploads/with space/ünïcode+(1).txt"]
+
+    def signers(self):
+        for token in (None, "session-token"):
+            session = boto3.session.Session(
+                aws_access_key_id="AKIDEXAMPLE",
+                aws_secret_access_key="wJalrXUtnFEMI/K7MDENG+bPxRfiCYEXAMPLEKEY",
+                aws_session_token=token,
+                region_name="ap-south-1",
+            )
+            client = session.client("s3", config=get_client_config())
+            yield client, SigV4Signer(client, "bucket", session.get_credentials())
+
+    def test_presigned_post_matches_botocore(self):
+        for client, signer in self.signers():
+            for key in self.keys:
+                expected = client.generate_presigned_post(
+                    "bucket",
+                    key,
+                    Fields={"Content-Type": "application/pdf"},
+                    Conditions=[
+                        {"Content-Type": "application/pdf"},
+                        ["content-length-range", 0, 1024],
+                    ],
+                    ExpiresIn=600,
+                )
+                actual = signer.presign_post(
+                    key,
+                    fields={"Content-Type": "application/pdf"},
+                    conditions=[
+                        {"Content-Type": "application/pdf"},
+                        ["content-length-range", 0, 1024],
+                    ],
+                    expires_in=600,
+                    now=FROZEN_NOW,
+                )
+                self.assertEqual(actual, expected)
+
+    def test_presigned_urls_match_botocore(self):
+        for client, signer in self.signers():
+            for key in self.keys:
+                self.assertEqual(
+                    signer.presign_get(
+                        key,
+                        query_params={"response-content-type": "image/png"},
+                        expires_in=300,
+                        now=FROZEN_NOW,
+                    ),
+                    client.generate_presigned_url(
+                        "get_object",
+                        Params={
+                            "Bucket": "bucket",
+                            "Key": key,
+                            "ResponseContentType": "image/png",
+                        },
+                        ExpiresIn=300,
+                    ),
+                )
+                self.assertEqual(
+                    signer.presign_url(
+                        "PUT",
+                        key,
+                        query_params={"uploadId": "abc/123", "partNumber": 7},
+                        expires_in=300,
+                        now=FROZEN_NOW,
+                    ),
+                    client.generate_presigned_url(
+                        "upload_part",
+                        Params={
+                            "Bucket": "bucket",
+                            "Key": key,
+                            "UploadId": "abc/123",
+                            "PartNumber": 7,
+                        },
+                        ExpiresIn=300,
+                    ),
+                )
+
+    @benchmark
+    def test_benchmark(self):
+        client, signer = next(self.signers())
+        count = 10000
+        for name, presign in (
+            (
+                "botocore generate_presigned_post",
+                lambda key: client.generate_presigned_post(
+                    "bucket", key, ExpiresIn=600
+                ),
+            ),
+            (
+                "SigV4Signer.presign_post",
+                lambda key: signer.presign_post(key, expires_in=600),
+            ),
+            (
+                "botocore generate_presigned_url",
+                lambda key: client.generate_presigned_url(
+                    "get_object", Params={"Bucket": "bucket", "Key": key}, ExpiresIn=300
+                ),
+            ),
+            (
+                "SigV4Signer.presign_get",
+                lambda key: signer.presign_get(key, expires_in=300),
+            ),
+        ):
+            presign("uploads/warm-up.pdf")
+            started = time.perf_counter()
+            for i in range(count):
+                presign(f"uploads/{i}.pdf")
+            elapsed = time.perf_counter() - started
+            print(f"\n{name}: {count / elapsed:.0f} URLs/s")
+
+
+S3_SETTINGS = {
+    "STORAGE_BACKEND": "s3",
+    "AWS_ACCESS_KEY_ID": "testing",
+    "AWS_SECRET_ACCESS_KEY": "testing",
+    "AWS_STORAGE_BUCKET_NAME": "bucket",
+    "AWS_S3_REGION_NAME": "us-east-1",
+    "AWS_S3_CUSTOM_DOMAIN": "https://bucket.s3.amazonaws.com",
+}
+
+
+class S3StorageTestMixin:
+    """
+    Runs the test against the S3 backend on moto's in-memory S3.
+
+    Use with ``@override_settings(**S3_SETTINGS)`` on the class.
+    """
+
+    def setUp(self):
+        super().setUp()
+        aws = mock_aws()
+        aws.start()
+        self.addCleanup(aws.stop)
+        # Backends built under other settings must not leak in or out.
+        reset_storage_services()
+        self.addCleanup(reset_storage_services)
+        self.storage = filestorage.get_storage_service()
+        self.storage.s3.create_bucket(Bucket=self.storage.bucket)
+
+
+@override_settings(**S3_SETTINGS)
+class BatchPresignTest(S3StorageTestMixin, TestCase):
+    def files(self, count):
+        return [
+            {
+                "id": f"f{i}",
+                "file_name": f"report {i}.pdf",
+                "content_type": "application/pdf",
+            }
+            for i in range(count)
+        ]
+
+    @override_settings(FILESTORAGE_PRESIGN_CHUNK_SIZE=7, FILESTORAGE_PRESIGN_WORKERS=4)
+    def test_results_keep_input_order_and_ids(self):
+        files = self.files(50)
+        files[3] = {"file_name": "no-id.txt"}
+
+        presigned = filestorage.generate_batch_presigned_urls(files)["presigned"]
+
+        self.assertEqual(
+            [item["input_file_id"] for item in presigned],
+            [file.get("id", file["file_name"]) for file in files],
+        )
+        keys = [item["document_id"] for item in presigned]
+        self.assertEqual(keys, [item["fields"]["key"] for item in presigned])
+        self.assertEqual(len(set(keys)), len(files))
+
+    def test_whole_batch_is_validated_before_signing(self):
+        files = self.files(5) + [{"content_type": "text/plain"}]
+        with mock.patch(
+            "apps.filestorage.storage.s3.S3StorageService.generate_presigned_post_url"
+        ) as sign:
+            with self.assertRaises(ValidationError):
+                filestorage.generate_batch_presigned_urls(files)
+        sign.assert_not_called()
+
+    @override_settings(FILESTORAGE_MAX_BATCH_SIZE=10)
+    def test_max_batch_size(self):
+        self.assertEqual(
+            len(filestorage.generate_batch_presigned_urls(self.files(10))["presigned"]),
+            10,
+        )
+        with self.assertRaises(ValidationError):
+            filestorage.generate_batch_presigned_urls(self.files(11))
+
+    @override_settings(STORAGE_BACKEND="local")
+    def test_local_backend_validates_the_batch(self):
+        with self.assertRaises(ValidationError):
+            filestorage.generate_batch_presigned_urls([{"content_type": "text/plain"}])
+        self.assertEqual(
+            filestorage.generate_batch_presigned_urls(self.files(2)),
+            {"backend": "local", "presigned": []},
+        )
+
+    @benchmark
+    def test_benchmark(self):
+        for count in (1, 100, 1000):
+            files = self.files(count)
+            started = time.perf_counter()
+            filestorage.generate_batch_presigned_urls(files)
+            elapsed = time.perf_counter() - started
+            print(
+                f"\nbatch presign {count:>4} files: {elapsed * 1000:.1f}ms "
+                f"({count / elapsed:.0f} files/s)"
+            )
+
+
+class PresignedUrlCacheTest(TestCase):
+    def sign(self):
+        self.signed += 1
+        return {"file_url": f"https://example.com/{self.signed}"}
+
+    def setUp(self):
+        self.signed = 0
+        self.cache = PresignedUrlCache(InMemoryPresignCache(), min_remaining=300)
+
+    def get(self, document_id="uploads/a.pdf", content_type="application/pdf"):
+        return self.cache.get_or_sign(document_id, content_type, 3600, self.sign)
+
+    def test_hits_and_misses(self):
+        self.assertEqual(self.get(), self.get())
+        self.get(content_type="image/png")
+        self.get(document_id="uploads/b.pdf")
+
+        self.assertEqual(self.signed, 3)
+        self.assertEqual(self.cache.stats(), {"hits": 1, "misses": 3})
+
+    def test_urls_are_not_reused_within_min_remaining_of_expiry(self):
+        with mock.patch("apps.filestorage.cache.time.time", return_value=1000):
+            self.get()
+        with mock.patch("apps.filestorage.cache.time.time", return_value=4299):
+            self.get()
+        self.assertEqual(self.signed, 1)
+        with mock.patch("apps.filestorage.cache.time.time", return_value=4300):
+            self.get()
+        self.assertEqual(self.signed, 2)
+
+    def test_invalidate_drops_every_variant(self):
+        self.get()
+        self.get(content_type="image/png")
+        self.get(document_id="uploads/b.pdf")
+
+        self.cache.invalidate(["uploads/a.pdf"])
+
+        self.get()
+        self.get(content_type="image/png")
+        self.get(document_id="uploads/b.pdf")
+        self.assertEqual(self.signed, 5)
+
+    def test_django_backend_keys_are_valid_for_any_document_id(self):
+        backend = DjangoPresignCache()
+        document_id = "uploads/with space\n" + "x" * 300
+        with warnings.catch_warnings():
+            warnings.simplefilter("error", CacheKeyWarning)
+            cache.validate_key(backend._make_key(document_id))
+            self.cache = PresignedUrlCache(backend)
+            self.assertEqual(self.get(document_id), self.get(document_id))
+        self.assertEqual(self.signed, 1)
+
+
+@override_settings(**S3_SETTINGS)
+class PresignedUrlInvalidationTest(S3StorageTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        get_presign_cache().clear()
+        self.addCleanup(get_presign_cache().clear)
+
+    def test_purge_drops_cached_urls(self):
+        user = CustomUser.objects.create(email="owner@example.com")
+        self.storage.s3.put_object(
+            Bucket=self.storage.bucket, Key="uploads/a.pdf", Body=b"data"
+        )
+        file_url = self.storage.get_url("uploads/a.pdf")
+        Files.objects.create(
+            file=file_url,
+            original_name="a.pdf",
+            content_type=ContentType.objects.get_for_model(CustomUser),
+            object_id=user.pk,
+            uploaded_by=user,
+            deleted_at=timezone.now(),
+        )
+        filestorage.generate_presigned_get_url(file_url)
+        filestorage.generate_presigned_get_url(file_url)
+        self.assertEqual(get_presign_cache().stats(), {"hits": 1, "misses": 1})
+
+        filestorage.purge_deleted_files()
+
+        filestorage.generate_presigned_get_url(file_url)
+        self.assertEqual(get_presign_cache().stats(), {"hits": 1, "misses": 2})
+
+
+@override_settings(FILESTORAGE_VERIFY_UPLOADS=False)
+class BatchFileMetadataTest(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create(email="uploader@example.com")
+
+    def records(self, count):
+        return [
+            {
+                "file_url": f"https://bkt.s3.amazonaws.com/uploads/{i}.pdf",
+                "original_name": f"{i}.pdf",
+                "content_type": "user.customuser",
+                "object_id": self.user.pk,
+            }
+            for i in range(count)
+        ]
+
+    def test_per_record_results_in_input_order(self):
+        records = self.records(4)
+        records[1] = {"original_name": "missing-url.pdf"}
+        records[2]["content_type"] = "nope.nothing"
+
+        results = filestorage.save_batch_file_metadata(self.user, records)
+
+        self.assertEqual([result["index"] for result in results], [0, 1, 2, 3])
+        self.assertEqual(
+            [result["file"].original_name for result in results if "file" in result],
+            ["0.pdf", "3.pdf"],
+        )
+        self.assertIn("file_url", results[1]["errors"])
+        self.assertIn("content_type", results[2]["errors"])
+        self.assertEqual(Files.objects.count(), 2)
+
+    def test_rows_are_inserted_with_one_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            results = filestorage.save_batch_file_metadata(self.user, self.records(50))
+
+        self.assertEqual(len(results), 50)
+        inserts = [q for q in queries if q["sql"].startswith('INSERT INTO "files"')]
+        self.assertEqual(len(inserts), 1)
+
+    @override_settings(FILESTORAGE_MAX_BATCH_SIZE=3)
+    def test_max_batch_size(self):
+        with self.assertRaises(ValidationError):
+            filestorage.save_batch_file_metadata(self.user, self.records(4))
+        self.assertFalse(Files.objects.exists())
+
+    @benchmark
+    def test_benchmark(self):
+        count = 500
+        started = time.perf_counter()
+        for record in self.records(count):
+            filestorage.save_file_metadata(
+                self.user,
+                record["file_url"],
+                record["original_name"],
+                record["content_type"],
+                record["object_id"],
+                "",
+            )
+        single = time.perf_counter() - started
+
+        started = time.perf_counter()
+        filestorage.save_batch_file_metadata(self.user, self.records(count))
+        batch = time.perf_counter() - started
+        print(
+            f"\n{count} records: {single * 1000:.0f}ms one by one, "
+            f"{batch * 1000:.0f}ms batched ({single / batch:.1f}x)"
+        )
+
+
+@unittest.skipUnless(connection.vendor == "postgresql", "needs PostgreSQL")
+class FileIndexUsageTest(TestCase):
+    """The hot lookups must be able to use their partial indexes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(email="indexed@example.com")
+        content_type = ContentType.objects.get_for_model(CustomUser)
+        Files.objects.bulk_create(
+            Files(
+                file=f"https://bkt.s3.amazonaws.com/uploads/{i}.pdf",
+                original_name=f"{i}.pdf",
+                content_type=content_type,
+                object_id=i % 100,
+                uploaded_by=cls.user,
+            )
+            for i in range(2000)
+        )
+
+    def assertUsesIndex(self, queryset, index_name):
+        with connection.cursor() as cursor:
+            # The table is too small for the planner to prefer an index on
+            # its own; this checks the index matches the query's shape.
+            cursor.execute("ANALYZE files")
+            cursor.execute("SET LOCAL enable_seqscan = off")
+        self.assertIn(index_name, queryset.explain())
+
+    def test_lookup_by_file(self):
+        self.assertUsesIndex(
+            Files.objects.filter(file="https://bkt.s3.amazonaws.com/uploads/7.pdf"),
+            "files_file_live_idx",
+        )
+
+    def test_lookup_by_parent_object(self):
+        self.assertUsesIndex(
+            Files.objects.filter(
+                content_type=ContentType.objects.get_for_model(CustomUser),
+                object_id=7,
+            ).order_by("-created_at", "-id"),
+            "files_object_created_idx",
+        )
+
+    def test_lookup_by_uploader(self):
+        self.assertUsesIndex(
+            Files.objects.filter(uploaded_by=self.user).order_by("-created_at"),
+            "files_uploader_created_idx",
+        )
+
+    def test_purge_queue(self):
+        self.assertUsesIndex(
+            Files.all_objects.filter(deleted_at__isnull=False).order_by(
+                "purge_attempts", "deleted_at", "id"
+            ),
+            "files_purge_queue_idx",
+        )
+
+
+class FileListPermissionTest(TestCase):
+    def setUp(self):
+        Group.objects.get_or_create(name=UserRoles.ADMIN)
+        self.owner = CustomUser.objects.create(email="owner@example.com")
+        self.other = CustomUser.objects.create(email="other@example.com")
+        self.admin = CustomUser.objects.create(email="admin@example.com")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.admin.make_admin()
+        content_type = ContentType.objects.get_for_model(CustomUser)
+        for user in (self.owner, self.other):
+            Files.objects.create(
+                file=f"https://bkt.s3.amazonaws.com/uploads/{user.pk}.pdf",
+                original_name=f"{user.pk}.pdf",
+                content_type=content_type,
+                object_id=1,
+                uploaded_by=user,
+            )
+
+    def list_files(self, user):
+        request = APIRequestFactory().get(
+            "/", {"content_type": "user.customuser", "object_id": "1"}
+        )
+        force_authenticate(request, user=user)
+        response = FileUploadViewSet.as_view({"get": "list"})(request)
+        self.assertEqual(response.status_code, 200)
+        return {item["original_name"] for item in response.data["data"]["results"]}
+
+    def test_uploaders_only_see_their_files(self):
+        self.assertEqual(self.list_files(self.owner), {f"{self.owner.pk}.pdf"})
+
+    def test_admins_see_every_file(self):
+        self.assertEqual(
+            self.list_files(self.admin),
+            {f"{self.owner.pk}.pdf", f"{self.other.pk}.pdf"},
+        )
+
+
+class PrefetchFilesTest(TestCase):
+    def setUp(self):
+        self.users = [
+            CustomUser.objects.create(email=f"user{i}@example.com") for i in range(5)
+        ]
+        self.groups = [Group.objects.create(name=f"group{i}") for i in range(3)]
+        for parent in self.users[:3] + self.groups[:2]:
+            for i in range(2):
+                Files.objects.create(
+                    file=f"https://bkt.s3.amazonaws.com/uploads/{parent.pk}-{i}.pdf",
+                    original_name=f"{i}.pdf",
+                    content_type=ContentType.objects.get_for_model(parent),
+                    object_id=parent.pk,
+                    uploaded_by=self.users[0],
+                )
+
+    def test_for_objects_is_one_query_across_models(self):
+        with self.assertNumQueries(1):
+            files = list(Files.objects.for_objects(self.users + self.groups))
+        self.assertEqual(len(files), 10)
+
+    def test_prefetch_files_is_one_query(self):
+        with self.assertNumQueries(1):
+            objects = filestorage.prefetch_files(self.users + self.groups)
+            counts = [len(obj.prefetched_files) for obj in objects]
+            uploaders = {
+                file.uploaded_by.email
+                for obj in objects
+                for file in obj.prefetched_files
+            }
+        self.assertEqual(counts, [2, 2, 2, 0, 0, 2, 2, 0])
+        self.assertEqual(uploaders, {"user0@example.com"})
+
+    def test_soft_deleted_files_are_not_prefetched(self):
+        Files.objects.for_objects(self.users[:1]).update(deleted_at=timezone.now())
+        objects = filestorage.prefetch_files(self.users[:1])
+        self.assertEqual(objects[0].prefetched_files, [])
+
+
+class LocalStorageTestMixin:
+    """Runs the test against the local backend in a throwaway MEDIA_ROOT."""
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.media_root = media_root.name
+        overrides = override_settings(
+            MEDIA_ROOT=self.media_root, STORAGE_BACKEND="local"
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.storage = filestorage.get_storage_service()
+        self.user = CustomUser.objects.create(email="local@example.com")
+
+    def store(self, document_id, content=b"data"):
+        return self.storage.upload(io.BytesIO(content), document_id)["url"]
+
+    def create_file(self, file_url, **fields):
+        return Files.objects.create(
+            file=file_url,
+            original_name=os.path.basename(file_url),
+            content_type=ContentType.objects.get_for_model(CustomUser),
+            object_id=self.user.pk,
+            uploaded_by=self.user,
+            **fields,
+        )
+
+
+class PurgeDeletedFilesTest(LocalStorageTestMixin, TestCase):
+    def test_unreferenced_objects_are_deleted(self):
+        file = self.create_file(self.store("a.txt"), deleted_at=timezone.now())
+
+        stats = filestorage.purge_deleted_files()
+
+        self.assertEqual(stats["purged"], 1)
+        self.assertFalse(Files.all_objects.filter(pk=file.pk).exists())
+        self.assertFalse(os.path.exists(self.storage.get_path("a.txt")))
+
+    def test_objects_of_live_rows_are_kept(self):
+        url = self.store("shared.txt")
+        deleted = self.create_file(url, deleted_at=timezone.now())
+        self.create_file(url)
+
+        filestorage.purge_deleted_files()
+
+        self.assertFalse(Files.all_objects.filter(pk=deleted.pk).exists())
+        self.assertTrue(os.path.exists(self.storage.get_path("shared.txt")))
+
+    def test_objects_of_stored_objects_are_kept(self):
+        url = self.store("content/ab/abcd")
+        StoredObject.objects.create(
+            sha256="ab" * 32, document_id="content/ab/abcd", ref_count=1
+        )
+        self.create_file(url, deleted_at=timezone.now())
+
+        filestorage.purge_deleted_files()
+
+        self.assertTrue(os.path.exists(self.storage.get_path("content/ab/abcd")))
+
+    def test_keys_outside_uploads_are_never_deleted(self):
+        outside = os.path.join(self.media_root, "outside.txt")
+        with open(outside, "wb") as f:
+            f.write(b"keep me")
+        file = self.create_file(
+            self.storage.get_url("../outside.txt"), deleted_at=timezone.now()
+        )
+
+        filestorage.purge_deleted_files()
+
+        self.assertTrue(os.path.exists(outside))
+        self.assertFalse(Files.all_objects.filter(pk=file.pk).exists())
+        self.assertEqual(
+            self.storage.delete_many(["../outside.txt"]), ["../outside.txt"]
+        )
+        self.assertTrue(os.path.exists(outside))
+
+    def test_last_reference_deletes_the_shared_object(self):
+        url = self.store("content/ab/abcd")
+        stored = StoredObject.objects.create(
+            sha256="ab" * 32, document_id="content/ab/abcd", ref_count=2
+        )
+        first = self.create_file(url, sha256="ab" * 32, deleted_at=timezone.now())
+        self.create_file(url, sha256="ab" * 32)
+
+        filestorage.purge_deleted_files()
+
+        stored.refresh_from_db()
+        self.assertEqual(stored.ref_count, 1)
+        self.assertFalse(Files.all_objects.filter(pk=first.pk).exists())
+        self.assertTrue(os.path.exists(self.storage.get_path("content/ab/abcd")))
+
+        Files.objects.update(deleted_at=timezone.now())
+        filestorage.purge_deleted_files()
+
+        self.assertFalse(StoredObject.objects.exists())
+        self.assertFalse(Files.all_objects.exists())
+        self.assertFalse(os.path.exists(self.storage.get_path("content/ab/abcd")))
+
+    def test_failed_storage_delete_keeps_rows_and_references(self):
+        url = self.store("content/ab/abcd")
+        StoredObject.objects.create(
+            sha256="ab" * 32, document_id="content/ab/abcd", ref_count=1
+        )
+        file = self.create_file(url, sha256="ab" * 32, deleted_at=timezone.now())
+        error = ClientError({"Error": {"Code": "SlowDown"}}, "DeleteObjects")
+
+        with mock.patch.object(self.storage, "delete_many", side_effect=error):
+            with self.assertRaises(ClientError):
+                filestorage.purge_deleted_files(max_retries=0)
+
+        self.assertTrue(Files.all_objects.filter(pk=file.pk).exists())
+        self.assertEqual(StoredObject.objects.get(sha256="ab" * 32).ref_count, 1)
+        filestorage.purge_deleted_files()
+        self.assertFalse(Files.all_objects.exists())
+        self.assertFalse(StoredObject.objects.exists())
+
+    def test_failing_keys_do_not_block_the_queue(self):
+        stuck = self.create_file(
+            self.store("stuck.txt"),
+            deleted_at=timezone.now() - datetime.timedelta(days=1),
+        )
+        fresh = self.create_file(self.store("fresh.txt"), deleted_at=timezone.now())
+
+        with mock.patch.object(
+            self.storage, "delete_many", side_effect=lambda keys: list(keys)
+        ):
+            stats = filestorage.purge_deleted_files(batch_size=1)
+        self.assertEqual((stats["purged"], stats["failed"]), (0, 1))
+        stuck.refresh_from_db()
+        self.assertEqual(stuck.purge_attempts, 1)
+
+        filestorage.purge_deleted_files(batch_size=1)
+
+        self.assertFalse(Files.all_objects.filter(pk=fresh.pk).exists())
+        self.assertTrue(Files.all_objects.filter(pk=stuck.pk).exists())
+
+
+class ZeroStream:
+    """A file-like object of ``size`` zero bytes that never holds them all."""
+
+    def __init__(self, size, fail_after=None):
+        self.remaining = size
+        self.fail_after = fail_after
+
+    def read(self, n=-1):
+        if self.fail_after is not None and self.remaining <= self.fail_after:
+            raise OSError("connection reset")
+        n = self.remaining if n < 0 else min(n, self.remaining)
+        self.remaining -= n
+        return bytes(n)
+
+
+class LocalStreamingUploadTest(LocalStorageTestMixin, TestCase):
+    def leftover_temp_files(self):
+        return [
+            name
+            for _, _, names in os.walk(self.media_root)
+            for name in names
+            if name.startswith(".upload-")
+        ]
+
+    def test_upload_is_hashed_while_written(self):
+        content = os.urandom(300 * 1024)
+        with override_settings(FILESTORAGE_LOCAL_BUFFER_SIZE=64 * 1024):
+            result = self.storage.upload(
+                io.BytesIO(content), "docs/a.bin", hash_algorithm="sha256"
+            )
+
+        self.assertEqual(result["size"], len(content))
+        self.assertEqual(result["sha256"], hashlib.sha256(content).hexdigest())
+        with open(self.storage.get_path("docs/a.bin"), "rb") as f:
+            self.assertEqual(f.read(), content)
+        self.assertEqual(self.leftover_temp_files(), [])
+
+    def test_failed_upload_leaves_previous_object_intact(self):
+        self.store("docs/a.bin", b"previous")
+
+        with self.assertRaises(OSError):
+            self.storage.upload(
+                ZeroStream(4 * 1024 * 1024, fail_after=1024 * 1024), "docs/a.bin"
+            )
+
+        with open(self.storage.get_path("docs/a.bin"), "rb") as f:
+            self.assertEqual(f.read(), b"previous")
+        self.assertEqual(self.leftover_temp_files(), [])
+
+    @override_settings(FILESTORAGE_LOCAL_BUFFER_SIZE=1024 * 1024)
+    def test_memory_is_bounded_by_the_buffer(self):
+        tracemalloc.start()
+        try:
+            self.storage.upload(ZeroStream(32 * 1024 * 1024), "docs/big.bin")
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        self.assertEqual(
+            os.path.getsize(self.storage.get_path("docs/big.bin")), 32 << 20
+        )
+        self.assertLess(peak, 4 * 1024 * 1024)
+
+    @benchmark
+    def test_benchmark(self):
+        for megabytes in (10, 100, 1024, 2048):
+            tracemalloc.start()
+            started = time.perf_counter()
+            self.storage.upload(ZeroStream(megabytes << 20), "bench.bin")
+            elapsed = time.perf_counter() - started
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            print(
+                f"\nlocal upload {megabytes:>4} MB: {megabytes / elapsed:.0f} MB/s, "
+                f"peak allocations {peak / 1024:.0f} KiB, max RSS {max_rss / 1024:.0f} MiB"
+            )
+            os.unlink(self.storage.get_path("bench.bin"))
+
+
+class FailingStream(io.BytesIO):
+    """A stream of ``content`` that raises once ``fail_at`` bytes were read."""
+
+    def __init__(self, content, fail_at):
+        super().__init__(content)
+        self.fail_at = fail_at
+
+    def read(self, n=-1):
+        if self.tell() >= self.fail_at:
+            raise OSError("connection reset")
+        return super().read(n)
+
+
+@override_settings(
+    **S3_SETTINGS,
+    AWS_S3_MULTIPART_THRESHOLD=MIN_PART_SIZE,
+    AWS_S3_MULTIPART_PART_SIZE=MIN_PART_SIZE,
+)
+class MultipartUploaderTest(S3StorageTestMixin, TestCase):
+    def stored(self, key):
+        return self.storage.s3.get_object(Bucket="bucket", Key=key)["Body"].read()
+
+    def uploaded_parts(self):
+        """Patch upload_part to record the part numbers it is called with."""
+        numbers = []
+        upload_part = self.storage.s3.upload_part
+
+        def record(**kwargs):
+            numbers.append(kwargs["PartNumber"])
+            return upload_part(**kwargs)
+
+        self.enterContext(mock.patch.object(self.storage.s3, "upload_part", record))
+        return numbers
+
+    def test_large_input_is_split_into_parts(self):
+        content = os.urandom(2 * MIN_PART_SIZE + 1024)
+        numbers = self.uploaded_parts()
+
+        result = self.storage.upload(io.BytesIO(content), "docs/big.bin")
+
+        self.assertEqual(result["parts"], 3)
+        self.assertEqual(result["size"], len(content))
+        self.assertEqual(sorted(numbers), [1, 2, 3])
+        self.assertEqual(self.stored("docs/big.bin"), content)
+
+    def test_content_type_is_stored(self):
+        for key, size in (("docs/small.pdf", 1024), ("docs/big.pdf", MIN_PART_SIZE)):
+            self.storage.upload(
+                io.BytesIO(bytes(size)), key, content_type="application/pdf"
+            )
+            head = self.storage.s3.head_object(Bucket="bucket", Key=key)
+            self.assertEqual(head["ContentType"], "application/pdf")
+
+    def test_resume_skips_only_parts_with_matching_content(self):
+        content = os.urandom(2 * MIN_PART_SIZE + 1024)
+        upload_id = self.storage.s3.create_multipart_upload(
+            Bucket="bucket", Key="docs/big.bin"
+        )["UploadId"]
+        # Part 1 was stored intact; part 2 has the right size but other bytes.
+        for number, body in (
+            (1, content[:MIN_PART_SIZE]),
+            (2, bytes(MIN_PART_SIZE)),
+        ):
+            self.storage.s3.upload_part(
+                Bucket="bucket",
+                Key="docs/big.bin",
+                UploadId=upload_id,
+                PartNumber=number,
+                Body=body,
+            )
+        numbers = self.uploaded_parts()
+
+        result = self.storage.upload(
+            io.BytesIO(content), "docs/big.bin", upload_id=upload_id
+        )
+
+        self.assertEqual(result["upload_id"], upload_id)
+        self.assertEqual(sorted(numbers), [2, 3])
+        self.assertEqual(self.stored("docs/big.bin"), content)
+
+    def test_failed_upload_can_be_resumed(self):
+        content = os.urandom(2 * MIN_PART_SIZE + 1024)
+
+        with self.assertRaises(MultipartUploadError) as caught:
+            self.storage.upload(
+                FailingStream(content, fail_at=2 * MIN_PART_SIZE), "docs/big.bin"
+            )
+        upload_id = caught.exception.upload_id
+        stored = self.storage.multipart.list_parts("docs/big.bin", upload_id)
+        numbers = self.uploaded_parts()
+
+        self.storage.upload(io.BytesIO(content), "docs/big.bin", upload_id=upload_id)
+
+        self.assertEqual(sorted(numbers), sorted({1, 2, 3} - set(stored)))
+        self.assertEqual(self.stored("docs/big.bin"), content)
+
+    def test_abort_discards_the_upload(self):
+        with self.assertRaises(MultipartUploadError) as caught:
+            self.storage.upload(
+                FailingStream(bytes(2 * MIN_PART_SIZE), fail_at=MIN_PART_SIZE),
+                "docs/big.bin",
+            )
+
+        self.storage.abort_multipart_upload("docs/big.bin", caught.exception.upload_id)
+
+        uploads = self.storage.s3.list_multipart_uploads(Bucket="bucket")
+        self.assertEqual(uploads.get("Uploads", []), [])
+        with self.assertRaises(ClientError):
+            self.storage.s3.head_object(Bucket="bucket", Key="docs/big.bin")
+
+    @benchmark
+    def test_benchmark(self):
+        for megabytes, part_mb, concurrency in (
+            (64, 5, 1),
+            (64, 5, 4),
+            (64, 16, 4),
+            (256, 16, 8),
+        ):
+            uploader = MultipartUploader(
+                self.storage.s3, "bucket", part_mb << 20, concurrency
+            )
+            result = uploader.upload(ZeroStream(megabytes << 20), "bench.bin")
+            print(
+                f"\nmoto multipart {megabytes:>3} MB, {part_mb:>2} MB parts, "
+                f"{concurrency} threads: {result['mb_per_second']:.0f} MB/s"
+            )
+            self.storage.s3.delete_object(Bucket="bucket", Key="bench.bin")
+
+
+@override_settings(**S3_SETTINGS)
+class MultipartOwnershipTest(S3StorageTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.owner = CustomUser.objects.create(email="owner@example.com")
+        self.other = CustomUser.objects.create(email="other@example.com")
+        self.upload = filestorage.initiate_multipart_upload(
+            "big.bin", "application/octet-stream", 10 * 1024 * 1024, user=self.owner
+        )
+        self.args = (self.upload["document_id"], self.upload["upload_id"])
+
+    def open_uploads(self):
+        response = self.storage.s3.list_multipart_uploads(Bucket="bucket")
+        return [upload["UploadId"] for upload in response.get("Uploads", [])]
+
+    def upload_part(self):
+        response = self.storage.s3.upload_part(
+            Bucket="bucket",
+            Key=self.upload["document_id"],
+            UploadId=self.upload["upload_id"],
+            PartNumber=1,
+            Body=b"0123456789",
+        )
+        return [{"part_number": 1, "etag": response["ETag"]}]
+
+    def test_initiator_is_recorded(self):
+        upload = MultipartUpload.objects.get(upload_id=self.upload["upload_id"])
+        self.assertEqual(upload.initiated_by, self.owner)
+        self.assertEqual(upload.document_id, self.upload["document_id"])
+
+    def test_other_users_are_refused(self):
+        parts = self.upload_part()
+        for operation in (
+            lambda: filestorage.presign_multipart_parts(
+                *self.args, [1], user=self.other
+            ),
+            lambda: filestorage.complete_multipart_upload(
+                *self.args, parts, user=self.other
+            ),
+            lambda: filestorage.abort_multipart_upload(*self.args, user=self.other),
+        ):
+            with self.assertRaises(ValidationError):
+                operation()
+        self.assertTrue(
+            MultipartUpload.objects.filter(upload_id=self.upload["upload_id"]).exists()
+        )
+        self.assertEqual(self.open_uploads(), [self.upload["upload_id"]])
+
+    def test_initiator_can_complete(self):
+        filestorage.presign_multipart_parts(*self.args, [1, 2], user=self.owner)
+        filestorage.complete_multipart_upload(
+            *self.args, self.upload_part(), user=self.owner
+        )
+        self.assertFalse(MultipartUpload.objects.exists())
+        self.assertEqual(self.storage.stat(self.upload["document_id"])["size"], 10)
+        with self.assertRaises(ValidationError):
+            filestorage.abort_multipart_upload(*self.args, user=self.owner)
+
+    def test_initiator_can_abort(self):
+        filestorage.abort_multipart_upload(*self.args, user=self.owner)
+        self.assertFalse(MultipartUpload.objects.exists())
+        self.assertEqual(self.open_uploads(), [])
+
+    def test_unknown_upload_is_refused(self):
+        with self.assertRaises(ValidationError):
+            filestorage.abort_multipart_upload(
+                self.upload["document_id"], "upload-2", user=self.owner
+            )
+        self.assertEqual(self.open_uploads(), [self.upload["upload_id"]])
+
+
+@override_settings(FILESTORAGE_CONTENT_ADDRESSED=True, FILESTORAGE_VERIFY_UPLOADS=False)
+class ContentAddressedReferenceTest(TestCase):
+    sha256 = hashlib.sha256(b"shared").hexdigest()
+
+    def setUp(self):
+        self.users = [
+            CustomUser.objects.create(email=f"cas{i}@example.com") for i in range(3)
+        ]
+        self.storage = filestorage.get_storage_service()
+        self.content_url = self.storage.get_url(filestorage._content_key(self.sha256))
+
+    def save(self, user, file_url):
+        return filestorage.save_file_metadata(
+            user, file_url, "shared.txt", "user.customuser", user.pk, "", self.sha256
+        )
+
+    def test_hash_must_match_the_key(self):
+        with self.assertRaises(ValidationError):
+            self.save(self.users[0], self.storage.get_url("uploads/other.txt"))
+        self.assertFalse(Files.objects.exists())
+        self.assertFalse(StoredObject.objects.exists())
+
+        self.save(self.users[0], self.content_url)
+        self.assertEqual(StoredObject.objects.get(sha256=self.sha256).ref_count, 1)
+
+    def test_existing_stored_object_key_is_accepted(self):
+        legacy_url = self.storage.get_url("content/legacy-key")
+        StoredObject.objects.create(
+            sha256=self.sha256, document_id="content/legacy-key", ref_count=1
+        )
+        self.save(self.users[0], legacy_url)
+        self.assertEqual(StoredObject.objects.get(sha256=self.sha256).ref_count, 2)
+
+    def test_batch_reports_mismatched_keys_per_record(self):
+        records = [
+            {
+                "file_url": url,
+                "original_name": "shared.txt",
+                "content_type": "user.customuser",
+                "object_id": self.users[0].pk,
+                "sha256": self.sha256,
+            }
+            for url in (self.storage.get_url("uploads/other.txt"), self.content_url)
+        ]
+        results = filestorage.save_batch_file_metadata(self.users[0], records)
+
+        self.assertIn("file_url", results[0]["errors"])
+        self.assertIn("file", results[1])
+
+    def test_delete_picks_the_callers_row(self):
+        first = self.save(self.users[0], self.content_url)
+        second = self.save(self.users[1], self.content_url)
+
+        filestorage.delete_file_from_s3(self.content_url, user=self.users[1])
+
+        self.assertTrue(Files.objects.filter(pk=first.pk).exists())
+        self.assertFalse(Files.objects.filter(pk=second.pk).exists())
+        with self.assertRaisesMessage(ValidationError, "permission"):
+            filestorage.delete_file_from_s3(self.content_url, user=self.users[2])
+
+
+@override_settings(
+    **S3_SETTINGS,
+    FILESTORAGE_CONTENT_ADDRESSED=True,
+    FILESTORAGE_MAX_UPLOAD_SIZES={"default": 1024, "videos": 4096},
+)
+class RecordedSizeCapTest(S3StorageTestMixin, TestCase):
+    sha256 = hashlib.sha256(b"clip").hexdigest()
+
+    def setUp(self):
+        super().setUp()
+        self.user = CustomUser.objects.create(email="caps@example.com")
+
+    def presign(self):
+        return filestorage.generate_presigned_url(
+            "clip.mp4", "video/mp4", "videos", sha256=self.sha256
+        )
+
+    def post(self, presigned, size):
+        """Store what S3 keeps for a POST of ``size`` bytes with these fields."""
+        fields = presigned["fields"]
+        self.storage.s3.put_object(
+            Bucket="bucket",
+            Key=fields["key"],
+            Body=bytes(size),
+            ContentType=fields["Content-Type"],
+            Metadata={"max-upload-size": fields["x-amz-meta-max-upload-size"]},
+        )
+
+    def save(self, file_url):
+        return filestorage.save_file_metadata(
+            self.user, file_url, "clip.mp4", "user.customuser", self.user.pk, ""
+        )
+
+    def test_cap_is_fixed_by_the_policy(self):
+        fields = self.presign()["fields"]
+
+        self.assertEqual(fields["x-amz-meta-max-upload-size"], "4096")
+        policy = json.loads(base64.b64decode(fields["policy"]))
+        self.assertIn({"x-amz-meta-max-upload-size": "4096"}, policy["conditions"])
+
+    def test_content_addressed_upload_gets_its_folders_cap(self):
+        presigned = self.presign()
+        self.post(presigned, 2048)
+
+        self.assertEqual(self.save(presigned["file_url"]).size, 2048)
+
+    def test_upload_over_its_recorded_cap_is_refused(self):
+        presigned = self.presign()
+        presigned["fields"]["x-amz-meta-max-upload-size"] = "1024"
+        self.post(presigned, 2048)
+
+        with self.assertRaisesMessage(ValidationError, "1024"):
+            self.save(presigned["file_url"])
+
+    def test_multipart_upload_keeps_the_cap_it_started_with(self):
+        upload = filestorage.initiate_multipart_upload(
+            "clip.mp4", "video/mp4", 2048, folder_prefix="videos", user=self.user
+        )
+        self.assertEqual(MultipartUpload.objects.get().max_size, 4096)
+        etag = self.storage.s3.upload_part(
+            Bucket="bucket",
+            Key=upload["document_id"],
+            UploadId=upload["upload_id"],
+            PartNumber=1,
+            Body=bytes(2048),
+        )["ETag"]
+
+        # Caps changed since the upload started do not apply to it.
+        with override_settings(FILESTORAGE_MAX_UPLOAD_SIZES={"default": 1024}):
+            filestorage.complete_multipart_upload(
+                upload["document_id"],
+                upload["upload_id"],
+                [{"part_number": 1, "etag": etag}],
+                user=self.user,
+            )
+            self.assertEqual(self.save(upload["file_url"]).size, 2048)
+
+
+class FileResponseTest(TestCase):
+    content = b"0123456789"
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "a.txt")
+        self.write(self.content)
+
+    def write(self, content):
+        with open(self.path, "wb") as f:
+            f.write(content)
+
+    def get(self, **headers):
+        request = APIRequestFactory().get("/download/", headers=headers)
+        response = build_file_response(request, self.path, "docs/a.txt", "a.txt")
+        self.addCleanup(response.close)
+        if response.streaming:
+            return response, b"".join(response.streaming_content)
+        return response, response.content
+
+    def test_full_response(self):
+        response, body = self.get()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, self.content)
+        self.assertEqual(response["Content-Length"], "10")
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertEqual(response["Content-Type"], "text/plain")
+
+    def test_single_ranges(self):
+        for header, expected, content_range in (
+            ("bytes=2-4", b"234", "bytes 2-4/10"),
+            ("bytes=7-", b"789", "bytes 7-9/10"),
+            ("bytes=-3", b"789", "bytes 7-9/10"),
+            ("bytes=8-100", b"89", "bytes 8-9/10"),
+            ("bytes=-100", self.content, "bytes 0-9/10"),
+        ):
+            with self.subTest(header):
+                response, body = self.get(Range=header)
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(body, expected)
+                self.assertEqual(response["Content-Range"], content_range)
+                self.assertEqual(response["Content-Length"], str(len(expected)))
+
+    def test_unsupported_or_malformed_ranges_are_ignored(self):
+        for header in ("bytes=0-1,4-5", "bytes=4-2", "bytes=-", "items=0-1", "x"):
+            with self.subTest(header):
+                response, body = self.get(Range=header)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(body, self.content)
+
+    def test_unsatisfiable_ranges(self):
+        for content, header in (
+            (self.content, "bytes=10-"),
+            (self.content, "bytes=-0"),
+            (b"", "bytes=-5"),
+            (b"", "bytes=0-"),
+        ):
+            with self.subTest(size=len(content), header=header):
+                self.write(content)
+                response, _ = self.get(Range=header)
+                self.assertEqual(response.status_code, 416)
+                self.assertEqual(response["Content-Range"], f"bytes */{len(content)}")
+
+    def test_etag_and_if_none_match(self):
+        etag = self.get()[0]["ETag"]
+
+        response, _ = self.get(If_None_Match=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+
+        self.assertEqual(self.get(If_None_Match='"other"')[0].status_code, 200)
+        self.assertEqual(self.get(If_None_Match="*")[0].status_code, 304)
+
+    def test_if_range(self):
+        etag = self.get()[0]["ETag"]
+
+        response, body = self.get(Range="bytes=0-1", If_Range=etag)
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(body, b"01")
+
+        response, body = self.get(Range="bytes=0-1", If_Range='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, self.content)
+
+    @override_settings(
+        FILESTORAGE_SENDFILE_BACKEND="nginx",
+        FILESTORAGE_SENDFILE_URL_PREFIX="/protected/",
+    )
+    def test_nginx_accel_redirect(self):
+        response, body = self.get(Range="bytes=0-1")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, b"")
+        self.assertEqual(response["X-Accel-Redirect"], "/protected/docs/a.txt")
+        self.assertEqual(
+            response["Content-Disposition"], "inline; filename*=UTF-8''a.txt"
+        )
+
+    @override_settings(FILESTORAGE_SENDFILE_BACKEND="apache")
+    def test_apache_sendfile(self):
+        response, body = self.get()
+
+        self.assertEqual(body, b"")
+        self.assertEqual(response["X-Sendfile"], self.path)
+        self.assertNotIn("X-Accel-Redirect", response)
+
+
+class ZipExportTest(LocalStorageTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        Group.objects.get_or_create(name=UserRoles.ADMIN)
+        self.other = CustomUser.objects.create(email="other@example.com")
+        self.admin = CustomUser.objects.create(email="admin@example.com")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.admin.make_admin()
+
+    def export(self, user):
+        _, chunks = filestorage.export_object_files_zip(
+            "user.customuser", self.user.pk, user=user
+        )
+        return zipfile.ZipFile(io.BytesIO(b"".join(chunks)))
+
+    def test_entries_are_stored_or_deflated_by_type(self):
+        self.create_file(self.store("photo.png", b"png" * 1000))
+        self.create_file(self.store("notes.txt", b"text" * 1000))
+
+        archive = self.export(self.user)
+
+        self.assertEqual(archive.getinfo("photo.png").compress_type, zipfile.ZIP_STORED)
+        self.assertEqual(
+            archive.getinfo("notes.txt").compress_type, zipfile.ZIP_DEFLATED
+        )
+        self.assertEqual(archive.read("notes.txt"), b"text" * 1000)
+        self.assertIsNone(archive.testzip())
+
+    def test_only_uploaders_and_admins_get_files(self):
+        self.create_file(self.store("mine.txt"))
+        other = self.create_file(self.store("theirs.txt"))
+        other.uploaded_by = self.other
+        other.save()
+
+        self.assertEqual(self.export(self.user).namelist(), ["mine.txt"])
+        self.assertEqual(self.export(self.other).namelist(), ["theirs.txt"])
+        self.assertEqual(
+            sorted(self.export(self.admin).namelist()), ["mine.txt", "theirs.txt"]
+        )
+
+    def test_keys_outside_uploads_are_not_read(self):
+        with open(os.path.join(self.media_root, "secret.txt"), "wb") as f:
+            f.write(b"secret")
+        self.create_file(self.storage.get_url("../secret.txt"))
+
+        self.assertEqual(self.export(self.user).namelist(), [])
+        with self.assertRaises(ValueError):
+            self.storage.open("../secret.txt")
+
+    @override_settings(FILESTORAGE_ZIP_CHUNK_SIZE=1024 * 1024)
+    def test_memory_stays_constant(self):
+        self.storage.upload(ZeroStream(32 * 1024 * 1024), "video.mp4")
+        self.create_file(self.storage.get_url("video.mp4"))
+
+        tracemalloc.start()
+        try:
+            _, chunks = filestorage.export_object_files_zip(
+                "user.customuser", self.user.pk, user=self.user
+            )
+            size = sum(len(chunk) for chunk in chunks)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        self.assertGreater(size, 32 * 1024 * 1024)
+        self.assertLess(peak, 8 * 1024 * 1024)
+
+    @benchmark
+    def test_benchmark(self):
+        for name in ("video.mp4", "dump.bin"):
+            self.storage.upload(ZeroStream(600 * 1024 * 1024), name)
+            self.create_file(self.storage.get_url(name))
+
+        tracemalloc.start()
+        started = time.perf_counter()
+        _, chunks = filestorage.export_object_files_zip(
+            "user.customuser", self.user.pk, user=self.user
+        )
+        size = sum(len(chunk) for chunk in chunks)
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(
+            f"\nzip export of 1200 MB ({size >> 20} MB archive): {elapsed:.1f}s, "
+            f"{1200 / elapsed:.0f} MB/s, peak allocations {peak >> 10} KiB"
+        )
+
+
+def shelved_key(prefix, token, name, created=None):
+    """A custom key strategy."""
+    return f"{prefix}/shelf/{token}_{name}"
+
+
+class KeyStrategyTest(LocalStorageTestMixin, TestCase):
+    def test_keys_split_back_into_their_parts(self):
+        for strategy in ("flat", "hash", "date", "random_prefix"):
+            with override_settings(FILESTORAGE_KEY_STRATEGY=strategy):
+                key = generate_storage_key("Quarterly Report.PDF", "invoices/2024")
+                layout, prefix, token, name = split_storage_key(key)
+            self.assertEqual(
+                (layout, prefix, name),
+                (strategy, "invoices/2024", "quarterly-report.pdf"),
+            )
+            self.assertIn(token, key)
+
+    @override_settings(FILESTORAGE_KEY_STRATEGY="hash")
+    def test_flat_keys_keep_resolving(self):
+        flat_url = self.store(f"uploads/{'a' * 32}_old.txt")
+        file = self.create_file(flat_url)
+
+        download = filestorage.get_local_download(file.pk, user=self.user)
+
+        self.assertEqual(download["document_id"], f"uploads/{'a' * 32}_old.txt")
+        self.assertTrue(os.path.isfile(download["path"]))
+
+    def test_relocation_command_moves_files_in_batches(self):
+        files = [
+            self.create_file(self.store(f"uploads/{i:032x}_{i}.txt", b"%d" % i))
+            for i in range(5)
+        ]
+        out = io.StringIO()
+
+        call_command(
+            "relocate_storage_keys", "--strategy=hash", "--batch-size=2", stdout=out
+        )
+        # Running it again finds nothing left to move.
+        call_command("relocate_storage_keys", "--strategy=hash", stdout=io.StringIO())
+
+        self.assertIn("Relocated 5 of 5 files", out.getvalue())
+        for i, file in enumerate(files):
+            file.refresh_from_db()
+            document_id = self.storage.get_document_id(file.file)
+            self.assertEqual(split_storage_key(document_id)[0], "hash")
+            with open(self.storage.get_path(document_id), "rb") as f:
+                self.assertEqual(f.read(), b"%d" % i)
+            self.assertFalse(
+                os.path.exists(self.storage.get_path(f"uploads/{i:032x}_{i}.txt"))
+            )
+
+    def test_layout_is_read_from_the_marker_not_the_shape(self):
+        token = "ab12cd34" + "0" * 24
+        for key, expected in (
+            # Flat keys whose folder looks like another layout stay flat.
+            (f"reports/2024/05/17/{token}_a.pdf", ("flat", "reports/2024/05/17")),
+            (f"ab12/uploads/{token}_a.pdf", ("flat", "ab12/uploads")),
+            (f"uploads/ab/12/{token}_a.pdf", ("flat", "uploads/ab/12")),
+            (f"reports/2024/05/17/{token}-f_a.pdf", ("flat", "reports/2024/05/17")),
+            (f"ab12/uploads/{token}-r_a.pdf", ("random_prefix", "uploads")),
+            (f"uploads/2024/05/17/{token}-d_a.pdf", ("date", "uploads")),
+            # A marker the key's shape does not match, or an unknown one.
+            (f"uploads/{token}-h_a.pdf", None),
+            (f"uploads/{token}-d_a.pdf", None),
+            (f"uploads/{token}-x_a.pdf", None),
+        ):
+            with self.subTest(key):
+                parts = split_storage_key(key)
+                self.assertEqual(parts and parts[:2], expected)
+
+    def test_custom_strategy_keys_are_not_relocated(self):
+        with override_settings(
+            FILESTORAGE_KEY_STRATEGY="apps.filestorage.tests.shelved_key"
+        ):
+            key = generate_storage_key("a.txt", "uploads")
+        with override_settings(FILESTORAGE_KEY_STRATEGY="hash"):
+            hashed = generate_storage_key("a.txt", "uploads")
+
+        self.assertRegex(key, r"^uploads/shelf/[0-9a-f]{32}-x_a.txt$")
+        self.assertIsNone(split_storage_key(key))
+        self.assertEqual(split_storage_key(hashed)[0], "hash")
+        flat = f"uploads/{'a' * 32}_a.txt"
+        self.assertIsNone(relocated_key(flat, flat_key))
+        self.assertEqual(
+            relocated_key(flat, hashed_key), f"uploads/aa/aa/{'a' * 32}-h_a.txt"
+        )
+
+    @benchmark
+    def test_benchmark(self):
+        count = int(os.getenv("BENCHMARK_FILE_COUNT", 1000000))
+        for strategy in ("flat", "hash"):
+            with override_settings(FILESTORAGE_KEY_STRATEGY=strategy):
+                started = time.perf_counter()
+                keys = generate_storage_keys([("file.txt", "uploads")] * count)
+                generated = time.perf_counter() - started
+
+            started = time.perf_counter()
+            for key in keys:
+                path = self.storage.get_path(key)
+                try:
+                    open(path, "xb").close()
+                except FileNotFoundError:
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    open(path, "xb").close()
+            created = time.perf_counter() - started
+
+            sample = keys[:: max(1, count // 10000)]
+            started = time.perf_counter()
+            for key in sample:
+                self.storage.stat(key)
+            looked_up = time.perf_counter() - started
+            print(
+                f"\n{strategy} keys, {count} files: {count / generated:.0f} keys/s, "
+                f"{count / created:.0f} creates/s, {len(sample) / looked_up:.0f} "
+                f"lookups/s"
+            )
+            shutil.rmtree(self.storage.get_path("uploads"))
+
+
+@override_settings(
+    **S3_SETTINGS,
+    FILESTORAGE_KEY_STRATEGY="hash",
+    FILESTORAGE_MAX_UPLOAD_SIZES={"avatars": 100, "default": 10**9},
+)
+class KeyStrategySizeCapTest(S3StorageTestMixin, TestCase):
+    def test_size_cap_uses_the_folder_of_fanned_out_keys(self):
+        key = generate_storage_key("me.png", "avatars")
+        upload_id = self.storage.create_multipart_upload(key, "image/png")
+        # A row from before caps were recorded, so the key's folder decides.
+        MultipartUpload.objects.create(upload_id=upload_id, document_id=key)
+        etag = self.storage.s3.upload_part(
+            Bucket="bucket",
+            Key=key,
+            UploadId=upload_id,
+            PartNumber=1,
+            Body=bytes(101),
+        )["ETag"]
+
+        with self.assertRaisesMessage(ValidationError, "100 byte limit"):
+            filestorage.complete_multipart_upload(
+                key, upload_id, [{"part_number": 1, "etag": etag}]
+            )
+
+        uploads = self.storage.s3.list_multipart_uploads(Bucket="bucket")
+        self.assertEqual(uploads.get("Uploads", []), [])
+        self.assertIsNone(self.storage.stat(key))
+
+
+class ReconcileStorageTest(LocalStorageTestMixin, TestCase):
+    def events(self, **kwargs):
+        return list(filestorage.reconcile_storage(**kwargs))
+
+    def test_orphans_and_dangling_rows_are_reported_in_key_order(self):
+        self.create_file(self.store("uploads/b.txt"))
+        self.store("uploads/a.txt")
+        self.store("uploads/c/d.txt")
+        dangling = self.create_file(self.storage.get_url("uploads/c-d.txt"))
+        # Soft-deleted rows still claim their object but are never dangling.
+        self.create_file(self.store("uploads/e.txt"), deleted_at=timezone.now())
+        self.create_file(self.storage.get_url("uploads/f.txt")).delete()
+
+        self.assertEqual(
+            self.events(),
+            [
+                ("orphan", "uploads/a.txt"),
+                ("dangling", "uploads/c-d.txt", dangling.pk),
+                ("orphan", "uploads/c/d.txt"),
+            ],
+        )
+
+    def test_prefix_and_grace(self):
+        self.store("other/a.txt")
+        self.store("uploads/old.txt")
+        os.utime(self.storage.get_path("uploads/old.txt"), (0, 0))
+        self.store("uploads/new.txt")
+        self.create_file(self.storage.get_url("uploads/gone.txt"))
+
+        events = self.events(prefix="uploads/", grace=datetime.timedelta(hours=1))
+
+        self.assertEqual(events, [("orphan", "uploads/old.txt")])
+
+    def test_checkpoints_resume_where_they_left_off(self):
+        for i in range(5):
+            self.store(f"uploads/{i}.txt")
+
+        events = self.events(checkpoint_every=2)
+        after_first = events.index(("checkpoint", "uploads/1.txt")) + 1
+
+        self.assertEqual(
+            [event for event in events if event[0] == "checkpoint"],
+            [("checkpoint", "uploads/1.txt"), ("checkpoint", "uploads/3.txt")],
+        )
+        resumed = self.events(start_after="uploads/1.txt", checkpoint_every=2)
+        self.assertEqual(resumed, events[after_first:])
+
+    def test_orphans_are_rechecked_before_deletion(self):
+        keys = ["uploads/orphan.txt", "uploads/live.txt", "uploads/deleted.txt"]
+        for key in keys + ["content/shared"]:
+            self.store(key)
+        # Saved after the listing reported them.
+        self.create_file(self.storage.get_url("uploads/live.txt"))
+        self.create_file(
+            self.storage.get_url("uploads/deleted.txt"), deleted_at=timezone.now()
+        )
+        StoredObject.objects.create(sha256="0" * 64, document_id="content/shared")
+
+        with CaptureQueriesContext(connection) as queries:
+            deleted = filestorage.delete_orphaned_objects(keys + ["content/shared"])
+
+        self.assertEqual(deleted, 1)
+        self.assertIsNone(self.storage.stat("uploads/orphan.txt"))
+        for key in keys[1:] + ["content/shared"]:
+            self.assertIsNotNone(self.storage.stat(key))
+        self.assertFalse(any("LIKE" in query["sql"] for query in queries))
+
+    def test_command_fixes_what_it_finds(self):
+        self.store("uploads/orphan.txt")
+        dangling = self.create_file(self.storage.get_url("uploads/gone.txt"))
+        out = io.StringIO()
+
+        call_command(
+            "reconcile_storage",
+            "--grace-hours=0",
+            "--fix-orphans",
+            "--fix-dangling",
+            stdout=out,
+        )
+
+        self.assertIn("1 orphaned objects, 1 dangling rows, 2 fixed", out.getvalue())
+        self.assertIsNone(self.storage.stat("uploads/orphan.txt"))
+        self.assertFalse(Files.objects.filter(pk=dangling.pk).exists())
+        self.assertTrue(Files.all_objects.filter(pk=dangling.pk).exists())
+
+
+@override_settings(**S3_SETTINGS)
+@mock.patch("apps.filestorage.storage.aio.asyncio.sleep", new_callable=mock.AsyncMock)
+class AsyncS3RetryTest(S3StorageTestMixin, TestCase):
+    def stat(self, responses):
+        service = AsyncS3StorageService(self.storage)
+        with mock.patch.object(
+            AsyncHTTPConnectionPool, "request", side_effect=responses
+        ) as request:
+            try:
+                return asyncio.run(service.stat("uploads/a.txt"))
+            finally:
+                self.request_count = request.call_count
+
+    def test_resets_and_5xx_are_retried(self, sleep):
+        result = self.stat(
+            [
+                ConnectionResetError("reset by peer"),
+                (503, {}),
+                (200, {"content-length": "4", "etag": '"abc"'}),
+            ]
+        )
+        self.assertEqual(result["size"], 4)
+        self.assertEqual(self.request_count, 3)
+        self.assertEqual(sleep.await_count, 2)
+
+    @override_settings(AWS_S3_MAX_ATTEMPTS=2)
+    def test_gives_up_after_max_attempts(self, sleep):
+        with self.assertRaises(ClientError) as caught:
+            self.stat([(500, {}), (500, {}), (200, {})])
+        self.assertEqual(caught.exception.response["Error"]["Code"], "500")
+        self.assertEqual(self.request_count, 2)
+
+        with self.assertRaises(ConnectionResetError):
+            self.stat([ConnectionResetError(), ConnectionResetError()])
+
+    def test_client_errors_are_not_retried(self, sleep):
+        self.assertIsNone(self.stat([(404, {})]))
+        self.assertEqual(self.request_count, 1)
+
+        for status in (400, 403):
+            with self.assertRaises(ClientError) as caught:
+                self.stat([(status, {}), (200, {})])
+            self.assertEqual(caught.exception.response["Error"]["Code"], str(status))
+            self.assertEqual(self.request_count, 1)
+        sleep.assert_not_awaited()
+
+
+class AsyncHTTPConnectionPoolTest(TestCase):
+    def request(self, *replies):
+        """Send two HEAD requests to a server answering with ``replies``."""
+        connections = []
+
+        async def handle(reader, writer):
+            connections.append(writer)
+            for reply in replies:
+                await reader.readuntil(b"\r\n\r\n")
+                writer.write(reply)
+                await writer.drain()
+            writer.close()
+
+        async def main():
+            server = await asyncio.start_server(handle, "127.0.0.1", 0)
+            port = server.sockets[0].getsockname()[1]
+            pool = AsyncHTTPConnectionPool("http", "127.0.0.1", port)
+            try:
+                return [
+                    await pool.request("HEAD", "/bucket/a.txt", "127.0.0.1")
+                    for _ in range(2)
+                ]
+            finally:
+                await pool.close()
+                server.close()
+                await server.wait_closed()
+
+        return asyncio.run(main()), len(connections)
+
+    def test_interim_responses_are_skipped(self):
+        final = b'HTTP/1.1 200 OK\r\nContent-Length: 4\r\nETag: "abc"\r\n\r\n'
+        responses, connections = self.request(
+            b"HTTP/1.1 100 Continue\r\n\r\n" + final,
+            b"HTTP/1.1 103 Early Hints\r\nLink: </a>\r\n\r\n" + final,
+        )
+
+        self.assertEqual(
+            responses, [(200, {"content-length": "4", "etag": '"abc"'})] * 2
+        )
+        # Both requests went over the one keep-alive connection.
+        self.assertEqual(connections, 1)
+
+    def test_switching_protocols_is_refused(self):
+        with self.assertRaises(ConnectionError):
+            self.request(b"HTTP/1.1 101 Switching Protocols\r\n\r\n")
+
+
+class FakeS3Server(threading.Thread):
+    """
+    A stand-in for S3 on 127.0.0.1 that answers every request with a 404.
+
+    Each answer is delayed by ``latency`` seconds; connections are kept
+    alive, as S3's are.
+    """
+
+    def __init__(self, latency):
+        super().__init__(daemon=True)
+        self.latency = latency
+        self.ready = threading.Event()
+
+    def run(self):
+        asyncio.run(self._serve())
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.stopped.set)
+        self.join()
+
+    async def _serve(self):
+        self.loop = asyncio.get_running_loop()
+        self.stopped = asyncio.Event()
+        server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.url = f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}"
+        self.ready.set()
+        async with server:
+            await self.stopped.wait()
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                await reader.readuntil(b"\r\n\r\n")
+                await asyncio.sleep(self.latency)
+                writer.write(b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\n\r\n")
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            # Client gone, or the server is shutting down.
+            writer.close()
+
+
+@override_settings(
+    **S3_SETTINGS,
+    ALLOWED_HOSTS=["127.0.0.1"],
+    FILESTORAGE_VERIFY_MISSING_TTL=0,
+)
+class AsyncViewLoadTest(TransactionTestCase):
+    """
+    Concurrent save-file-metadata requests under uvicorn, sync vs async views.
+
+    S3 answers HeadObject after 100ms with a 404, so each request does one
+    S3 round trip and no row is written; SQLite's single writer does not
+    limit the numbers.
+    """
+
+    def setUp(self):
+        s3 = FakeS3Server(latency=0.1)
+        s3.start()
+        s3.ready.wait()
+        self.addCleanup(s3.stop)
+        environ = mock.patch.dict(os.environ, {"AWS_ENDPOINT_URL_S3": s3.url})
+        environ.start()
+        self.addCleanup(environ.stop)
+        reset_storage_services()
+        self.addCleanup(reset_storage_services)
+
+        user = CustomUser.objects.create(email="load@example.com")
+        self.headers = {
+            "Authorization": f"Bearer {RefreshToken.for_user(user).access_token}",
+            "Content-Type": "application/json",
+        }
+        self.body = json.dumps(
+            {
+                "file_url": filestorage.get_storage_service().get_url("uploads/a.txt"),
+                "original_name": "a.txt",
+                "content_type": "user.customuser",
+                "object_id": user.pk,
+            }
+        )
+
+        sock = socket.create_server(("127.0.0.1", 0))
+        self.port = sock.getsockname()[1]
+        server = uvicorn.Server(
+            uvicorn.Config(get_asgi_application(), lifespan="off", log_level="warning")
+        )
+        thread = threading.Thread(target=server.run, kwargs={"sockets": [sock]})
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(setattr, server, "should_exit", True)
+        while not server.started:
+            time.sleep(0.01)
+
+    def load(self, path, concurrency, seconds=5):
+        """Send requests from ``concurrency`` clients; returns their latencies."""
+        deadline = time.perf_counter() + seconds
+
+        def client():
+            latencies = []
+            connection = http.client.HTTPConnection("127.0.0.1", self.port)
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                connection.request("POST", path, self.body, self.headers)
+                response = connection.getresponse()
+                response.read()
+                self.assertEqual(response.status, 400)
+                latencies.append(time.perf_counter() - started)
+            connection.close()
+            return latencies
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = [executor.submit(client) for _ in range(concurrency)]
+            return sorted(t for future in futures for t in future.result())
+
+    @benchmark
+    def test_benchmark(self):
+        for concurrency in (10, 50, 100):
+            for name, path in (
+                ("sync", "/files/save-file-metadata/"),
+                ("async", "/files/async/save-file-metadata/"),
+            ):
+                latencies = self.load(path, concurrency)
+                print(
+                    f"\n{name:>5} save-file-metadata, {concurrency:>3} clients: "
+                    f"{len(latencies) / 5:.0f} req/s, "
+                    f"p50 {latencies[len(latencies) // 2] * 1000:.0f}ms, "
+                    f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.0f}ms"
+                )
+
+
+@override_settings(**S3_SETTINGS, FILESTORAGE_USER_QUOTA=1000)
+class UserQuotaTest(S3StorageTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = CustomUser.objects.create(email="quota@example.com")
+
+    def size_limits(self, files):
+        presigned = filestorage.generate_batch_presigned_urls(files, user=self.user)
+        limits = []
+        for item in presigned["presigned"]:
+            policy = json.loads(base64.b64decode(item["fields"]["policy"]))
+            limits.extend(
+                condition[2]
+                for condition in policy["conditions"]
+                if isinstance(condition, list)
+                and condition[0] == "content-length-range"
+            )
+        return limits
+
+    def test_batch_shares_the_remaining_quota(self):
+        self.assertEqual(
+            self.size_limits([{"file_name": f"{i}.txt"} for i in range(3)]),
+            [333, 333, 333],
+        )
+        self.assertEqual(
+            self.size_limits(
+                [
+                    {"file_name": "a.txt"},
+                    {"file_name": "b.txt", "file_size": 600},
+                    {"file_name": "c.txt"},
+                ]
+            ),
+            [200, 600, 200],
+        )
+
+    def test_batch_over_quota_is_refused(self):
+        with self.assertRaisesMessage(ValidationError, "quota"):
+            self.size_limits(
+                [
+                    {"file_name": "a.txt", "file_size": 400},
+                    {"file_name": "b.txt", "file_size": 700},
+                ]
+            )
+        with self.assertRaisesMessage(ValidationError, "quota"):
+            self.size_limits(
+                [{"file_name": "a.txt", "file_size": 1000}, {"file_name": "b.txt"}]
+            )
+
+    def verified(self, size):
+        return mock.patch(
+            "apps.filestorage.services.verify_uploads",
+            side_effect=lambda urls: {
+                url: {"size": size, "etag": "e", "content_type": ""} for url in urls
+            },
+        )
+
+    def test_metadata_save_rechecks_the_quota(self):
+        with self.verified(600):
+            filestorage.save_file_metadata(
+                self.user,
+                "https://bkt.s3.amazonaws.com/uploads/a.txt",
+                "a.txt",
+                "user.customuser",
+                self.user.pk,
+                "",
+            )
+            with self.assertRaisesMessage(ValidationError, "quota"):
+                filestorage.save_file_metadata(
+                    self.user,
+                    "https://bkt.s3.amazonaws.com/uploads/b.txt",
+                    "b.txt",
+                    "user.customuser",
+                    self.user.pk,
+                    "",
+                )
+        self.assertEqual(Files.objects.count(), 1)
+
+    def test_batch_metadata_save_stops_at_the_quota(self):
+        records = [
+            {
+                "file_url": f"https://bkt.s3.amazonaws.com/uploads/{i}.txt",
+                "original_name": f"{i}.txt",
+                "content_type": "user.customuser",
+                "object_id": self.user.pk,
+            }
+            for i in range(3)
+        ]
+        with self.verified(400):
+            results = filestorage.save_batch_file_metadata(self.user, records)
+
+        self.assertEqual(["file" in result for result in results], [True, True, False])
+        self.assertEqual(results[2]["errors"], "Storage quota exceeded.")
+        self.assertEqual(filestorage.get_storage_usage(self.user)["total_bytes"], 800)
+
+
+class RebuildStorageUsageTest(TestCase):
+    def setUp(self):
+        self.users = [
+            CustomUser.objects.create(email=f"usage{i}@example.com") for i in range(5)
+        ]
+        self.content_type = ContentType.objects.get_for_model(CustomUser)
+
+    def create_file(self, user, object_id, size, **fields):
+        # Created directly, so the ledger does not see them.
+        return Files.objects.create(
+            file=f"https://example.com/{user.pk}-{object_id}-{size}",
+            original_name="a.txt",
+            content_type=self.content_type,
+            object_id=object_id,
+            uploaded_by=user,
+            size=size,
+            **fields,
+        )
+
+    def test_command_recomputes_both_ledgers_in_chunks(self):
+        expected_users = {}
+        expected_objects = {}
+        for i, user in enumerate(self.users):
+            for object_id in range(i + 1):
+                self.create_file(user, object_id, 10 * (i + 1))
+                users = expected_users.setdefault(user.pk, [0, 0])
+                objects = expected_objects.setdefault(object_id, [0, 0])
+                for totals in (users, objects):
+                    totals[0] += 1
+                    totals[1] += 10 * (i + 1)
+        self.create_file(self.users[0], 99, 1000, deleted_at=timezone.now())
+        # Drifted and stale ledger rows are replaced or dropped.
+        UserStorageUsage.objects.create(user=self.users[0], file_count=7, total_bytes=7)
+        ObjectStorageUsage.objects.create(
+            content_type=self.content_type, object_id=99, file_count=1, total_bytes=1
+        )
+        out = io.StringIO()
+
+        call_command("rebuild_storage_usage", "--chunk-size=2", stdout=out)
+
+        self.assertIn("Done: 5 user rows, 5 object rows", out.getvalue())
+        self.assertEqual(
+            {
+                row.user_id: [row.file_count, row.total_bytes]
+                for row in UserStorageUsage.objects.all()
+            },
+            expected_users,
+        )
+        self.assertEqual(
+            {
+                row.object_id: [row.file_count, row.total_bytes]
+                for row in ObjectStorageUsage.objects.all()
+            },
+            expected_objects,
+        )
+
+    def test_each_chunk_aggregates_only_its_own_keys(self):
+        for user in self.users:
+            self.create_file(user, user.pk, 10)
+
+        with CaptureQueriesContext(connection) as queries:
+            filestorage.rebuild_storage_usage(chunk_size=2)
+
+        aggregates = [query["sql"] for query in queries if "GROUP BY" in query["sql"]]
+        # One aggregate per chunk, three chunks per ledger; chunk bounds are
+        # found without aggregating the rest of the table.
+        self.assertEqual(len(aggregates), 6)
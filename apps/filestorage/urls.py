@@ -0,0 +1,33 @@
+from django.urls import include, path
+from rest_framework.routers import DefaultRouter
+
+from . import async_views
+from .views import FileUploadViewSet
+
+router = DefaultRouter()
+router.register(r"", FileUploadViewSet, basename="files")
+
+# Async variants for ASGI deployments; same request and response bodies.
+async_urlpatterns = [
+    path(
+        "generate-presigned-url/",
+        async_views.generate_presigned_url_view,
+        name="async-generate-presigned-url",
+    ),
+    path(
+        "save-file-metadata/",
+        async_views.save_file_metadata_view,
+        name="async-save-file-metadata",
+    ),
+    path(
+        "save-batch-file-metadata/",
+        async_views.save_batch_file_metadata_view,
+        name="async-save-batch-file-metadata",
+    ),
+    path("delete-file/", async_views.delete_file_view, name="async-delete-file"),
+]
+
+urlpatterns = [
+    path("async/", include(async_urlpatterns)),
+    path("", include(router.urls)),
+]
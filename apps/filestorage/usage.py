@@ -0,0 +1,249 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Files, ObjectStorageUsage, UserStorageUsage
+
+
+def _usage_row(file):
+    return (file.uploaded_by_id, file.content_type_id, file.object_id, file.size)
+
+
+def _apply_deltas(rows, sign):
+    users = defaultdict(lambda: [0, 0])
+    objects = defaultdict(lambda: [0, 0])
+    for user_id, content_type_id, object_id, size in rows:
+        if user_id is not None:
+            users[user_id][0] += 1
+            users[user_id][1] += size or 0
+        objects[(content_type_id, object_id)][0] += 1
+        objects[(content_type_id, object_id)][1] += size or 0
+
+    now = timezone.now()
+    # Sorted so concurrent writers lock ledger rows in the same order.
+    for user_id in sorted(users):
+        count, size = users[user_id]
+        _adjust(UserStorageUsage, {"user_id": user_id}, sign * count, sign * size, now)
+    for content_type_id, object_id in sorted(objects):
+        count, size = objects[(content_type_id, object_id)]
+        _adjust(
+            ObjectStorageUsage,
+            {"content_type_id": content_type_id, "object_id": object_id},
+            sign * count,
+            sign * size,
+            now,
+        )
+
+
+def _adjust(model, lookup, count, size, now):
+    changes = {
+        "file_count": F("file_count") + count,
+        "total_bytes": F("total_bytes") + size,
+        "updated_at": now,
+    }
+    if model.objects.filter(**lookup).update(**changes) or count < 0:
+        return
+    model.objects.bulk_create([model(**lookup)], ignore_conflicts=True)
+    model.objects.filter(**lookup).update(**changes)
+
+
+def record_usage(files):
+    """
+    Count newly created Files rows in the usage ledger.
+
+    Must run in the transaction that inserts the rows, so the ledger and
+    the files table commit together. Rows without a verified size count as
+    zero bytes.
+    """
+    _apply_deltas([_usage_row(file) for file in files], 1)
+
+
+def soft_delete_files(queryset):
+    """
+    Soft-delete the live rows of ``queryset`` and take them off the ledger.
+
+    The rows are locked first, so a row deleted twice concurrently is only
+    subtracted once. Returns the number of rows deleted.
+    """
+    with transaction.atomic():
+        rows = list(
+            queryset.filter(deleted_at__isnull=True)
+            .select_for_update()
+            .values_list("id", "uploaded_by_id", "content_type_id", "object_id", "size")
+        )
+        if not rows:
+            return 0
+        Files.all_objects.filter(id__in=[row[0] for row in rows]).update(
+            deleted_at=timezone.now()
+        )
+        _apply_deltas([row[1:] for row in rows], -1)
+    return len(rows)
+
+
+def _totals(row):
+    return row or {"file_count": 0, "total_bytes": 0}
+
+
+def get_user_usage(user):
+    return _totals(
+        UserStorageUsage.objects.filter(user_id=user.pk)
+        .values("file_count", "total_bytes")
+        .first()
+    )
+
+
+def get_object_usage(content_type, object_id):
+    return _totals(
+        ObjectStorageUsage.objects.filter(
+            content_type=content_type, object_id=object_id
+        )
+        .values("file_count", "total_bytes")
+        .first()
+    )
+
+
+def _quota_for(user):
+    quota = getattr(settings, "FILESTORAGE_USER_QUOTA", 0)
+    if not quota or user is None or not user.is_authenticated:
+        return None
+    return quota
+
+
+def get_remaining_quota(user):
+    """Bytes ``user`` may still upload, or None without a quota; one row lookup."""
+    quota = _quota_for(user)
+    if quota is None:
+        return None
+    return max(quota - get_user_usage(user)["total_bytes"], 0)
+
+
+def lock_remaining_quota(user):
+    """
+    Like ``get_remaining_quota``, but locks the user's ledger row.
+
+    Must run in a transaction; concurrent saves for the same user then
+    check their sizes one after another instead of spending the same bytes.
+    """
+    quota = _quota_for(user)
+    if quota is None:
+        return None
+    UserStorageUsage.objects.bulk_create(
+        [UserStorageUsage(user_id=user.pk)], ignore_conflicts=True
+    )
+    used = (
+        UserStorageUsage.objects.select_for_update()
+        .filter(user_id=user.pk)
+        .values_list("total_bytes", flat=True)
+        .get()
+    )
+    return max(quota - used, 0)
+
+
+async def aget_remaining_quota(user):
+    quota = _quota_for(user)
+    if quota is None:
+        return None
+    used = (
+        await UserStorageUsage.objects.filter(user_id=user.pk)
+        .values_list("total_bytes", flat=True)
+        .afirst()
+    )
+    return max(quota - (used or 0), 0)
+
+
+def _after(fields, key):
+    """Rows whose ``fields`` sort after ``key``, as a row-value comparison."""
+    condition = Q()
+    for index, field in enumerate(fields):
+        equal = {name: value for name, value in zip(fields[:index], key)}
+        condition |= Q(**equal, **{f"{field}__gt": key[index]})
+    return condition
+
+
+def _rebuild_ledger(model, unique_fields, files, file_fields, chunk_size):
+    ledger_fields = [model._meta.get_field(name).attname for name in unique_fields]
+
+    def totals(queryset):
+        return (
+            queryset.values(*file_fields)
+            .annotate(file_count=Count("id"), total_bytes=Coalesce(Sum("size"), 0))
+            .order_by(*file_fields)
+        )
+
+    last = None
+    written = 0
+    while True:
+        page = files if last is None else files.filter(_after(file_fields, last))
+        # The chunk ends at the chunk_size-th distinct key. Finding it walks
+        # the index in key order; aggregating everything that is left to
+        # find it would make the rebuild quadratic.
+        keys = page.order_by(*file_fields).values_list(*file_fields).distinct()
+        try:
+            upper = keys[chunk_size - 1]
+        except IndexError:
+            upper = None
+
+        with transaction.atomic():
+            ledger = model.objects.all()
+            if last is not None:
+                ledger = ledger.filter(_after(ledger_fields, last))
+            if upper is not None:
+                page = page.exclude(_after(file_fields, upper))
+                ledger = ledger.exclude(_after(ledger_fields, upper))
+
+            # Writers update ledger rows in the transaction that changes
+            # Files, so holding these locks while summing keeps them exact.
+            list(ledger.select_for_update().values_list("pk", flat=True))
+            now = timezone.now()
+            rows = [
+                model(
+                    **dict(zip(ledger_fields, (row[field] for field in file_fields))),
+                    file_count=row["file_count"],
+                    total_bytes=row["total_bytes"],
+                    updated_at=now,
+                )
+                for row in totals(page)
+            ]
+            ledger.delete()
+            model.objects.bulk_create(
+                rows,
+                update_conflicts=True,
+                unique_fields=unique_fields,
+                update_fields=["file_count", "total_bytes", "updated_at"],
+            )
+            written += len(rows)
+
+        if upper is None:
+            return written
+        last = upper
+
+
+def rebuild_usage(chunk_size=1000):
+    """
+    Recompute the usage ledger from live Files rows.
+
+    Works through uploaders and then attached objects in key order,
+    ``chunk_size`` ledger rows per transaction, replacing each range of
+    ledger rows with fresh totals. Returns the number of rows written per
+    ledger.
+    """
+    return {
+        "users": _rebuild_ledger(
+            UserStorageUsage,
+            ["user"],
+            Files.objects.filter(uploaded_by__isnull=False),
+            ("uploaded_by_id",),
+            chunk_size,
+        ),
+        "objects": _rebuild_ledger(
+            ObjectStorageUsage,
+            ["content_type", "object_id"],
+            Files.objects.all(),
+            ("content_type_id", "object_id"),
+            chunk_size,
+        ),
+    }
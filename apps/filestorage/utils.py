@@ -1,17 +1,176 @@
 import os
 import re
 import unicodedata
-import uuid
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+_INVALID_CHARS_RE = re.compile(r"[^a-zA-Z0-9-_\.]")
+_REPEATED_DASH_RE = re.compile(r"-{2,}")
 
 
 def clean_filename(filename):
     name, ext = os.path.splitext(filename)
     name = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode("ascii")
-    name = re.sub(r"[^a-zA-Z0-9-_\.]", "-", name)
-    name = re.sub(r"-{2,}", "-", name).strip("-").lower()
+    name = _INVALID_CHARS_RE.sub("-", name)
+    name = _REPEATED_DASH_RE.sub("-", name).strip("-").lower()
     return f"{name}{ext.lower()}"
 
 
+def flat_key(prefix, token, name, created=None):
+    """``uploads/<token>_<name>``: every object in one directory."""
+    return f"{prefix}/{token}_{name}"
+
+
+def hashed_key(prefix, token, name, created=None):
+    """``uploads/ab/cd/<token>_<name>``: 65,536 directories fed evenly."""
+    return f"{prefix}/{token[:2]}/{token[2:4]}/{token}_{name}"
+
+
+def dated_key(prefix, token, name, created=None):
+    """``uploads/2024/05/17/<token>_<name>``: partitioned by upload day."""
+    created = timezone.localtime(created or timezone.now())
+    return f"{prefix}/{created:%Y/%m/%d}/{token}_{name}"
+
+
+def random_prefix_key(prefix, token, name, created=None):
+    """
+    ``ab12/uploads/<token>_<name>``: random leading characters.
+
+    Spreads writes over S3 partitions from the first byte of the key, at the
+    cost of no longer being able to list or expire objects by folder prefix.
+    """
+    return f"{token[:4]}/{prefix}/{token}_{name}"
+
+
+KEY_STRATEGIES = {
+    "flat": flat_key,
+    "hash": hashed_key,
+    "date": dated_key,
+    "random_prefix": random_prefix_key,
+}
+
+# The token in a generated key ends with a marker for the strategy that laid
+# it out, e.g. ``uploads/ab/cd/<hex>-h_<name>``, so keys split back without
+# guessing from their shape. Keys from before markers have none; they are
+# all flat. Keys from custom strategies are marked "x" and never split.
+KEY_LAYOUT_MARKERS = {"flat": "f", "hash": "h", "date": "d", "random_prefix": "r"}
+CUSTOM_LAYOUT_MARKER = "x"
+
+_LAYOUTS_BY_MARKER = {marker: name for name, marker in KEY_LAYOUT_MARKERS.items()}
+_TOKEN_NAME_RE = re.compile(r"^([0-9a-f]{32})(?:-([a-z]))?_(.+)$")
+_DATE_SUFFIX_RE = re.compile(r"/\d{4}/\d{2}/\d{2}$")
+
+
+def get_key_strategy(name=None):
+    """
+    Resolve a key strategy by name or dotted path (``FILESTORAGE_KEY_STRATEGY``).
+
+    A strategy is a callable ``(prefix, token, name, created=None) -> key``
+    where ``token`` is 32 random hex characters followed by the strategy's
+    layout marker (e.g. ``-h``) and ``name`` the cleaned file name. The token
+    must end up in the key's file name, directly before ``_<name>``.
+    """
+    name = name or getattr(settings, "FILESTORAGE_KEY_STRATEGY", "flat")
+    strategy = KEY_STRATEGIES.get(name)
+    if strategy is None:
+        strategy = import_string(name)
+    return strategy
+
+
+def _layout_marker(strategy):
+    for name, built_in in KEY_STRATEGIES.items():
+        if strategy is built_in:
+            return KEY_LAYOUT_MARKERS[name]
+    return CUSTOM_LAYOUT_MARKER
+
+
 def generate_storage_key(filename, prefix="uploads"):
     cleaned = clean_filename(filename)
-    return f"{prefix}/{uuid.uuid4().hex}_{cleaned}"
+    strategy = get_key_strategy()
+    token = f"{os.urandom(16).hex()}-{_layout_marker(strategy)}"
+    return strategy(prefix, token, cleaned)
+
+
+def generate_storage_keys(entries):
+    """
+    Generate storage keys for a list of (filename, prefix) pairs.
+
+    Draws the random part for the whole batch with a single ``os.urandom``
+    call; each key gets 128 random bits, like ``generate_storage_key``.
+    """
+    strategy = get_key_strategy()
+    marker = _layout_marker(strategy)
+    random_hex = os.urandom(16 * len(entries)).hex()
+    bounds = zip(range(0, len(random_hex), 32), range(32, len(random_hex) + 32, 32))
+    return [
+        strategy(prefix, f"{random_hex[start:end]}-{marker}", clean_filename(filename))
+        for (start, end), (filename, prefix) in zip(bounds, entries)
+    ]
+
+
+def split_storage_key(document_id):
+    """
+    Split a key made by ``generate_storage_key`` into its parts.
+
+    The layout is read from the marker in the key's token; a key that does
+    not have the shape its marker promises is not split.
+
+    Returns:
+        tuple: ``(layout, prefix, token, name)`` where ``layout`` is the
+        built-in strategy that produced the key and ``token`` its 32 hex
+        characters, or None for keys of any other shape (e.g.
+        content-addressed keys or keys from custom strategies).
+    """
+    directory, _, basename = document_id.rpartition("/")
+    match = _TOKEN_NAME_RE.match(basename)
+    if not directory or not match:
+        return None
+    token, marker, name = match.groups()
+    layout = _LAYOUTS_BY_MARKER.get(marker or KEY_LAYOUT_MARKERS["flat"])
+
+    prefix = None
+    if layout == "flat":
+        prefix = directory
+    elif layout == "hash":
+        fan_out = f"/{token[:2]}/{token[2:4]}"
+        if directory.endswith(fan_out):
+            prefix = directory.removesuffix(fan_out)
+    elif layout == "date":
+        if _DATE_SUFFIX_RE.search(directory):
+            prefix = _DATE_SUFFIX_RE.sub("", directory)
+    elif layout == "random_prefix":
+        head, _, rest = directory.partition("/")
+        if head == token[:4]:
+            prefix = rest
+    if not prefix:
+        return None
+    return layout, prefix, token, name
+
+
+def relocated_key(document_id, strategy, created=None):
+    """
+    Key a flat ``document_id`` moves to under ``strategy``, or None.
+
+    Token and file name are kept, so relocating is idempotent; keys that
+    are not flat, and moves to the flat layout, are left alone.
+    """
+    parts = split_storage_key(document_id)
+    marker = _layout_marker(strategy)
+    if parts is None or parts[0] != "flat" or marker == KEY_LAYOUT_MARKERS["flat"]:
+        return None
+    _, prefix, token, name = parts
+    return strategy(prefix, f"{token}-{marker}", name, created=created)
+
+
+_SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+def is_sha256(value):
+    return bool(value) and bool(_SHA256_RE.match(value))
+
+
+def generate_content_key(sha256, prefix="content"):
+    """Storage key for content-addressed objects, fanned out by hash prefix."""
+    return f"{prefix}/{sha256[:2]}/{sha256[2:4]}/{sha256}"
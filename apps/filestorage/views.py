@@ -1,17 +1,30 @@
 import logging
 
+from django.contrib.contenttypes.models import ContentType
+from django.http import StreamingHttpResponse
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
 from rest_framework.exceptions import ValidationError
 from rest_framework.parsers import FormParser, JSONParser, MultiPartParser
 
+from apps.common.pagination import KeysetPagination
 from apps.common.responses import error_response, success_response
 
-from .serializers import FileSerializer
+from .downloads import build_file_response
+from .serializers import FileListSerializer, FileSerializer
 from .services import (
+    abort_multipart_upload,
+    complete_multipart_upload,
     delete_file_from_s3,
+    export_object_files_zip,
     generate_batch_presigned_urls,
     generate_presigned_url,
+    get_local_download,
+    get_object_files,
+    get_storage_usage,
+    initiate_multipart_upload,
+    presign_multipart_parts,
+    save_batch_file_metadata,
     save_file_metadata,
 )
 
@@ -20,14 +33,72 @@ logger = logging.getLogger(__name__)
 
 class FileUploadViewSet(viewsets.ViewSet):
     parser_classes = [JSONParser, MultiPartParser, FormParser]
+    lookup_value_regex = "[0-9]+"
+
+    def list(self, request):
+        """
+        List files attached to objects of one content type.
+
+        Query params: ``content_type`` ("app_label.model"), and either
+        ``object_id`` or a comma-separated ``object_ids``. Paginated with a
+        keyset cursor; pass the returned ``next_cursor`` as ``cursor``.
+        Non-admins only get the files they uploaded.
+        """
+        content_type = request.query_params.get("content_type")
+        raw_ids = request.query_params.get("object_ids") or request.query_params.get(
+            "object_id"
+        )
+        try:
+            object_ids = [int(value) for value in (raw_ids or "").split(",") if value]
+        except ValueError:
+            object_ids = []
+
+        if not content_type or not object_ids:
+            return error_response(
+                message="Validation failed",
+                error={
+                    "code": "INVALID_REQUEST",
+                    "details": "'content_type' and 'object_id' or 'object_ids' are required",
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        try:
+            queryset = get_object_files(content_type, object_ids, user=request.user)
+        except (ValueError, ContentType.DoesNotExist):
+            return error_response(
+                message="Validation failed",
+                error={
+                    "code": "INVALID_REQUEST",
+                    "details": f"Unknown content type '{content_type}'",
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(queryset, request)
+        return success_response(
+            data={
+                "results": FileListSerializer(page, many=True).data,
+                "next_cursor": paginator.get_next_cursor(),
+            },
+            message="Files fetched successfully",
+        )
 
     @action(methods=["post"], detail=False, url_path="generate-presigned-url")
     def generate_presigned_url_view(self, request):
         file_name = request.data.get("file_name")
         content_type = request.data.get("content_type", "application/octet-stream")
         folder_prefix = request.data.get("folder_prefix", "uploads")
+        sha256 = request.data.get("sha256")
         try:
-            result = generate_presigned_url(file_name, content_type, folder_prefix)
+            result = generate_presigned_url(
+                file_name,
+                content_type,
+                folder_prefix,
+                sha256=sha256,
+                user=request.user,
+            )
             return success_response(
                 data=result,
                 message="Presigned URL generated successfully",
@@ -59,8 +130,17 @@ class FileUploadViewSet(viewsets.ViewSet):
                 content_type_str=data["content_type"],
                 object_id=data["object_id"],
                 document_type=data.get("document_type", ""),
+                sha256=data.get("sha256", ""),
+                file_size=data.get("file_size"),
+                mime_type=data.get("mime_type"),
             )
             result = FileSerializer(uploaded_file).data
+        except ValidationError as e:
+            return error_response(
+                message="Validation failed",
+                error={"code": "FAILED_TO_SAVE_METADATA", "details": str(e)},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
         except Exception as e:
             logger.exception(f"Failed to save file metadata: {e}")
             return error_response(
@@ -75,6 +155,49 @@ class FileUploadViewSet(viewsets.ViewSet):
             status=status.HTTP_201_CREATED,
         )
 
+    @action(methods=["post"], detail=False, url_path="save-batch-file-metadata")
+    def save_batch_file_metadata(self, request):
+        records = request.data.get("files", [])
+        if not records or not isinstance(records, list):
+            return error_response(
+                message="File data not found in the request",
+                error={
+                    "code": "DATA_NOT_AVAILABLE",
+                    "details": "File details are not available in the request",
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        try:
+            results = save_batch_file_metadata(request.user, records)
+        except ValidationError as e:
+            return error_response(
+                message="Validation failed",
+                error={"code": "FAILED_TO_SAVE_METADATA", "details": str(e)},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        except Exception as e:
+            logger.exception(f"Failed to save batch file metadata: {e}")
+            return error_response(
+                message="Failed to save file metadata",
+                error={"code": "FAILED_TO_SAVE_METADATA", "details": str(e)},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            )
+
+        for result in results:
+            if "file" in result:
+                result["file"] = FileSerializer(result["file"]).data
+
+        return success_response(
+            data={
+                "created": sum(1 for result in results if "file" in result),
+                "failed": sum(1 for result in results if "errors" in result),
+                "results": results,
+            },
+            message="File Meta stored successfully",
+            status=status.HTTP_201_CREATED,
+        )
+
     @action(methods=["post"], detail=False, url_path="generate-batch-presigned-urls")
     def generate_batch_presigned_urls_view(self, request):
         files = request.data.get("files", [])
@@ -89,7 +212,7 @@ class FileUploadViewSet(viewsets.ViewSet):
             )
 
         try:
-            result = generate_batch_presigned_urls(files)
+            result = generate_batch_presigned_urls(files, user=request.user)
             return success_response(
                 data=result,
                 message="Presigned URLs generated successfully",
@@ -126,7 +249,7 @@ class FileUploadViewSet(viewsets.ViewSet):
             delete_file_from_s3(key, user=request.user)
             return success_response(
                 data={},
-                message="File deleted successfully from S3 and database",
+                message="File deleted successfully",
                 status=status.HTTP_200_OK,
             )
         except ValidationError as e:
@@ -142,3 +265,182 @@ class FileUploadViewSet(viewsets.ViewSet):
                 error={"code": "DELETE_FILE_FAILED", "details": str(e)},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR,
             )
+
+    @action(methods=["get"], detail=True, url_path="download")
+    def download(self, request, pk=None):
+        """
+        Download a file stored on the local backend.
+
+        Authorization happens here; the transfer is handed to the proxy
+        (X-Accel-Redirect / X-Sendfile) or to ``os.sendfile`` via FileResponse,
+        which honours Range, ETag and If-None-Match.
+        """
+        try:
+            download = get_local_download(pk, user=request.user)
+        except ValidationError as e:
+            return error_response(
+                message="Validation failed",
+                error={"code": "DOWNLOAD_FAILED", "details": str(e)},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return build_file_response(
+            request,
+            download["path"],
+            download["document_id"],
+            download["file_name"],
+        )
+
+    @action(methods=["get"], detail=False, url_path="usage")
+    def usage(self, request):
+        """
+        Storage used by the current user, or by one object.
+
+        Optional query params: ``content_type`` ("app_label.model") and
+        ``object_id`` to get the totals for that object's files instead.
+        """
+        content_type = request.query_params.get("content_type")
+        object_id = request.query_params.get("object_id")
+        if content_type and not (object_id or "").isdigit():
+            return error_response(
+                message="Validation failed",
+                error={
+                    "code": "INVALID_REQUEST",
+                    "details": "A numeric 'object_id' is required with 'content_type'",
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        try:
+            usage = get_storage_usage(
+                request.user, content_type, int(object_id) if content_type else None
+            )
+        except (ValueError, ContentType.DoesNotExist):
+            return error_response(
+                message="Validation failed",
+                error={
+                    "code": "INVALID_REQUEST",
+                    "details": f"Unknown content type '{content_type}'",
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return success_response(
+            data=usage, message="Storage usage fetched successfully"
+        )
+
+    @action(methods=["get"], detail=False, url_path="export-zip")
+    def export_zip(self, request):
+        """
+        Stream a ZIP of all files attached to one object.
+
+        Query params: ``content_type`` ("app_label.model") and ``object_id``.
+        Non-admins only get the files they uploaded.
+        """
+        content_type = request.query_params.get("content_type")
+        object_id = request.query_params.get("object_id")
+        if not content_type or not (object_id or "").isdigit():
+            return error_response(
+                message="Validation failed",
+                error={
+                    "code": "INVALID_REQUEST",
+                    "details": "'content_type' and a numeric 'object_id' are required",
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        try:
+            archive_name, chunks = export_object_files_zip(
+                content_type, int(object_id), user=request.user
+            )
+        except (ValueError, ContentType.DoesNotExist):
+            return error_response(
+                message="Validation failed",
+                error={
+                    "code": "INVALID_REQUEST",
+                    "details": f"Unknown content type '{content_type}'",
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        response = StreamingHttpResponse(chunks, content_type="application/zip")
+        response["Content-Disposition"] = f'attachment; filename="{archive_name}"'
+        # Let nginx pass chunks through instead of buffering the archive.
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+    def _multipart_response(self, operation, message, success_status, log_message):
+        try:
+            result = operation()
+            return success_response(data=result, message=message, status=success_status)
+        except ValidationError as e:
+            return error_response(
+                message="Validation failed",
+                error={"code": "MULTIPART_UPLOAD_FAILED", "details": str(e)},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        except Exception as e:
+            logger.exception(f"{log_message}: {e}")
+            return error_response(
+                message=log_message,
+                error={"code": "MULTIPART_UPLOAD_FAILED", "details": str(e)},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            )
+
+    @action(methods=["post"], detail=False, url_path="initiate-multipart-upload")
+    def initiate_multipart_upload_view(self, request):
+        data = request.data
+        return self._multipart_response(
+            lambda: initiate_multipart_upload(
+                file_name=data.get("file_name"),
+                content_type=data.get("content_type", "application/octet-stream"),
+                file_size=data.get("file_size"),
+                folder_prefix=data.get("folder_prefix", "uploads"),
+                user=request.user,
+            ),
+            message="Multipart upload initiated successfully",
+            success_status=status.HTTP_201_CREATED,
+            log_message="Failed to initiate multipart upload",
+        )
+
+    @action(methods=["post"], detail=False, url_path="presign-multipart-parts")
+    def presign_multipart_parts_view(self, request):
+        data = request.data
+        return self._multipart_response(
+            lambda: presign_multipart_parts(
+                document_id=data.get("document_id"),
+                upload_id=data.get("upload_id"),
+                part_numbers=data.get("part_numbers") or [],
+                user=request.user,
+            ),
+            message="Presigned part URLs generated successfully",
+            success_status=status.HTTP_201_CREATED,
+            log_message="Failed to presign multipart upload parts",
+        )
+
+    @action(methods=["post"], detail=False, url_path="complete-multipart-upload")
+    def complete_multipart_upload_view(self, request):
+        data = request.data
+        return self._multipart_response(
+            lambda: complete_multipart_upload(
+                document_id=data.get("document_id"),
+                upload_id=data.get("upload_id"),
+                parts=data.get("parts") or [],
+                user=request.user,
+            ),
+            message="Multipart upload completed successfully",
+            success_status=status.HTTP_200_OK,
+            log_message="Failed to complete multipart upload",
+        )
+
+    @action(methods=["post"], detail=False, url_path="abort-multipart-upload")
+    def abort_multipart_upload_view(self, request):
+        data = request.data
+        return self._multipart_response(
+            lambda: abort_multipart_upload(
+                document_id=data.get("document_id"),
+                upload_id=data.get("upload_id"),
+                user=request.user,
+            ),
+            message="Multipart upload aborted successfully",
+            success_status=status.HTTP_200_OK,
+            log_message="Failed to abort multipart upload",
+        )
@@ -0,0 +1,63 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.mailqueue.services import requeue_failed_emails, send_queued_emails
+
+
+class Command(BaseCommand):
+    help = "Send queued emails in batches over one mail connection per batch."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=100)
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep running as a worker, polling for new emails.",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=5,
+            help="Seconds to wait between polls when the queue is empty (--loop).",
+        )
+        parser.add_argument(
+            "--requeue-failed",
+            action="store_true",
+            help="Retry emails that previously ran out of attempts.",
+        )
+
+    def handle(self, *args, **options):
+        if options["requeue_failed"]:
+            requeued = requeue_failed_emails()
+            self.stdout.write(f"Requeued {requeued} failed emails")
+
+        totals = {"selected": 0, "sent": 0, "retried": 0, "failed": 0, "seconds": 0.0}
+
+        while True:
+            stats = send_queued_emails(batch_size=options["batch_size"])
+            for key in totals:
+                totals[key] += stats[key]
+
+            if stats["selected"]:
+                rate = stats["sent"] / stats["seconds"] if stats["seconds"] else 0
+                self.stdout.write(
+                    f"Sent {stats['sent']}/{stats['selected']} emails "
+                    f"in {stats['seconds']:.2f}s ({rate:.1f} emails/s), "
+                    f"{stats['retried']} to retry, {stats['failed']} failed"
+                )
+
+            # A full batch means more may be due; one that sent nothing
+            # (e.g. the mail server is down) waits for the next poll.
+            if stats["selected"] == options["batch_size"] and stats["sent"]:
+                continue
+            if not options["loop"]:
+                break
+            time.sleep(options["sleep"])
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Done: sent {totals['sent']} emails, {totals['retried']} to retry, "
+                f"{totals['failed']} failed, {totals['seconds']:.2f}s"
+            )
+        )
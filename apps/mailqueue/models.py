@@ -0,0 +1,74 @@
+from django.core.mail import EmailMultiAlternatives
+from django.db import models
+from django.utils import timezone
+
+from apps.common.models import TimestampMixin
+
+
+class EmailStatus:
+    PENDING = "pending"
+    SENT = "sent"
+    FAILED = "failed"
+
+    CHOICES = [
+        (PENDING, "Pending"),
+        (SENT, "Sent"),
+        (FAILED, "Failed"),
+    ]
+
+
+class OutboundEmail(TimestampMixin, models.Model):
+    """
+    An email waiting for, or done with, delivery by the mail worker.
+
+    Rows are written by ``enqueue_email`` and sent by ``send_queued_emails``.
+    Failed sends are retried with backoff until ``MAILQUEUE_MAX_ATTEMPTS``,
+    after which the row is left as FAILED (the dead letters) with its last
+    error.
+    """
+
+    subject = models.TextField()
+    body = models.TextField(blank=True, default="")
+    # [content, mimetype] pairs, e.g. the HTML version of the body.
+    alternatives = models.JSONField(default=list, blank=True)
+    from_email = models.CharField(max_length=255)
+    to = models.JSONField(default=list)
+    cc = models.JSONField(default=list, blank=True)
+    bcc = models.JSONField(default=list, blank=True)
+    reply_to = models.JSONField(default=list, blank=True)
+    headers = models.JSONField(default=dict, blank=True)
+
+    status = models.CharField(
+        max_length=20, choices=EmailStatus.CHOICES, default=EmailStatus.PENDING
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default="")
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = "outbound_emails"
+        indexes = [
+            # Delivery queue for send_queued_emails.
+            models.Index(
+                fields=["next_attempt_at", "id"],
+                name="outbound_emails_queue_idx",
+                condition=models.Q(status=EmailStatus.PENDING),
+            ),
+        ]
+
+    def to_message(self, connection=None):
+        message = EmailMultiAlternatives(
+            subject=self.subject,
+            body=self.body,
+            from_email=self.from_email,
+            to=self.to,
+            cc=self.cc,
+            bcc=self.bcc,
+            reply_to=self.reply_to,
+            headers=self.headers,
+            connection=connection,
+        )
+        for content, mimetype in self.alternatives:
+            message.attach_alternative(content, mimetype)
+        return message
@@ -0,0 +1,186 @@
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import EmailStatus, OutboundEmail
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_email(message):
+    """
+    Queue ``message`` (an EmailMessage) for the mail worker instead of sending it.
+
+    The row is written in the caller's transaction, so mail about changes that
+    roll back is never sent. Attachments are not supported.
+    """
+    if message.attachments:
+        raise ValueError("Queued emails cannot have attachments.")
+    return OutboundEmail.objects.create(
+        subject=message.subject,
+        body=message.body,
+        alternatives=[
+            [content, mimetype]
+            for content, mimetype in getattr(message, "alternatives", [])
+        ],
+        from_email=message.from_email or settings.DEFAULT_FROM_EMAIL,
+        to=list(message.to),
+        cc=list(message.cc),
+        bcc=list(message.bcc),
+        reply_to=list(message.reply_to),
+        headers=dict(message.extra_headers),
+    )
+
+
+def _claim(batch_size):
+    """
+    Take up to ``batch_size`` due emails off the queue and count the attempt.
+
+    Claimed rows are pushed back by ``MAILQUEUE_LEASE_SECONDS`` so other
+    workers skip them; if this worker dies mid-batch they become due again.
+    """
+    now = timezone.now()
+    lease = timedelta(seconds=getattr(settings, "MAILQUEUE_LEASE_SECONDS", 300))
+    with transaction.atomic():
+        rows = list(
+            OutboundEmail.objects.filter(
+                status=EmailStatus.PENDING, next_attempt_at__lte=now
+            )
+            .order_by("next_attempt_at", "id")
+            .select_for_update(skip_locked=True)[:batch_size]
+        )
+        if rows:
+            OutboundEmail.objects.filter(id__in=[row.id for row in rows]).update(
+                attempts=F("attempts") + 1, next_attempt_at=now + lease
+            )
+    for row in rows:
+        row.attempts += 1
+    return rows
+
+
+def _close(connection):
+    try:
+        connection.close()
+    except Exception as e:
+        logger.warning(f"Error closing mail connection: {e}")
+
+
+def _deliver(rows):
+    """
+    Send ``rows`` over one reused mail connection.
+
+    After a failed send the connection is reopened for the next row; if it
+    cannot be opened, the rest of the batch fails with that error.
+
+    Returns:
+        tuple: ``(sent_rows, [(row, error), ...])``
+    """
+    sent, failed = [], []
+    connection = None
+    for index, row in enumerate(rows):
+        if connection is None:
+            connection = get_connection()
+            try:
+                connection.open()
+            except Exception as e:
+                failed.extend((rest, e) for rest in rows[index:])
+                return sent, failed
+
+        try:
+            if not connection.send_messages([row.to_message(connection)]):
+                raise RuntimeError("Message was not accepted for delivery.")
+        except Exception as e:
+            failed.append((row, e))
+            _close(connection)
+            connection = None
+        else:
+            sent.append(row)
+
+    if connection is not None:
+        _close(connection)
+    return sent, failed
+
+
+def _retry_delay(attempts):
+    base = getattr(settings, "MAILQUEUE_RETRY_DELAY", 60)
+    limit = getattr(settings, "MAILQUEUE_MAX_RETRY_DELAY", 3600)
+    return timedelta(seconds=min(base * 2 ** (attempts - 1), limit))
+
+
+def send_queued_emails(batch_size=100):
+    """
+    Send one batch of due emails from the queue.
+
+    Failed emails are retried with exponential backoff; after
+    ``MAILQUEUE_MAX_ATTEMPTS`` attempts they are marked FAILED and left for
+    inspection or ``requeue_failed_emails``.
+
+    Returns:
+        dict: ``{"selected", "sent", "retried", "failed", "seconds"}``
+    """
+    started = time.perf_counter()
+    rows = _claim(batch_size)
+    if not rows:
+        return {"selected": 0, "sent": 0, "retried": 0, "failed": 0, "seconds": 0.0}
+
+    sent, failures = _deliver(rows)
+
+    now = timezone.now()
+    # Bodies may hold reset links that stay valid for days; drop them once sent.
+    OutboundEmail.objects.filter(id__in=[row.id for row in sent]).update(
+        status=EmailStatus.SENT,
+        sent_at=now,
+        last_error="",
+        body="",
+        alternatives=[],
+        updated_at=now,
+    )
+
+    max_attempts = getattr(settings, "MAILQUEUE_MAX_ATTEMPTS", 5)
+    dead = 0
+    for row, error in failures:
+        row.last_error = f"{type(error).__name__}: {error}"
+        row.updated_at = now
+        if row.attempts >= max_attempts:
+            row.status = EmailStatus.FAILED
+            dead += 1
+            logger.error(
+                f"Giving up on email {row.id} after {row.attempts} attempts: "
+                f"{row.last_error}"
+            )
+        else:
+            row.next_attempt_at = now + _retry_delay(row.attempts)
+    OutboundEmail.objects.bulk_update(
+        [row for row, _ in failures],
+        ["status", "next_attempt_at", "last_error", "updated_at"],
+    )
+
+    seconds = time.perf_counter() - started
+    rate = len(sent) / seconds if seconds else 0
+    logger.info(
+        f"Sent {len(sent)}/{len(rows)} emails in {seconds:.2f}s ({rate:.1f} emails/s), "
+        f"{len(failures) - dead} to retry, {dead} failed"
+    )
+    return {
+        "selected": len(rows),
+        "sent": len(sent),
+        "retried": len(failures) - dead,
+        "failed": dead,
+        "seconds": seconds,
+    }
+
+
+def requeue_failed_emails():
+    """Put every FAILED email back on the queue with a fresh set of attempts."""
+    return OutboundEmail.objects.filter(status=EmailStatus.FAILED).update(
+        status=EmailStatus.PENDING,
+        attempts=0,
+        next_attempt_at=timezone.now(),
+        updated_at=timezone.now(),
+    )
@@ -0,0 +1,92 @@
+from smtplib import SMTPServerDisconnected
+
+from django.core import mail
+from django.core.mail import EmailMultiAlternatives
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.mail.backends.locmem import EmailBackend as LocmemEmailBackend
+from django.test import TestCase, override_settings
+
+from apps.mailqueue.models import EmailStatus, OutboundEmail
+from apps.mailqueue.services import (
+    enqueue_email,
+    requeue_failed_emails,
+    send_queued_emails,
+)
+from apps.user.models import CustomUser
+
+
+class CountingEmailBackend(LocmemEmailBackend):
+    opened = 0
+
+    def open(self):
+        CountingEmailBackend.opened += 1
+        return super().open()
+
+
+class DisconnectedEmailBackend(BaseEmailBackend):
+    def send_messages(self, email_messages):
+        raise SMTPServerDisconnected("Connection unexpectedly closed")
+
+
+class MailQueueTest(TestCase):
+    def enqueue(self, count=1):
+        for index in range(count):
+            message = EmailMultiAlternatives(
+                subject=f"Subject {index}", body="Text", to=[f"user{index}@example.com"]
+            )
+            message.attach_alternative("<p>HTML</p>", "text/html")
+            enqueue_email(message)
+
+    def test_forgot_password_only_enqueues(self):
+        CustomUser.objects.create(email="user@example.com")
+
+        response = self.client.post(
+            "/user/forgot-password/", {"email": "user@example.com"}
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(mail.outbox), 0)
+        queued = OutboundEmail.objects.get()
+        self.assertEqual(queued.to, ["user@example.com"])
+        self.assertIn("/reset-password/", queued.alternatives[0][0])
+
+    @override_settings(EMAIL_BACKEND="apps.mailqueue.tests.CountingEmailBackend")
+    def test_batch_is_sent_over_one_connection(self):
+        self.enqueue(3)
+        CountingEmailBackend.opened = 0
+
+        stats = send_queued_emails(batch_size=10)
+
+        self.assertEqual(stats["sent"], 3)
+        self.assertEqual(CountingEmailBackend.opened, 1)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(mail.outbox[0].alternatives, [("<p>HTML</p>", "text/html")])
+        sent = OutboundEmail.objects.filter(status=EmailStatus.SENT)
+        self.assertEqual(sent.count(), 3)
+        self.assertFalse(sent.exclude(body="").exists())
+        self.assertEqual(send_queued_emails()["selected"], 0)
+
+    @override_settings(
+        EMAIL_BACKEND="apps.mailqueue.tests.DisconnectedEmailBackend",
+        MAILQUEUE_MAX_ATTEMPTS=2,
+        MAILQUEUE_RETRY_DELAY=0,
+    )
+    def test_failed_emails_are_retried_then_dead_lettered(self):
+        self.enqueue()
+
+        self.assertEqual(send_queued_emails()["retried"], 1)
+        queued = OutboundEmail.objects.get()
+        self.assertEqual(queued.status, EmailStatus.PENDING)
+        self.assertIn("SMTPServerDisconnected", queued.last_error)
+
+        self.assertEqual(send_queued_emails()["failed"], 1)
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), (EmailStatus.FAILED, 2))
+        self.assertEqual(send_queued_emails()["selected"], 0)
+
+        self.assertEqual(requeue_failed_emails(), 1)
+        with self.settings(
+            EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend"
+        ):
+            self.assertEqual(send_queued_emails()["sent"], 1)
+        self.assertEqual(len(mail.outbox), 1)
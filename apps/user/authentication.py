@@ -0,0 +1,63 @@
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .cache import get_cached_user, user_cache_is_shared
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that resolves the token's user through the user cache.
+
+    The stock class loads the user row on every request. Here the row comes
+    from ``get_cached_user`` (one cache round trip, no query once warm) and
+    the usual active and revoked-token checks run against it. Saves, soft
+    deletes and deactivations invalidate the entry. Set
+    ``AUTH_STRICT_USER_LOOKUP`` to load the user from the database on every
+    request instead; that is also what happens when the cache is not shared
+    between workers (see ``user_cache_is_shared``), since an invalidation
+    would only reach the worker that made the change.
+
+    With ``AUTH_ROLES_FROM_TOKEN`` the user's roles are taken from the
+    token's ``user_roles`` claim, which is signed but only as fresh as the
+    token; otherwise they come from the user cache.
+    """
+
+    def get_user(self, validated_token):
+        if (
+            getattr(settings, "AUTH_STRICT_USER_LOOKUP", False)
+            or not user_cache_is_shared()
+            or api_settings.USER_ID_FIELD != self.user_model._meta.pk.name
+        ):
+            return super().get_user(validated_token)
+
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(
+                _("Token contained no recognizable user identification")
+            ) from e
+
+        user = get_cached_user(user_id)
+        if user is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(
+                api_settings.REVOKE_TOKEN_CLAIM
+            ) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(
+                    _("The user's password has been changed."), code="password_changed"
+                )
+
+        if getattr(settings, "AUTH_ROLES_FROM_TOKEN", False):
+            roles = validated_token.get("user_roles")
+            if isinstance(roles, list):
+                user._roles = tuple(roles)
+        return user
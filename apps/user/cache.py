@@ -0,0 +1,110 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+
+# Bump when the cached field set changes so entries from older code are ignored.
+CACHE_FORMAT = 2
+
+
+def _cache():
+    return caches[getattr(settings, "AUTH_USER_CACHE_ALIAS", "default")]
+
+
+def user_cache_is_shared():
+    """
+    Whether every worker sees the user cache, and so every invalidation.
+
+    ``AUTH_USER_CACHE_SHARED`` says so explicitly; left unset, any backend
+    but the per-process LocMemCache counts as shared.
+    """
+    shared = getattr(settings, "AUTH_USER_CACHE_SHARED", None)
+    if shared is None:
+        return not isinstance(_cache(), LocMemCache)
+    return shared
+
+
+def _keys(user_id):
+    prefix = f"auth-user:{user_id}"
+    return f"{prefix}:version", f"{prefix}:row", f"{prefix}:roles"
+
+
+def _timeout():
+    return getattr(settings, "AUTH_USER_CACHE_TIMEOUT", 60)
+
+
+def _field_names(User):
+    return [field.attname for field in User._meta.concrete_fields]
+
+
+def get_cached_user(user_id):
+    """
+    Live CustomUser with primary key ``user_id``, or None if there is none.
+
+    Rows are cached together with the user's cache version, read in the same
+    round trip. ``invalidate_cached_user`` bumps the version, so a row loaded
+    from the database while the user was being changed is never served
+    after the change commits. Soft-deleted users are not found, as with
+    ``CustomUser.objects``. Cached roles, if any, come back in the same round
+    trip and are set on the user, so role checks need no query either.
+    """
+    cache = _cache()
+    version_key, row_key, roles_key = _keys(user_id)
+    entries = cache.get_many([version_key, row_key, roles_key])
+    version = (CACHE_FORMAT, entries.get(version_key, 0))
+
+    User = get_user_model()
+    names = _field_names(User)
+    cached = entries.get(row_key)
+    if cached is not None and cached[0] == version:
+        values = cached[1]
+    else:
+        values = User.objects.filter(pk=user_id).values_list(*names).first()
+        if values is None:
+            return None
+        cache.set(row_key, (version, values), _timeout())
+
+    user = User.from_db(User.objects.db, names, values)
+    roles = entries.get(roles_key)
+    if roles is not None and roles[0] == version:
+        user._roles = roles[1]
+    return user
+
+
+def get_cached_roles(user_id, load):
+    """
+    Role names for ``user_id``, calling ``load()`` only on a cache miss.
+
+    Shares the user's cache version, so group changes that invalidate the
+    user also invalidate its roles. Unless the cache is shared between
+    workers, ``load()`` is called every time.
+    """
+    if not user_cache_is_shared():
+        return load()
+    cache = _cache()
+    version_key, _, roles_key = _keys(user_id)
+    entries = cache.get_many([version_key, roles_key])
+    version = (CACHE_FORMAT, entries.get(version_key, 0))
+
+    cached = entries.get(roles_key)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    roles = load()
+    cache.set(roles_key, (version, roles), _timeout())
+    return roles
+
+
+def invalidate_cached_user(user_id):
+    """Drop the cached row and roles for ``user_id`` once the transaction commits."""
+
+    def invalidate():
+        cache = _cache()
+        version_key, row_key, roles_key = _keys(user_id)
+        try:
+            cache.incr(version_key)
+        except ValueError:
+            cache.set(version_key, 1, None)
+        cache.delete_many([row_key, roles_key])
+
+    transaction.on_commit(invalidate)
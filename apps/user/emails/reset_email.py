@@ -4,11 +4,12 @@ from django.core.mail import EmailMultiAlternatives
 from django.utils.encoding import force_bytes
 from django.utils.http import urlsafe_base64_encode
 
+from apps.mailqueue.services import enqueue_email
 from apps.user.models import CustomUser
 
 
 def send_password_reset_email(user: CustomUser):
-    """Generate a one-time reset link and email it with contextual message to the user."""
+    """Generate a one-time reset link and queue an email with it for the user."""
     uid = urlsafe_base64_encode(force_bytes(user.pk))
     token = default_token_generator.make_token(user)
     reset_link = f"{settings.FRONTEND_URL}/reset-password/{uid}/{token}/"
@@ -32,4 +33,4 @@ def send_password_reset_email(user: CustomUser):
         to=[user.email],
     )
     email.attach_alternative(html_content, "text/html")
-    email.send()
+    enqueue_email(email)
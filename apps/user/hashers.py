@@ -0,0 +1,239 @@
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth.hashers import Argon2PasswordHasher, PBKDF2PasswordHasher
+from django.core.cache import caches
+
+from .cache import user_cache_is_shared
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the hash timing histogram buckets, in milliseconds.
+TIMING_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500)
+
+_calibrated: dict[tuple, int | None] = {}
+_calibration_lock = threading.Lock()
+_timing = threading.local()
+
+
+def _cache():
+    return caches[getattr(settings, "AUTH_USER_CACHE_ALIAS", "default")]
+
+
+def _round_significant(value, digits=2):
+    """Round ``value`` to ``digits`` significant figures, e.g. 347812 -> 350000."""
+    value = int(value)
+    return int(round(value, digits - len(str(value)))) if value else 0
+
+
+def _fastest(func, repeat=3):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def benchmark_pbkdf2(target_ms, probe_iterations=20000):
+    """
+    PBKDF2 iterations that take about ``target_ms`` on this host.
+
+    Never fewer than Django's default, however slow the host.
+    """
+    hasher = PBKDF2PasswordHasher()
+    salt = hasher.salt()
+    seconds = _fastest(lambda: hasher.encode("password", salt, probe_iterations))
+    iterations = _round_significant(probe_iterations * target_ms / 1000 / seconds)
+    return max(iterations, PBKDF2PasswordHasher.iterations)
+
+
+def benchmark_argon2(target_ms, memory_cost, parallelism):
+    """Argon2 time cost that takes about ``target_ms`` with the given memory cost."""
+
+    class ProbeHasher(Argon2PasswordHasher):
+        time_cost = 1
+
+    ProbeHasher.memory_cost = memory_cost
+    ProbeHasher.parallelism = parallelism
+    hasher = ProbeHasher()
+    salt = hasher.salt()
+    seconds = _fastest(lambda: hasher.encode("password", salt))
+    return max(1, round(target_ms / 1000 / seconds))
+
+
+def _calibrated_value(name, benchmark, *args):
+    """
+    Result of ``benchmark(*args)``, measured once and shared through the cache.
+
+    The first process to calibrate stores its result and every other process
+    uses it, so workers agree on the parameters and do not rehash each
+    other's passwords on login. With a per-process cache they could not
+    agree, so nothing is calibrated and None is returned; pin the values
+    with ``calibrate_password_hashers`` instead.
+    """
+    key = (name, *args)
+    if key in _calibrated:
+        return _calibrated[key]
+    with _calibration_lock:
+        if key not in _calibrated and not user_cache_is_shared():
+            logger.warning(
+                f"Not calibrating {name}: the AUTH_USER_CACHE_ALIAS cache is not "
+                f"shared between workers; using the default instead"
+            )
+            _calibrated[key] = None
+        elif key not in _calibrated:
+            cache_key = "password-hash-calibration:" + ":".join(map(str, key))
+            value = _cache().get(cache_key)
+            if value is None:
+                value = benchmark(*args)
+                _cache().add(cache_key, value, None)
+                value = _cache().get(cache_key, value)
+                logger.info(f"Calibrated {name} to {value} for {args[0]}ms hashes")
+            _calibrated[key] = value
+    return _calibrated[key]
+
+
+def _record_timing(algorithm, operation, seconds):
+    # A per-process histogram would show one worker's share at random and
+    # still cost two cache round trips per hash, so only record when shared.
+    if not user_cache_is_shared():
+        return
+    milliseconds = seconds * 1000
+    bucket = next(
+        (str(bound) for bound in TIMING_BUCKETS_MS if milliseconds <= bound), "+Inf"
+    )
+    prefix = f"password-hash-timings:{algorithm}:{operation}"
+    cache = _cache()
+    for key, delta in (
+        (f"{prefix}:{bucket}", 1),
+        (f"{prefix}:sum_us", int(seconds * 1000000)),
+    ):
+        try:
+            cache.incr(key, delta)
+        except ValueError:
+            cache.add(key, delta, None)
+
+
+def get_hash_timings():
+    """
+    Histograms of password hash timings, per algorithm and operation.
+
+    Buckets are cumulative, keyed by their upper bound in milliseconds, as in
+    Prometheus histograms. Counts are kept in the ``AUTH_USER_CACHE_ALIAS``
+    cache and only recorded when it is shared between workers, so they
+    cover every process; otherwise nothing is recorded and this is empty.
+    """
+    bounds = [str(bound) for bound in TIMING_BUCKETS_MS] + ["+Inf"]
+    series = [
+        (hasher.algorithm, operation)
+        for hasher in (AdaptivePBKDF2PasswordHasher, AdaptiveArgon2PasswordHasher)
+        for operation in ("encode", "verify")
+    ]
+    keys = [
+        f"password-hash-timings:{algorithm}:{operation}:{suffix}"
+        for algorithm, operation in series
+        for suffix in bounds + ["sum_us"]
+    ]
+    values = _cache().get_many(keys)
+
+    timings = {}
+    for algorithm, operation in series:
+        prefix = f"password-hash-timings:{algorithm}:{operation}"
+        count = 0
+        buckets = {}
+        for bound in bounds:
+            count += values.get(f"{prefix}:{bound}", 0)
+            buckets[bound] = count
+        if count:
+            timings.setdefault(algorithm, {})[operation] = {
+                "count": count,
+                "sum_ms": values.get(f"{prefix}:sum_us", 0) / 1000,
+                "buckets": buckets,
+            }
+    return timings
+
+
+class TimedHasherMixin:
+    """
+    Records how long encode() and verify() take in the timing histograms.
+
+    Nothing is recorded unless the user cache is shared; see get_hash_timings().
+    """
+
+    def _timed(self, operation, func, *args, **kwargs):
+        # PBKDF2's verify() calls encode(); only the outer call is recorded.
+        if getattr(_timing, "active", False):
+            return func(*args, **kwargs)
+        _timing.active = True
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _timing.active = False
+            _record_timing(self.algorithm, operation, time.perf_counter() - started)
+
+    def encode(self, password, salt, *args, **kwargs):
+        return self._timed("encode", super().encode, password, salt, *args, **kwargs)
+
+    def verify(self, password, encoded):
+        return self._timed("verify", super().verify, password, encoded)
+
+
+class AdaptivePBKDF2PasswordHasher(TimedHasherMixin, PBKDF2PasswordHasher):
+    """
+    PBKDF2 with an iteration count from settings or calibrated for this host.
+
+    ``AUTH_PBKDF2_ITERATIONS`` pins the count. Otherwise, with
+    ``AUTH_PASSWORD_HASH_TARGET_MS`` set and a shared cache, the count is
+    benchmarked on first use to take about that long. Without either,
+    Django's default applies.
+    Hashes made with another count are upgraded on the user's next login.
+    """
+
+    @property
+    def iterations(self):
+        iterations = getattr(settings, "AUTH_PBKDF2_ITERATIONS", 0)
+        target_ms = getattr(settings, "AUTH_PASSWORD_HASH_TARGET_MS", 0)
+        if not iterations and target_ms:
+            iterations = _calibrated_value(
+                "pbkdf2_iterations", benchmark_pbkdf2, target_ms
+            )
+        return iterations or PBKDF2PasswordHasher.iterations
+
+
+class AdaptiveArgon2PasswordHasher(TimedHasherMixin, Argon2PasswordHasher):
+    """
+    Argon2 with costs from settings, the time cost optionally calibrated.
+
+    Works like AdaptivePBKDF2PasswordHasher, with ``AUTH_ARGON2_TIME_COST``
+    pinning the time cost. Needs the ``argon2-cffi`` package.
+    """
+
+    @property
+    def memory_cost(self):
+        return getattr(
+            settings, "AUTH_ARGON2_MEMORY_COST", Argon2PasswordHasher.memory_cost
+        )
+
+    @property
+    def parallelism(self):
+        return getattr(
+            settings, "AUTH_ARGON2_PARALLELISM", Argon2PasswordHasher.parallelism
+        )
+
+    @property
+    def time_cost(self):
+        time_cost = getattr(settings, "AUTH_ARGON2_TIME_COST", 0)
+        target_ms = getattr(settings, "AUTH_PASSWORD_HASH_TARGET_MS", 0)
+        if not time_cost and target_ms:
+            time_cost = _calibrated_value(
+                "argon2_time_cost",
+                benchmark_argon2,
+                target_ms,
+                self.memory_cost,
+                self.parallelism,
+            )
+        return time_cost or Argon2PasswordHasher.time_cost
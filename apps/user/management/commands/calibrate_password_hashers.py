@@ -0,0 +1,48 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth.hashers import get_hasher
+from django.core.management.base import BaseCommand
+
+from apps.user.hashers import benchmark_argon2, benchmark_pbkdf2
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark this host and print password hashing settings that take "
+        "about --target-ms per hash."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--target-ms",
+            type=int,
+            default=getattr(settings, "AUTH_PASSWORD_HASH_TARGET_MS", 0) or 250,
+            help="Target time for one hash, in milliseconds.",
+        )
+
+    def handle(self, *args, **options):
+        target_ms = options["target_ms"]
+
+        hasher = get_hasher()
+        started = time.perf_counter()
+        hasher.encode("password", hasher.salt())
+        current_ms = (time.perf_counter() - started) * 1000
+        self.stdout.write(
+            f"Current {hasher.algorithm} settings: {current_ms:.0f}ms per hash"
+        )
+
+        self.stdout.write(f"Settings for about {target_ms}ms per hash:")
+        iterations = benchmark_pbkdf2(target_ms)
+        self.stdout.write(f"AUTH_PBKDF2_ITERATIONS={iterations}")
+        try:
+            time_cost = benchmark_argon2(
+                target_ms,
+                getattr(settings, "AUTH_ARGON2_MEMORY_COST", 102400),
+                getattr(settings, "AUTH_ARGON2_PARALLELISM", 8),
+            )
+        except ValueError as e:
+            # Raised by Django when argon2-cffi is not installed.
+            self.stdout.write(f"Skipping Argon2: {e}")
+        else:
+            self.stdout.write(f"AUTH_ARGON2_TIME_COST={time_cost}")
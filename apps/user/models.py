@@ -51,6 +51,9 @@ class CustomUser(AbstractBaseUser, PermissionsMixin, TimestampMixin, SoftDeleteM
 
     objects: ClassVar[CustomUserManager] = CustomUserManager()
 
+    # Memoized group names, see get_roles().
+    _roles = None
+
     def __str__(self):
         return self.email
 
@@ -69,13 +72,35 @@ class CustomUser(AbstractBaseUser, PermissionsMixin, TimestampMixin, SoftDeleteM
             raise ValueError(f"Group with name {role_name} not found")
 
         self.groups.add(group)
+        self._roles = None
 
     def make_admin(self, clear_existing: bool = False):
         self.assign_role(UserRoles.ADMIN, clear_existing)
 
+    def get_roles(self) -> tuple:
+        """
+        Names of this user's groups, in group id order.
+
+        Loaded at most once per instance (so once per request for
+        ``request.user``) and cached across requests in the user cache,
+        which group membership changes invalidate.
+        """
+        if self._roles is None:
+            if self.pk is None:
+                return ()
+            from .cache import get_cached_roles
+
+            self._roles = get_cached_roles(
+                self.pk,
+                lambda: tuple(
+                    self.groups.order_by("pk").values_list("name", flat=True)
+                ),
+            )
+        return self._roles
+
     def has_role(self, role_name: str) -> bool:
         """Check if user is in a given role group."""
-        return self.groups.filter(name=role_name).exists()
+        return role_name in self.get_roles()
 
     def is_admin(self):
         return self.has_role(UserRoles.ADMIN)
@@ -0,0 +1,42 @@
+from django.contrib.auth.models import Group
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .cache import invalidate_cached_user
+from .models import CustomUser
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def invalidate_user_cache(sender, instance, **kwargs):
+    # Soft deletes and deactivations are saves, so they land here too.
+    invalidate_cached_user(instance.pk)
+
+
+@receiver(m2m_changed, sender=CustomUser.groups.through)
+def invalidate_user_roles(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        # user.groups.add/remove/clear(...)
+        if action in ("post_add", "post_remove", "post_clear"):
+            invalidate_cached_user(instance.pk)
+    elif action in ("post_add", "post_remove"):
+        # group.user_set.add/remove(...)
+        for user_id in pk_set:
+            invalidate_cached_user(user_id)
+    elif action == "pre_clear":
+        # group.user_set.clear(); the members are unknown afterwards.
+        _invalidate_group_members(instance)
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def invalidate_group_roles(sender, instance, **kwargs):
+    # Renaming a group changes its members' roles; deleting it drops them.
+    _invalidate_group_members(instance)
+
+
+def _invalidate_group_members(group):
+    if group.pk is None:
+        return
+    for user_id in group.user_set.values_list("pk", flat=True):
+        invalidate_cached_user(user_id)
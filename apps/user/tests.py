@@ -0,0 +1,352 @@
+import time
+from unittest import mock
+
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, get_hasher
+from django.contrib.auth.models import Group
+from django.contrib.auth.tokens import default_token_generator
+from django.core.cache import cache
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.tokens import AccessToken
+
+from apps.common.testing import benchmark
+from apps.user import hashers
+from apps.user.authentication import CachedJWTAuthentication
+from apps.user.models import CustomUser, UserRoles
+from apps.user.permissions.groups import IsAdmin
+from apps.user.serializers import LoginSerializer
+from apps.user.throttling import (
+    DjangoSlidingWindow,
+    InMemorySlidingWindow,
+    SlidingWindowRateThrottle,
+    get_throttle_backend,
+)
+from apps.user.tokens import MyTokenObtainPairSerializer
+
+
+class UserCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create(email="cached@example.com")
+        token = AccessToken.for_user(self.user)
+        self.request = RequestFactory().get("/", HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def authenticate(self, authentication=CachedJWTAuthentication):
+        return authentication().authenticate(self.request)[0]
+
+    def test_per_process_cache_is_bypassed(self):
+        self.authenticate()
+        # Another worker's change never reaches this process's LocMemCache.
+        CustomUser.objects.filter(pk=self.user.pk).update(is_active=False)
+
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    @override_settings(AUTH_USER_CACHE_SHARED=True)
+    def test_shared_cache_serves_users_without_queries(self):
+        self.authenticate()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.authenticate().pk, self.user.pk)
+
+    @override_settings(AUTH_USER_CACHE_SHARED=True, AUTH_STRICT_USER_LOOKUP=True)
+    def test_strict_lookup_always_queries(self):
+        self.authenticate()
+        with self.assertNumQueries(1):
+            self.authenticate()
+
+    @benchmark
+    @override_settings(AUTH_USER_CACHE_SHARED=True)
+    def test_benchmark(self):
+        count = 5000
+        timings = {}
+        for name, authentication in (
+            ("stock JWTAuthentication", JWTAuthentication),
+            ("CachedJWTAuthentication", CachedJWTAuthentication),
+        ):
+            self.authenticate(authentication)
+            started = time.perf_counter()
+            for _ in range(count):
+                self.authenticate(authentication)
+            timings[name] = (time.perf_counter() - started) / count * 1000000
+        print()
+        for name, microseconds in timings.items():
+            print(f"{name}: {microseconds:.1f}us per request")
+        print(
+            "saved per request: "
+            f"{timings['stock JWTAuthentication'] - timings['CachedJWTAuthentication']:.1f}us "
+            "(in-memory database; a networked one adds its round trip)"
+        )
+
+
+@override_settings(AUTH_USER_CACHE_SHARED=True)
+class RoleCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        Group.objects.get_or_create(name=UserRoles.ADMIN)
+        self.user = CustomUser.objects.create(email="admin@example.com")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.make_admin()
+
+    def authenticate(self):
+        token = AccessToken.for_user(self.user)
+        request = RequestFactory().get("/", HTTP_AUTHORIZATION=f"Bearer {token}")
+        request.user, _ = CachedJWTAuthentication().authenticate(request)
+        return request
+
+    def test_is_admin_permission_is_query_free_once_cached(self):
+        self.authenticate().user.is_admin()
+
+        with self.assertNumQueries(0):
+            request = self.authenticate()
+            self.assertTrue(IsAdmin().has_permission(request, None))
+            self.assertTrue(IsAdmin().has_permission(request, None))
+
+    def test_roles_are_loaded_once_per_instance(self):
+        with self.assertNumQueries(1):
+            user = CustomUser.objects.get(pk=self.user.pk)
+            cache.clear()
+        with self.assertNumQueries(1):
+            self.assertTrue(user.is_admin())
+            self.assertTrue(user.has_role(UserRoles.ADMIN))
+            self.assertEqual(user.get_roles(), (UserRoles.ADMIN,))
+
+    def test_get_token_reads_cached_roles(self):
+        self.user.get_roles()
+        user = CustomUser.objects.get(pk=self.user.pk)
+
+        with CaptureQueriesContext(connection) as queries:
+            token = MyTokenObtainPairSerializer.get_token(user)
+        # Only the blacklist app's outstanding-token insert, no group lookup.
+        self.assertFalse(any("auth_group" in q["sql"] for q in queries))
+        self.assertEqual(token["user_role"], UserRoles.ADMIN)
+        self.assertEqual(token["user_roles"], [UserRoles.ADMIN])
+
+    def test_group_changes_invalidate_cached_roles(self):
+        self.assertTrue(self.authenticate().user.is_admin())
+
+        group = Group.objects.get(name=UserRoles.ADMIN)
+        with self.captureOnCommitCallbacks(execute=True):
+            group.user_set.remove(self.user)
+        self.assertFalse(self.authenticate().user.is_admin())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.assign_role(UserRoles.ADMIN)
+        self.assertTrue(self.user.is_admin())
+        self.assertTrue(self.authenticate().user.is_admin())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.groups.clear()
+        self.assertFalse(self.authenticate().user.is_admin())
+
+    @override_settings(AUTH_USER_CACHE_SHARED=False)
+    def test_per_process_cache_is_bypassed(self):
+        CustomUser(pk=self.user.pk).get_roles()
+        with self.assertNumQueries(1):
+            self.assertTrue(CustomUser(pk=self.user.pk).is_admin())
+
+    @override_settings(AUTH_ROLES_FROM_TOKEN=True)
+    def test_roles_from_token_claims(self):
+        token = MyTokenObtainPairSerializer.get_token(self.user).access_token
+        cache.clear()
+        request = RequestFactory().get("/", HTTP_AUTHORIZATION=f"Bearer {token}")
+        request.user, _ = CachedJWTAuthentication().authenticate(request)
+
+        with self.assertNumQueries(0):
+            self.assertTrue(IsAdmin().has_permission(request, None))
+
+
+@override_settings(AUTH_PBKDF2_ITERATIONS=1000, AUTH_PASSWORD_HASH_TARGET_MS=0)
+class PasswordHashingTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser(email="user@example.com", full_name="User")
+        self.user.set_password("old-password")
+        self.user.save()
+
+    def hash_counts(self):
+        timings = hashers.get_hash_timings().get("pbkdf2_sha256", {})
+        return {operation: stats["count"] for operation, stats in timings.items()}
+
+    def test_login_rehashes_when_the_cost_changes(self):
+        with self.settings(AUTH_PBKDF2_ITERATIONS=2000):
+            serializer = LoginSerializer(
+                data={"email": "user@example.com", "password": "old-password"}
+            )
+            self.assertTrue(serializer.is_valid())
+
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith("pbkdf2_sha256$2000$"))
+        self.assertTrue(self.user.check_password("old-password"))
+
+    @override_settings(AUTH_USER_CACHE_SHARED=True)
+    def test_reset_hashes_the_new_password_once(self):
+        uid = urlsafe_base64_encode(force_bytes(self.user.pk))
+        token = default_token_generator.make_token(self.user)
+        cache.clear()
+
+        response = self.client.post(
+            f"/user/reset-password/{uid}/{token}/", {"password": "new-password"}
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("access", response.json()["data"]["tokens"])
+        self.assertEqual(self.hash_counts(), {"encode": 1})
+
+    @override_settings(AUTH_USER_CACHE_SHARED=False)
+    def test_no_timings_without_a_shared_cache(self):
+        self.assertTrue(self.user.check_password("old-password"))
+
+        self.assertEqual(self.hash_counts(), {})
+
+    @override_settings(
+        AUTH_PBKDF2_ITERATIONS=0,
+        AUTH_PASSWORD_HASH_TARGET_MS=5,
+        AUTH_USER_CACHE_SHARED=True,
+    )
+    def test_cost_is_calibrated_once_and_shared(self):
+        hashers._calibrated.clear()
+        self.addCleanup(hashers._calibrated.clear)
+
+        iterations = get_hasher().iterations
+
+        # A 5ms target is below Django's default, which is the floor.
+        self.assertEqual(iterations, PBKDF2PasswordHasher.iterations)
+        hashers._calibrated.clear()
+        cache.set("password-hash-calibration:pbkdf2_iterations:5", 1200000, None)
+        self.assertEqual(get_hasher().iterations, 1200000)
+
+    @override_settings(AUTH_PBKDF2_ITERATIONS=0, AUTH_PASSWORD_HASH_TARGET_MS=5)
+    def test_no_calibration_without_a_shared_cache(self):
+        hashers._calibrated.clear()
+        self.addCleanup(hashers._calibrated.clear)
+
+        with mock.patch.object(hashers, "benchmark_pbkdf2") as benchmark_pbkdf2:
+            self.assertEqual(get_hasher().iterations, PBKDF2PasswordHasher.iterations)
+        benchmark_pbkdf2.assert_not_called()
+
+
+@mock.patch.object(
+    SlidingWindowRateThrottle,
+    "THROTTLE_RATES",
+    {"login_ip": "4/min", "login_email": "2/min", "login_email_global": "5/min"},
+)
+class ThrottlingTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        get_throttle_backend().clear()
+
+    def login(self, email, ip="10.0.0.1"):
+        return self.client.post(
+            "/user/login/",
+            {"email": email, "password": "wrong-password"},
+            REMOTE_ADDR=ip,
+        )
+
+    def test_sliding_window_backends(self):
+        for backend in (InMemorySlidingWindow(), DjangoSlidingWindow()):
+            results = [backend.hit("key", 3, 60) for _ in range(4)]
+            self.assertEqual([allowed for allowed, _ in results], [True] * 3 + [False])
+            self.assertGreater(results[-1][1], 0)
+            self.assertTrue(backend.hit("other-key", 3, 60)[0])
+
+    @override_settings(AUTH_PBKDF2_ITERATIONS=1000, AUTH_USER_CACHE_SHARED=True)
+    def test_login_is_throttled_by_email_and_ip_before_hashing(self):
+        user = CustomUser(email="user@example.com")
+        user.set_password("password")
+        user.save()
+
+        self.assertEqual(self.login("user@example.com").status_code, 400)
+        self.assertEqual(self.login("USER@example.com").status_code, 400)
+        verified = hashers.get_hash_timings()["pbkdf2_sha256"]["verify"]["count"]
+
+        response = self.login("user@example.com")
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.json()["error"]["code"], "THROTTLED")
+        self.assertIn("Retry-After", response)
+        self.assertEqual(
+            hashers.get_hash_timings()["pbkdf2_sha256"]["verify"]["count"], verified
+        )
+
+        # Another address from the same IP is still allowed, up to the IP limit.
+        self.assertEqual(self.login("other@example.com").status_code, 400)
+        self.assertEqual(self.login("third@example.com").status_code, 429)
+        self.assertEqual(
+            self.login("third@example.com", ip="10.0.0.2").status_code, 400
+        )
+
+    @override_settings(AUTH_PBKDF2_ITERATIONS=1000)
+    def test_guessing_from_one_ip_does_not_lock_the_user_out(self):
+        user = CustomUser(email="user@example.com")
+        user.set_password("password")
+        user.save()
+
+        statuses = [
+            self.login("user@example.com", ip="10.0.0.66").status_code
+            for _ in range(10)
+        ]
+        self.assertEqual(statuses, [400] * 2 + [429] * 8)
+
+        response = self.client.post(
+            "/user/login/",
+            {"email": "user@example.com", "password": "password"},
+            REMOTE_ADDR="10.0.0.1",
+        )
+        self.assertEqual(response.status_code, 200)
+
+        # Spread over many IPs, guesses still run into the global email limit.
+        for i in range(2):
+            self.assertEqual(
+                self.login("user@example.com", ip=f"10.0.1.{i}").status_code, 400
+            )
+        self.assertEqual(self.login("user@example.com", ip="10.0.1.9").status_code, 429)
+
+    @override_settings(AUTH_PBKDF2_ITERATIONS=1000)
+    def test_forwarded_for_does_not_bypass_the_ip_limit(self):
+        for i in range(4):
+            self.client.post(
+                "/user/login/",
+                {"email": f"user{i}@example.com", "password": "wrong-password"},
+                REMOTE_ADDR="10.0.0.1",
+                HTTP_X_FORWARDED_FOR=f"192.0.2.{i}",
+            )
+
+        response = self.client.post(
+            "/user/login/",
+            {"email": "user9@example.com", "password": "wrong-password"},
+            REMOTE_ADDR="10.0.0.1",
+            HTTP_X_FORWARDED_FOR="192.0.2.9",
+        )
+        self.assertEqual(response.status_code, 429)
+
+    @benchmark
+    @override_settings(AUTH_PBKDF2_ITERATIONS=PBKDF2PasswordHasher.iterations)
+    def test_benchmark(self):
+        user = CustomUser(email="user@example.com")
+        user.set_password("password")
+        user.save()
+        count = 1000
+        print()
+        for name, backend in (
+            ("memory", InMemorySlidingWindow()),
+            ("django", DjangoSlidingWindow()),
+        ):
+            with mock.patch("apps.user.throttling._throttle_backend", backend):
+                cache.clear()
+                # The first two reach the password check; the rest are throttled.
+                started = time.perf_counter()
+                for _ in range(2):
+                    self.login("user@example.com")
+                hashed = (time.perf_counter() - started) / 2
+                started = time.perf_counter()
+                for _ in range(count):
+                    self.login("user@example.com")
+                throttled = (time.perf_counter() - started) / count
+            print(
+                f"{name} backend: {1 / hashed:.0f} req/s checking passwords, "
+                f"{1 / throttled:.0f} req/s throttled"
+            )
@@ -0,0 +1,217 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.throttling import SimpleRateThrottle
+
+
+def _sliding_window(previous, current, fraction, limit):
+    """
+    Check a hit against ``limit`` requests per window.
+
+    The rate is estimated from the counts of the current and previous fixed
+    windows, weighting the previous one by how much of it still overlaps
+    the sliding window. ``fraction`` is how far into the current window we
+    are. Returns ``(allowed, wait)`` with ``wait`` in windows.
+    """
+    if previous * (1 - fraction) + current < limit:
+        return True, 0
+    if current < limit:
+        # Only the previous window's weight decays before the next window.
+        return False, 1 - (limit - current) / previous - fraction
+    return False, 1 - fraction + (1 - limit / current if current else 0)
+
+
+class InMemorySlidingWindow:
+    """Per-process sliding-window counters; the least recently hit are dropped first."""
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, key, limit, duration):
+        now = time.time() / duration
+        window = int(now)
+        with self._lock:
+            start, current, previous = self._entries.get(key, (window, 0, 0))
+            if start != window:
+                previous = current if start == window - 1 else 0
+                current = 0
+            allowed, wait = _sliding_window(previous, current, now - window, limit)
+            if allowed:
+                current += 1
+            self._entries[key] = (window, current, previous)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return allowed, wait * duration
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class DjangoSlidingWindow:
+    """
+    Shares sliding-window counters across workers through a Django cache alias.
+
+    A rejected hit costs one cache round trip; an allowed one adds an atomic
+    increment, whose result is checked again so concurrent hits cannot push
+    the count past the limit.
+    """
+
+    def __init__(self, alias="default", key_prefix="throttle"):
+        self.alias = alias
+        self.key_prefix = key_prefix
+
+    def hit(self, key, limit, duration):
+        cache = caches[self.alias]
+        now = time.time() / duration
+        window = int(now)
+        current_key = f"{self.key_prefix}:{key}:{window}"
+        previous_key = f"{self.key_prefix}:{key}:{window - 1}"
+
+        counts = cache.get_many([current_key, previous_key])
+        previous = counts.get(previous_key, 0)
+        allowed, wait = _sliding_window(
+            previous, counts.get(current_key, 0), now - window, limit
+        )
+        if allowed:
+            try:
+                current = cache.incr(current_key)
+            except ValueError:
+                # First hit in this window, unless another worker just added it.
+                if cache.add(current_key, 1, duration * 2):
+                    current = 1
+                else:
+                    current = cache.incr(current_key)
+            allowed, wait = _sliding_window(previous, current - 1, now - window, limit)
+        return allowed, wait * duration
+
+    def clear(self):
+        # Counters age out on their own; never clear a shared cache alias.
+        pass
+
+
+_throttle_backend = None
+_throttle_backend_lock = threading.Lock()
+
+
+def get_throttle_backend():
+    global _throttle_backend
+    if _throttle_backend is None:
+        with _throttle_backend_lock:
+            if _throttle_backend is None:
+                config = getattr(settings, "AUTH_THROTTLE", {})
+                if config.get("BACKEND", "memory") == "django":
+                    _throttle_backend = DjangoSlidingWindow(
+                        alias=config.get("ALIAS", "default")
+                    )
+                else:
+                    _throttle_backend = InMemorySlidingWindow(
+                        max_entries=config.get("MAX_ENTRIES", 10000)
+                    )
+    return _throttle_backend
+
+
+class SlidingWindowRateThrottle(SimpleRateThrottle):
+    """
+    Rate limit on a sliding window, scoped by the view.
+
+    The rate is looked up under the view's ``throttle_scope`` plus
+    ``scope_suffix``, e.g. "login_ip", in ``DEFAULT_THROTTLE_RATES``.
+    Counters live in the backend chosen by ``AUTH_THROTTLE``; checking one
+    is O(1) and needs no database access. Once a throttle rejects a request,
+    the view's later throttles do not count it, so a client held back by one
+    limit cannot use up another, shared one.
+    """
+
+    scope_suffix: str | None = None
+
+    def __init__(self):
+        # The rate depends on the view, so it is looked up in allow_request().
+        pass
+
+    def allow_request(self, request, view):
+        scope = getattr(view, "throttle_scope", None)
+        if not scope:
+            return True
+        self.scope = f"{scope}_{self.scope_suffix}"
+        self.rate = self.get_rate()
+        if self.rate is None:
+            return True
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None or getattr(request, "_throttled", False):
+            return True
+        allowed, self._wait = get_throttle_backend().hit(
+            self.key, self.num_requests, self.duration
+        )
+        if not allowed:
+            request._throttled = True
+        return allowed
+
+    def wait(self):
+        return self._wait
+
+
+class IPRateThrottle(SlidingWindowRateThrottle):
+    """
+    Throttles by client IP: ``REMOTE_ADDR``, or the X-Forwarded-For entry
+    ``NUM_PROXIES`` hops back when the app runs behind proxies.
+    """
+
+    scope_suffix = "ip"
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {
+            "scope": self.scope,
+            "ident": self.get_ident(request),
+        }
+
+
+def _email_digest(request):
+    data = request.data
+    email = data.get("email") if hasattr(data, "get") else None
+    if not isinstance(email, str) or not email.strip():
+        return None
+    # Hashed to keep addresses out of cache keys.
+    return hashlib.sha256(email.strip().lower().encode()).hexdigest()
+
+
+class EmailRateThrottle(SlidingWindowRateThrottle):
+    """
+    Throttles by the ``email`` in the request body, per client IP.
+
+    Keying on the IP too means guessing at someone's password from one
+    address does not lock them out from theirs; EmailGlobalRateThrottle
+    caps the total across addresses.
+    """
+
+    scope_suffix = "email"
+
+    def get_cache_key(self, request, view):
+        digest = _email_digest(request)
+        if digest is None:
+            return None
+        return self.cache_format % {
+            "scope": self.scope,
+            "ident": f"{digest}:{self.get_ident(request)}",
+        }
+
+
+class EmailGlobalRateThrottle(SlidingWindowRateThrottle):
+    """Throttles by the ``email`` in the request body, whatever the client's IP."""
+
+    scope_suffix = "email_global"
+
+    def get_cache_key(self, request, view):
+        digest = _email_digest(request)
+        if digest is None:
+            return None
+        return self.cache_format % {"scope": self.scope, "ident": digest}
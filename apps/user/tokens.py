@@ -10,6 +10,8 @@ class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
         token["full_name"] = user.full_name
 
         # Add user role
-        token["user_role"] = user.groups.first().name if user.groups.exists() else None
+        roles = user.get_roles()
+        token["user_role"] = roles[0] if roles else None
+        token["user_roles"] = list(roles)
 
         return token
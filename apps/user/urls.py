@@ -5,6 +5,7 @@ from .views import (
     ForgotPasswordView,
     LoginView,
     LogoutView,
+    PasswordHashTimingsView,
     RegistrationView,
     ResetPasswordView,
     UserViewSet,
@@ -23,5 +24,10 @@ urlpatterns = [
         name="reset-password",
     ),
     path("logout/", LogoutView.as_view(), name="logout"),
+    path(
+        "password-hash-timings/",
+        PasswordHashTimingsView.as_view(),
+        name="password-hash-timings",
+    ),
     path("", include(router.urls)),
 ]
@@ -11,10 +11,13 @@ from rest_framework_simplejwt.tokens import RefreshToken
 
 from apps.common.responses import error_response, success_response
 from apps.user.emails.reset_email import send_password_reset_email
+from apps.user.hashers import get_hash_timings
 from apps.user.permissions.groups import IsAdmin
 
 from .models import CustomUser
 from .serializers import CustomUserSerializer, LoginSerializer, RegistrationSerializer
+from .throttling import EmailGlobalRateThrottle, EmailRateThrottle, IPRateThrottle
+from .tokens import MyTokenObtainPairSerializer
 
 logger = logging.getLogger(__name__)
 
@@ -31,6 +34,8 @@ class UserViewSet(viewsets.ModelViewSet):
 
 class RegistrationView(APIView):
     permission_classes = [AllowAny]
+    throttle_classes = [IPRateThrottle, EmailRateThrottle, EmailGlobalRateThrottle]
+    throttle_scope = "register"
 
     def post(self, request):
         serializer = RegistrationSerializer(data=request.data)
@@ -45,6 +50,8 @@ class RegistrationView(APIView):
 
 class LoginView(APIView):
     permission_classes = [AllowAny]
+    throttle_classes = [IPRateThrottle, EmailRateThrottle, EmailGlobalRateThrottle]
+    throttle_scope = "login"
 
     def post(self, request, *args, **kwargs):
         serializer = LoginSerializer(data=request.data)
@@ -70,6 +77,8 @@ class LoginView(APIView):
 
 class ForgotPasswordView(APIView):
     permission_classes = [AllowAny]
+    throttle_classes = [IPRateThrottle, EmailRateThrottle, EmailGlobalRateThrottle]
+    throttle_scope = "forgot_password"
 
     def post(self, request):
         email = request.data.get("email")
@@ -118,26 +127,25 @@ class ResetPasswordView(APIView):
                 message="Password is required", status=status.HTTP_400_BAD_REQUEST
             )
 
+        if not user.is_active:
+            return error_response(
+                message="User account is disabled.", status=status.HTTP_400_BAD_REQUEST
+            )
+
         try:
             user.set_password(password)
             user.save()
 
-            serializer = LoginSerializer(
-                data={
-                    "email": user.email,
-                    "password": password,
-                }
-            )
-            serializer.is_valid(raise_exception=True)
-
+            # The password was just set, so issue tokens without hashing it again.
+            refresh = MyTokenObtainPairSerializer.get_token(user)
             response_data = {
                 "tokens": {
-                    "access": serializer.validated_data["access"],
-                    "refresh": serializer.validated_data["refresh"],
+                    "access": str(refresh.access_token),
+                    "refresh": str(refresh),
                 },
                 "user": {
-                    "email": serializer.validated_data["email"],
-                    "full_name": serializer.validated_data["full_name"],
+                    "email": user.email,
+                    "full_name": user.full_name,
                 },
             }
 
@@ -155,6 +163,17 @@ class ResetPasswordView(APIView):
             )
 
 
+class PasswordHashTimingsView(APIView):
+    """Histograms of password hash timings, for tuning the hashing cost."""
+
+    permission_classes = [IsAdmin]
+
+    def get(self, request):
+        return success_response(
+            data=get_hash_timings(), message="Password hash timings"
+        )
+
+
 class LogoutView(APIView):
     """
     Accepts a POST with {"refresh": "<refresh_token>"}.
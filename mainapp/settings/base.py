@@ -26,6 +26,7 @@ INSTALLED_APPS = [
     "django.contrib.messages",
     "apps.user",
     "apps.filestorage",
+    "apps.mailqueue",
 ]
 
 MIDDLEWARE = [
@@ -63,6 +64,32 @@ AUTH_PASSWORD_VALIDATORS = [
     {"NAME": "django.contrib.auth.password_validation.NumericPasswordValidator"},
 ]
 
+# Password hashing. New hashes use AUTH_PASSWORD_HASHER ("pbkdf2", or "argon2"
+# with argon2-cffi installed); the other formats are still accepted and are
+# upgraded on login. Pin AUTH_PBKDF2_ITERATIONS / AUTH_ARGON2_TIME_COST with
+# the values from `manage.py calibrate_password_hashers`; 0 means Django's
+# default. With AUTH_PASSWORD_HASH_TARGET_MS set instead, the cost is
+# benchmarked on first use to take about that long and shared through the
+# AUTH_USER_CACHE_ALIAS cache, which must then be shared (see
+# AUTH_USER_CACHE_SHARED). Calibrated PBKDF2 counts never go below Django's.
+AUTH_PASSWORD_HASHER = os.getenv("AUTH_PASSWORD_HASHER", "pbkdf2")
+AUTH_PASSWORD_HASH_TARGET_MS = int(os.getenv("AUTH_PASSWORD_HASH_TARGET_MS", "0"))
+AUTH_PBKDF2_ITERATIONS = int(os.getenv("AUTH_PBKDF2_ITERATIONS", "0"))
+AUTH_ARGON2_TIME_COST = int(os.getenv("AUTH_ARGON2_TIME_COST", "0"))
+AUTH_ARGON2_MEMORY_COST = int(os.getenv("AUTH_ARGON2_MEMORY_COST", "102400"))
+AUTH_ARGON2_PARALLELISM = int(os.getenv("AUTH_ARGON2_PARALLELISM", "8"))
+# The adaptive hashers read the same hashes as Django's PBKDF2 and Argon2 ones,
+# which they replace.
+PASSWORD_HASHERS = [
+    "apps.user.hashers.AdaptivePBKDF2PasswordHasher",
+    "apps.user.hashers.AdaptiveArgon2PasswordHasher",
+    "django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher",
+    "django.contrib.auth.hashers.BCryptSHA256PasswordHasher",
+    "django.contrib.auth.hashers.ScryptPasswordHasher",
+]
+if AUTH_PASSWORD_HASHER == "argon2":
+    PASSWORD_HASHERS.insert(0, PASSWORD_HASHERS.pop(1))
+
 LANGUAGE_CODE = "en-us"
 TIME_ZONE = "Asia/Kolkata"
 USE_I18N = True
@@ -96,13 +123,43 @@ TEMPLATES = [
 # Django REST Framework and Simple JWT configuration
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "apps.user.authentication.CachedJWTAuthentication",
     ),
     "DEFAULT_PERMISSION_CLASSES": ("rest_framework.permissions.IsAuthenticated",),
     "DEFAULT_FILTER_BACKENDS": ["django_filters.rest_framework.DjangoFilterBackend"],
     "EXCEPTION_HANDLER": "apps.common.exceptions.custom_exception_handler",
     "DEFAULT_PAGINATION_CLASS": "apps.common.pagination.CustomPagination",
     "PAGE_SIZE": 10,
+    # Sliding-window limits for the unauthenticated auth endpoints: per client
+    # IP, per email address in the request body from each IP ("_email"), and
+    # per email address from all IPs together ("_email_global"). The global
+    # limit lets anyone block an address, e.g. lock a user out of login, by
+    # spending it from many IPs, so keep it well above what the user needs.
+    "DEFAULT_THROTTLE_RATES": {
+        "login_ip": os.getenv("THROTTLE_LOGIN_IP", "20/min"),
+        "login_email": os.getenv("THROTTLE_LOGIN_EMAIL", "5/min"),
+        "login_email_global": os.getenv("THROTTLE_LOGIN_EMAIL_GLOBAL", "100/min"),
+        "forgot_password_ip": os.getenv("THROTTLE_FORGOT_PASSWORD_IP", "5/min"),
+        "forgot_password_email": os.getenv("THROTTLE_FORGOT_PASSWORD_EMAIL", "3/hour"),
+        "forgot_password_email_global": os.getenv(
+            "THROTTLE_FORGOT_PASSWORD_EMAIL_GLOBAL", "10/hour"
+        ),
+        "register_ip": os.getenv("THROTTLE_REGISTER_IP", "10/hour"),
+        "register_email": os.getenv("THROTTLE_REGISTER_EMAIL", "3/hour"),
+        "register_email_global": os.getenv("THROTTLE_REGISTER_EMAIL_GLOBAL", "10/hour"),
+    },
+    # Reverse proxies in front of the app. The client IP is taken that many
+    # hops back in X-Forwarded-For; with 0 it is REMOTE_ADDR, as clients can
+    # set X-Forwarded-For themselves.
+    "NUM_PROXIES": int(os.getenv("NUM_PROXIES", "0")),
+}
+
+# Throttle counters: "memory" keeps them per process (each worker enforces the
+# limits separately), "django" shares them through the ALIAS cache.
+AUTH_THROTTLE = {
+    "BACKEND": os.getenv("AUTH_THROTTLE_BACKEND", "memory"),
+    "ALIAS": os.getenv("AUTH_THROTTLE_CACHE_ALIAS", "default"),
+    "MAX_ENTRIES": int(os.getenv("AUTH_THROTTLE_MAX_ENTRIES", "10000")),
 }
 
 SIMPLE_JWT = {
@@ -116,6 +173,33 @@ SIMPLE_JWT = {
     "AUTH_TOKEN_CLASSES": ("rest_framework_simplejwt.tokens.AccessToken",),
 }
 
+# CachedJWTAuthentication keeps user rows in this cache alias for
+# AUTH_USER_CACHE_TIMEOUT seconds. Changes invalidate the entry in that alias,
+# so use a shared backend (Redis, memcached) when running several workers.
+# AUTH_USER_CACHE_SHARED says whether the alias is shared; unset, only
+# LocMemCache counts as per-process, and then the user cache is bypassed.
+# AUTH_STRICT_USER_LOOKUP loads the user from the database on every request.
+# AUTH_ROLES_FROM_TOKEN trusts the signed "user_roles" claim for role checks;
+# role changes then apply once the user's access token is renewed.
+AUTH_USER_CACHE_ALIAS = os.getenv("AUTH_USER_CACHE_ALIAS", "default")
+AUTH_USER_CACHE_TIMEOUT = int(os.getenv("AUTH_USER_CACHE_TIMEOUT", "60"))
+_user_cache_shared = os.getenv("AUTH_USER_CACHE_SHARED", "").lower()
+AUTH_USER_CACHE_SHARED = _user_cache_shared == "true" if _user_cache_shared else None
+AUTH_STRICT_USER_LOOKUP = (
+    os.getenv("AUTH_STRICT_USER_LOOKUP", "false").lower() == "true"
+)
+AUTH_ROLES_FROM_TOKEN = os.getenv("AUTH_ROLES_FROM_TOKEN", "false").lower() == "true"
+
+
+# Outbound mail queue, sent by `manage.py send_queued_emails`. Failed sends are
+# retried after MAILQUEUE_RETRY_DELAY seconds, doubling up to
+# MAILQUEUE_MAX_RETRY_DELAY, and marked failed after MAILQUEUE_MAX_ATTEMPTS.
+# A worker that dies mid-batch releases its emails after MAILQUEUE_LEASE_SECONDS.
+MAILQUEUE_MAX_ATTEMPTS = int(os.getenv("MAILQUEUE_MAX_ATTEMPTS", "5"))
+MAILQUEUE_RETRY_DELAY = int(os.getenv("MAILQUEUE_RETRY_DELAY", "60"))
+MAILQUEUE_MAX_RETRY_DELAY = int(os.getenv("MAILQUEUE_MAX_RETRY_DELAY", "3600"))
+MAILQUEUE_LEASE_SECONDS = int(os.getenv("MAILQUEUE_LEASE_SECONDS", "300"))
+
 
 # Storage
 STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local")
@@ -127,9 +211,84 @@ AWS_STORAGE_BUCKET_NAME = os.getenv("AWS_STORAGE_BUCKET_NAME")
 AWS_S3_REGION_NAME = os.getenv("AWS_S3_REGION_NAME")
 AWS_S3_CUSTOM_DOMAIN = os.getenv("AWS_S3_CUSTOM_DOMAIN")
 
+# S3 client connection pool (one client is shared per worker process)
+AWS_S3_MAX_POOL_CONNECTIONS = int(os.getenv("AWS_S3_MAX_POOL_CONNECTIONS", "50"))
+AWS_S3_TCP_KEEPALIVE = os.getenv("AWS_S3_TCP_KEEPALIVE", "true").lower() == "true"
+AWS_S3_RETRY_MODE = os.getenv("AWS_S3_RETRY_MODE", "standard")
+AWS_S3_MAX_ATTEMPTS = int(os.getenv("AWS_S3_MAX_ATTEMPTS", "3"))
+
+# Server-side multipart uploads. MAX_CONCURRENCY bounds the upload threads
+# per worker process, shared by all uploads in that process.
+AWS_S3_MULTIPART_THRESHOLD = int(
+    os.getenv("AWS_S3_MULTIPART_THRESHOLD", str(8 * 1024 * 1024))
+)
+AWS_S3_MULTIPART_PART_SIZE = int(
+    os.getenv("AWS_S3_MULTIPART_PART_SIZE", str(8 * 1024 * 1024))
+)
+AWS_S3_MAX_CONCURRENCY = int(os.getenv("AWS_S3_MAX_CONCURRENCY", "4"))
+
+# Batch presigning
+FILESTORAGE_MAX_BATCH_SIZE = int(os.getenv("FILESTORAGE_MAX_BATCH_SIZE", "1000"))
+FILESTORAGE_PRESIGN_CHUNK_SIZE = int(os.getenv("FILESTORAGE_PRESIGN_CHUNK_SIZE", "100"))
+FILESTORAGE_PRESIGN_WORKERS = int(os.getenv("FILESTORAGE_PRESIGN_WORKERS", "4"))
+
+# Upload size caps in bytes, per folder_prefix; "default" applies otherwise.
+FILESTORAGE_MAX_UPLOAD_SIZES = {
+    "default": int(os.getenv("FILESTORAGE_MAX_UPLOAD_SIZE", str(10 * 1024 * 1024))),
+}
+
+# Content-addressed uploads: when on, clients may send a sha256 with presign
+# and metadata requests and identical content is stored once.
+FILESTORAGE_CONTENT_ADDRESSED = (
+    os.getenv("FILESTORAGE_CONTENT_ADDRESSED", "false").lower() == "true"
+)
+FILESTORAGE_CONTENT_PREFIX = os.getenv("FILESTORAGE_CONTENT_PREFIX", "content")
+
+# Layout of new storage keys: "flat", "hash" (ab/cd/ fan-out), "date"
+# (YYYY/MM/DD/), "random_prefix" or a dotted path to a strategy function.
+# Move existing flat files with the relocate_storage_keys command.
+FILESTORAGE_KEY_STRATEGY = os.getenv("FILESTORAGE_KEY_STRATEGY", "flat")
+
+# Upload verification: save_file_metadata checks the object exists (HeadObject
+# or os.stat) and stores its size, ETag and content type. Missing keys are
+# not checked again for FILESTORAGE_VERIFY_MISSING_TTL seconds.
+FILESTORAGE_VERIFY_UPLOADS = (
+    os.getenv("FILESTORAGE_VERIFY_UPLOADS", "true").lower() == "true"
+)
+FILESTORAGE_VERIFY_WORKERS = int(os.getenv("FILESTORAGE_VERIFY_WORKERS", "8"))
+FILESTORAGE_VERIFY_MISSING_TTL = int(os.getenv("FILESTORAGE_VERIFY_MISSING_TTL", "10"))
+
+# Per-user storage quota in bytes (0 = unlimited), checked at presign time
+# against the usage ledger; rebuild it with "manage.py rebuild_storage_usage".
+FILESTORAGE_USER_QUOTA = int(os.getenv("FILESTORAGE_USER_QUOTA", "0"))
+
+# Presigned GET URL cache. Use BACKEND "django" to share it across workers
+# through the cache alias in ALIAS.
+FILESTORAGE_PRESIGN_CACHE = {
+    "BACKEND": os.getenv("FILESTORAGE_PRESIGN_CACHE_BACKEND", "memory"),
+    "ALIAS": os.getenv("FILESTORAGE_PRESIGN_CACHE_ALIAS", "default"),
+    "MAX_ENTRIES": int(os.getenv("FILESTORAGE_PRESIGN_CACHE_MAX_ENTRIES", "1024")),
+    "MIN_REMAINING": int(os.getenv("FILESTORAGE_PRESIGN_CACHE_MIN_REMAINING", "300")),
+}
+
 # Local media and upload config
 MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
+FILESTORAGE_LOCAL_BUFFER_SIZE = int(
+    os.getenv("FILESTORAGE_LOCAL_BUFFER_SIZE", str(1024 * 1024))
+)
+# Local downloads: "nginx" (X-Accel-Redirect), "apache" (X-Sendfile) or empty
+# to serve from the worker with FileResponse. The URL prefix must map to
+# MEDIA_ROOT/uploads/ in an internal proxy location.
+FILESTORAGE_SENDFILE_BACKEND = os.getenv("FILESTORAGE_SENDFILE_BACKEND", "")
+FILESTORAGE_SENDFILE_URL_PREFIX = os.getenv(
+    "FILESTORAGE_SENDFILE_URL_PREFIX", "/protected/uploads/"
+)
+# ZIP export: read size per chunk and read-ahead threads per process
+FILESTORAGE_ZIP_CHUNK_SIZE = int(
+    os.getenv("FILESTORAGE_ZIP_CHUNK_SIZE", str(1024 * 1024))
+)
+FILESTORAGE_ZIP_WORKERS = int(os.getenv("FILESTORAGE_ZIP_WORKERS", "4"))
 
 
 # Frontend
@@ -1,8 +0,0 @@
-from django.test import TestCase
-
-# Create your tests here.
-
-
-class AppTest(TestCase):
-    def test_app(self):
-        self.assertEqual(True, True)
@@ -23,5 +23,6 @@ from apps.common.views import StatusView
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("user/", include("apps.user.urls")),
+    path("files/", include("apps.filestorage.urls")),
     path("status/", StatusView.as_view(), name="status"),
 ]